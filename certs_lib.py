@@ -0,0 +1,195 @@
+"""Certificate cache for Targets whose certificate is obtained from the Target.
+
+When get_cert is set, the Target certificate is fetched with an extra TLS
+handshake before the gRPC channel is built. CertCache keeps fetched
+certificates in memory and on disk, keyed by target:port, so that CLI runs and
+fleet start-ups skip that round trip. Entries expire after a TTL, can be pinned
+to a known sha256 fingerprint, and are refreshed when the gRPC handshake with
+the cached certificate fails.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import hashlib
+import json
+import logging
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'wlpc-ocapi', 'certs')
+DEFAULT_TTL = 24 * 60 * 60  # Seconds.
+DEFAULT_FETCH_TIMEOUT = 10  # Seconds.
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class CertPinError(Error):
+  """The certificate of a Target does not match its pinned fingerprint."""
+
+
+def FetchCertificate(target, port, timeout=DEFAULT_FETCH_TIMEOUT):
+  """Returns the certificate a Target presents in a TLS handshake.
+
+  The certificate is not verified; see CertCache for pinning it.
+
+  Args:
+    target: (str) gNMI Target.
+    port: (str) gNMI Target IP port.
+    timeout: (float) Seconds to connect, and for each read of the handshake.
+
+  Returns:
+    (str) PEM encoded certificate.
+
+  Raises:
+    Error: The Target could not be reached, or the handshake failed.
+  """
+  context = ssl.create_default_context()
+  context.check_hostname = False
+  context.verify_mode = ssl.CERT_NONE
+  try:
+    sock = socket.create_connection((target, int(port)), timeout=timeout)
+    try:
+      tls = context.wrap_socket(sock, server_hostname=target)
+      try:
+        der = tls.getpeercert(binary_form=True)
+      finally:
+        tls.close()
+    finally:
+      sock.close()
+  except (socket.error, ssl.SSLError) as e:  # Also socket.timeout.
+    raise Error('Unable to obtain certificate of %s:%s: %s' % (target, port,
+                                                               e))
+  return ssl.DER_cert_to_PEM_cert(der)
+
+
+def Fingerprint(pem):
+  """Returns the sha256 hex digest of a PEM certificate, over its DER form.
+
+  Args:
+    pem: (str) PEM encoded certificate.
+  """
+  if isinstance(pem, bytes):
+    pem = pem.decode('utf-8')
+  return hashlib.sha256(ssl.PEM_cert_to_DER_cert(pem)).hexdigest()
+
+
+class CertCache(object):
+  """In-memory and on-disk cache of certificates obtained from Targets."""
+
+  def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, pins=None,
+               fetch_timeout=DEFAULT_FETCH_TIMEOUT):
+    """Initializes the cache.
+
+    Args:
+      cache_dir: (str) Directory entries are persisted in; None for memory only.
+      ttl: (int) Seconds a fetched certificate is trusted for.
+      pins: (dict) 'target:port' to the expected sha256 fingerprint (hex).
+      fetch_timeout: (float) Seconds allowed to fetch a certificate; see
+        FetchCertificate.
+    """
+    self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+    self.ttl = ttl
+    self.fetch_timeout = fetch_timeout
+    self.pins = dict(pins or {})
+    self._lock = threading.Lock()  # Guards _entries and _fetch_locks.
+    self._entries = {}  # 'target:port': {'pem', 'fingerprint', 'fetched'}
+    self._fetch_locks = {}  # 'target:port': Lock held while fetching.
+
+  def Get(self, target, port, refresh=False):
+    """Returns the certificate of a Target, fetching it only when needed.
+
+    Args:
+      target: (str) gNMI Target.
+      port: (str) gNMI Target IP port.
+      refresh: (bool) Ignore any cached entry and fetch from the Target.
+
+    Returns:
+      (bytes) PEM encoded certificate.
+
+    Raises:
+      CertPinError: The certificate does not match the pinned fingerprint.
+      Error: The certificate could not be obtained from the Target.
+    """
+    key = '%s:%s' % (target, port)
+    started = time.time()
+    with self._lock:
+      entry = None if refresh else self._Lookup(key)
+      if entry is not None:
+        return entry['pem'].encode('utf-8')
+      fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+    # Only one fetch per Target at a time, and none holds up other Targets.
+    with fetch_lock:
+      with self._lock:
+        entry = self._entries.get(key)
+      if entry is None or entry['fetched'] < started:
+        logging.info('Obtaining certificate from Target %s', key)
+        pem = FetchCertificate(target, port, self.fetch_timeout)
+        entry = {'pem': pem, 'fingerprint': Fingerprint(pem),
+                 'fetched': time.time()}
+        self._Check(key, entry)
+        with self._lock:
+          self._Store(key, entry)
+      return entry['pem'].encode('utf-8')
+
+  def Invalidate(self, target, port):
+    """Drops the entry of a Target, eg. after a failed TLS handshake."""
+    key = '%s:%s' % (target, port)
+    with self._lock:
+      self._entries.pop(key, None)
+      if self.cache_dir:
+        try:
+          os.remove(self._Filename(key))
+        except OSError:
+          pass
+
+  def _Lookup(self, key):
+    """Returns a fresh entry from memory, then disk, or None."""
+    entry = self._entries.get(key)
+    if entry is None and self.cache_dir:
+      try:
+        with open(self._Filename(key)) as f:
+          entry = json.load(f)
+      except (IOError, OSError, ValueError):
+        return None
+    if entry is None or time.time() - entry['fetched'] > self.ttl:
+      return None
+    try:
+      self._Check(key, entry)
+    except CertPinError:  # Pin changed since the entry was cached.
+      return None
+    self._entries[key] = entry
+    return entry
+
+  def _Check(self, key, entry):
+    pin = self.pins.get(key)
+    if pin and pin.replace(':', '').lower() != entry['fingerprint']:
+      raise CertPinError('Certificate of %s has fingerprint %s, pinned %s' % (
+          key, entry['fingerprint'], pin))
+
+  def _Store(self, key, entry):
+    self._entries[key] = entry
+    if not self.cache_dir:
+      return
+    try:
+      if not os.path.isdir(self.cache_dir):
+        os.makedirs(self.cache_dir)
+      # Write then rename, so concurrent readers never see a partial file.
+      fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+      with os.fdopen(fd, 'w') as f:
+        json.dump(entry, f)
+      os.rename(tmp, self._Filename(key))
+    except (IOError, OSError) as e:
+      logging.warning('Unable to persist certificate of %s: %s', key, e)
+
+  def _Filename(self, key):
+    return os.path.join(self.cache_dir, key.replace(':', '_') + '.json')
+
+
+CERT_CACHE = CertCache()
@@ -23,34 +23,43 @@ access_point_configs = openconfig_access_points()
 
 FLAGS = flags.FLAGS
 
+_PROVISION_AP = gnmi_lib.PathTemplate('/provision-aps/provision-ap[mac={mac}]')
+_ACCESS_POINT = gnmi_lib.PathTemplate(
+    '/access-points/access-point[hostname={hostname}]')
+
 class Error(Exception):
   """Module-level Exception class."""
 
 
-def GnmiSetUp(ap):
+def GnmiSetUp(ap, options=None):
   """Set up gNMI channel for each AP.
 
+  Every RPC on the channel is authenticated with ap.auth.
+
   Args:
     ap: AP Class object.
+    options: (gnmi_lib.ChannelOptions) Optional compression and tuning.
   """
   if ap.targetport == '443':  # Target is ap-mgr.
     creds = gnmi_lib.CreateCreds(ap.targetip, ap.targetport, None, None,
                                  None, None)
     ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                  'openconfig.mist.com')
+                                  'openconfig.mist.com', options, ap.auth)
   elif ap.targetport == '8080':  # Targt is AP
     creds = gnmi_lib.CreateCreds(ap.targetip, ap.targetport, ' ', None,
                                  None, None)
     ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                  'openconfig.mojonetworks.com')
+                                  'openconfig.mojonetworks.com', options,
+                                  ap.auth)
   elif ap.targetport == '10161':  # Target is ap-mgr.
     creds = gnmi_lib.CreateCreds(ap.targetip, ap.targetport, root_cert)
     ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                  'openconfig.cisco.com')
+                                  'openconfig.cisco.com', options, ap.auth)
   elif ap.targetport == '10181':  # Targt is AP
     creds = gnmi_lib.CreateCreds(ap.targetip, ap.targetport, root_cert)
     ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                    'openconfig.arubanetworks.com')
+                                    'openconfig.arubanetworks.com', options,
+                                    ap.auth)
 
 
 def Provision(ap):
@@ -62,8 +71,7 @@ def Provision(ap):
   This populates the conig object (from PyangBind, from YANG model) for day-0
   provisioning.
   """
-  paths = gnmi_lib.ParsePath(gnmi_lib.PathNames((
-    '/provision-aps/provision-ap[mac=%s]/' % ap.mac)))
+  paths = _PROVISION_AP.Path(mac=ap.mac)
   provision_apconfigs = ap_manager_configs.provision_aps.provision_ap
   day0 = provision_apconfigs.add(ap.mac)
   day0.config.mac = ap.mac
@@ -78,7 +86,7 @@ def Provision(ap):
     f.write(json.dumps(json_value, indent=2) + '\n')
     sys.exit()
   else:
-    r = gnmi_lib.Set(ap.stub, paths, ap.targetuser, ap.targetpass, json_value, 'update')
+    r = gnmi_lib.Set(ap.stub, paths, None, None, json_value, 'update')
     print('provisioning succesfull, with the following gNMI SetResponse:\n', r)
 
 
@@ -92,8 +100,7 @@ def ConfigPhyMac(ap, student_ssids):
   This populates the conig object (from PyangBind, from YANG model) for day-1+
   configuration.
   """
-  paths = gnmi_lib.ParsePath(gnmi_lib.PathNames((
-    '/access-points/access-point[hostname=%s]/' % ap.ap_name)))
+  paths = _ACCESS_POINT.Path(hostname=ap.ap_name)
   ap_configs = access_point_configs.access_points.access_point
   ap_configs.add(ap.ap_name)
   open_ssid = ap_configs[ap.ap_name].ssids.ssid.add(ap.openssid)
@@ -138,7 +145,7 @@ def ConfigPhyMac(ap, student_ssids):
     f.write(json.dumps(json_value, indent=2) + '\n')
     sys.exit()
   else:
-    r = gnmi_lib.Set(ap.stub, paths, ap.targetuser, ap.targetpass, json_value, 'update')
+    r = gnmi_lib.Set(ap.stub, paths, None, None, json_value, 'update')
     print('Configuration succesfull, with the following gNMI SetResponse:\n', r)
     return json.dumps(json_value)
 
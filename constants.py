@@ -33,6 +33,12 @@ USAGE = """USAGE:\n
   gnmicli.py --mode configure  (Configures AP according to what you put in configs_lib)
   OR
   gnmicli.py --mode monitor  (Issues GetRequests and stores return in TSDB)
+  OR
+  gnmicli.py --mode monitor --monitor_transport stream  (Subscribes instead)
+  OR
+  gnmicli.py --mode monitor --inventory aps.csv  (Monitors every AP listed)
+  gnmicli.py --mode monitor --inventory aps.csv --shards 4  (In 4 processes)
+  gnmicli.py --mode monitor --sink http  (Writes InfluxDB line protocol)
 
   Note, add --dry_run to simply dump & writes JSON used in gNMI SetRequests
   """
@@ -0,0 +1,676 @@
+"""In-process fake gNMI Target serving a synthetic access-points tree.
+
+The fake Target stands in for the gnmitarget container (and for real APs) when
+load testing gnmi_lib, configs_lib and the monitor: it holds N access-points,
+each with two radios, a configurable number of SSIDs and of clients per SSID,
+and counters which grow at a configurable rate. It implements Capabilities,
+Get, Set and Subscribe (STREAM with SAMPLE and ON_CHANGE, POLL and ONCE), with
+a controllable latency added to every answer.
+
+Example, serving 10k APs over TLS:
+  python fake_target.py --num_aps 10000 --port 10161 \\
+      --cert server.crt --key server.key
+
+Or in-process:
+  target = fake_target.FakeTarget(num_aps=100)
+  server, port = fake_target.Serve(target, cert=cert_pem, key=key_pem)
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import collections
+import json
+import logging
+import random
+import threading
+import time
+from concurrent import futures
+import six
+import gnmi_lib
+import gnmi_pb2
+import gnmi_pb2_grpc
+
+grpc = gnmi_pb2_grpc.grpc
+
+# Keys of the lists of the served models, used to index list entries.
+_LIST_KEYS = {
+    'access-point': ('hostname',),
+    'radio': ('id',),
+    'ssid': ('name',),
+    'client': ('mac',),
+    'provision-ap': ('mac',),
+    'joined-ap': ('hostname',),
+}
+# Module of each top-level container, for JSON_IETF member names.
+_MODULES = {
+    'access-points': 'openconfig-access-points',
+    'provision-aps': 'openconfig-ap-manager',
+    'joined-aps': 'openconfig-ap-manager',
+}
+_SUPPORTED_MODELS = (
+    ('openconfig-access-points', 'OpenConfig working group', '0.2.0'),
+    ('openconfig-ap-manager', 'OpenConfig working group', '0.1.1'),
+)
+
+
+class _List(collections.OrderedDict):
+  """Entries of a YANG list, keyed by the tuple of their key leaf values."""
+
+  def __init__(self, key_names):
+    super(_List, self).__init__()
+    self.key_names = key_names
+
+  def EntryKey(self, entry):
+    return tuple(str(_Static(entry.get(name))) for name in self.key_names)
+
+  def Match(self, keys):
+    """Returns the (key, entry) tuples matching the path keys given.
+
+    Args:
+      keys: (dict) of key name to value; missing keys or '*' match any value.
+    """
+    if all(keys.get(name, '*') != '*' for name in self.key_names):
+      key = tuple(keys[name] for name in self.key_names)
+      entry = self.get(key)
+      return [(key, entry)] if entry is not None else []
+    wanted = [(i, keys[name]) for i, name in enumerate(self.key_names)
+              if keys.get(name, '*') != '*']
+    return [(key, entry) for key, entry in self.items()
+            if all(key[i] == value for i, value in wanted)]
+
+
+class _Counter(object):
+  """uint64 counter growing by rate per second."""
+
+  def __init__(self, rate, start):
+    self.rate = rate
+    self.start = start
+
+  def Value(self, now):
+    return int(self.rate * (now - self.start))
+
+  def Json(self, now):
+    return str(self.Value(now))  # RFC 7951 encodes 64-bit integers as strings.
+
+
+class _Gauge(object):
+  """Integer between low and high, changing every period seconds."""
+
+  def __init__(self, low, high, seed, period=1.0):
+    self.low = low
+    self.span = high - low + 1
+    self.seed = seed
+    self.period = period
+
+  def Value(self, now):
+    tick = int(now // self.period)
+    return self.low + (self.seed * 2654435761 + tick * 40503) % self.span
+
+  Json = Value
+
+
+def _Static(value, now=None):
+  """Returns the current value of a leaf, evaluating counters and gauges."""
+  if isinstance(value, (_Counter, _Gauge)):
+    return value.Value(time.time() if now is None else now)
+  return value
+
+
+def _ToJson(node, now):
+  """Returns the JSON_IETF (json.dumps-able) form of a node of the tree."""
+  if isinstance(node, _List):
+    return [_ToJson(entry, now) for entry in node.values()]
+  if isinstance(node, dict):
+    return dict((name, _ToJson(child, now)) for name, child in node.items())
+  if isinstance(node, (_Counter, _Gauge)):
+    return node.Json(now)
+  return node
+
+
+def _FromJson(value, name=None):
+  """Converts a JSON_IETF value received in a SetRequest into tree nodes."""
+  if isinstance(value, dict):
+    names = [(key.rpartition(':')[2], child) for key, child in value.items()]
+    return dict((name, _FromJson(child, name)) for name, child in names)
+  if isinstance(value, list) and value and isinstance(value[0], dict):
+    entries = [_FromJson(entry) for entry in value]
+    node = _List(_LIST_KEYS.get(name) or (sorted(entries[0])[0],))
+    for entry in entries:
+      node[node.EntryKey(entry)] = entry
+    return node
+  return value
+
+
+def _Merge(node, value):
+  """Merges value into the container or list entry node (gNMI update)."""
+  for name, child in value.items():
+    current = node.get(name)
+    if isinstance(child, _List) and isinstance(current, _List):
+      for key, entry in child.items():
+        if key in current:
+          _Merge(current[key], entry)
+        else:
+          current[key] = entry
+    elif (isinstance(child, dict) and isinstance(current, dict) and
+          not isinstance(child, _List) and not isinstance(current, _List)):
+      _Merge(current, child)
+    else:
+      node[name] = child
+
+
+def _TypedValue(value, now):
+  """Returns a scalar (PROTO encoding) gnmi_pb2.TypedValue of a leaf."""
+  value = _Static(value, now)
+  if isinstance(value, bool):
+    return gnmi_pb2.TypedValue(bool_val=value)
+  if isinstance(value, six.integer_types):
+    if value < 0:
+      return gnmi_pb2.TypedValue(int_val=value)
+    return gnmi_pb2.TypedValue(uint_val=value)
+  if isinstance(value, float):
+    return gnmi_pb2.TypedValue(float_val=value)
+  if isinstance(value, list):
+    return gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(
+        element=[_TypedValue(element, now) for element in value]))
+  return gnmi_pb2.TypedValue(string_val=six.text_type(value))
+
+
+def _Elems(prefix, path):
+  """Returns the (name, keys) elements of prefix + path, without modules."""
+  elems = []
+  for elem in list(prefix.elem) + list(path.elem):
+    elems.append((elem.name.rpartition(':')[2], dict(elem.key)))
+  return elems
+
+
+def _Path(elems):
+  """Returns a gnmi_pb2.Path of (name, keys) elements."""
+  path = gnmi_pb2.Path()
+  for name, keys in elems:
+    path.elem.add(name=name).key.update(keys)
+  return path
+
+
+def _Overlaps(a, b):
+  """Whether one element list is a (key compatible) prefix of the other."""
+  for (name_a, keys_a), (name_b, keys_b) in zip(a, b):
+    if name_a != name_b:
+      return False
+    for key, value in keys_a.items():
+      if keys_b.get(key, value) not in (value, '*') and value != '*':
+        return False
+  return True
+
+
+class FakeTarget(gnmi_pb2_grpc.gNMIServicer):
+  """gNMI servicer holding a synthetic openconfig-access-points tree."""
+
+  def __init__(self, num_aps=10, ssids_per_ap=2, clients_per_ssid=5,
+               counter_rate=1000.0, latency=0.0, jitter=0.0,
+               hostname_format='ap-{:05d}.example.net', username=None,
+               password=None, encodings=('JSON', 'JSON_IETF', 'PROTO'),
+               default_sample_interval=10.0, seed=0):
+    """Builds the tree.
+
+    Args:
+      num_aps: (int) Access-points in the tree.
+      ssids_per_ap: (int) SSIDs configured on every access-point.
+      clients_per_ssid: (int) Clients associated to every SSID.
+      counter_rate: (float) Growth of the counters, per second.
+      latency: (float) Seconds added to every answer.
+      jitter: (float) Up to this many more seconds added to every answer.
+      hostname_format: (str) Formats the index of an AP into its hostname.
+      username: (str) If set, RPCs without this username are rejected.
+      password: (str) If set, RPCs without this password are rejected.
+      encodings: (tuple) gNMI Encoding names reported by Capabilities.
+      default_sample_interval: (float) Seconds between SAMPLE updates when
+        the subscription does not set one.
+      seed: (int) Seed of the synthetic values.
+    """
+    self.latency = latency
+    self.jitter = jitter
+    self.username = username
+    self.password = password
+    self.encodings = encodings
+    self.default_sample_interval = default_sample_interval
+    self._random = random.Random(seed)
+    self._lock = threading.RLock()
+    self._listeners = set()
+    self._start = time.time()
+    self.hostnames = [hostname_format.format(i) for i in range(num_aps)]
+    access_points = _List(_LIST_KEYS['access-point'])
+    provision_aps = _List(_LIST_KEYS['provision-ap'])
+    for i, hostname in enumerate(self.hostnames):
+      mac = '02:00:%02x:%02x:%02x:00' % (i >> 16 & 0xff, i >> 8 & 0xff,
+                                         i & 0xff)
+      access_points[(hostname,)] = self._AccessPoint(
+          i, hostname, ssids_per_ap, clients_per_ssid, counter_rate)
+      provision_aps[(mac,)] = {
+          'mac': mac,
+          'config': {'mac': mac, 'hostname': hostname, 'country-code': 'US'},
+          'state': {'mac': mac, 'hostname': hostname, 'country-code': 'US'}}
+    self._root = {
+        'access-points': {'access-point': access_points},
+        'provision-aps': {'provision-ap': provision_aps},
+    }
+
+  def _AccessPoint(self, index, hostname, ssids, clients, counter_rate):
+    """Returns the synthetic tree of one access-point."""
+    seed = index * 7919
+    radios = _List(_LIST_KEYS['radio'])
+    for radio_id, frequency, channel in ((0, 'FREQ_2GHZ', 1 + index % 3 * 5),
+                                         (1, 'FREQ_5GHZ', 36 + index % 4 * 4)):
+      config = {'id': radio_id, 'operating-frequency': frequency,
+                'enabled': True, 'transmit-power': 9, 'channel': channel,
+                'channel-width': 20 if radio_id == 0 else 40, 'dca': False,
+                'allowed-max-txpower': 20, 'scanning': True}
+      state = dict(config)
+      state.update({
+          'total-channel-utilization': _Gauge(5, 90, seed + radio_id),
+          'rx-dot11-channel-utilization': _Gauge(0, 50, seed + radio_id + 1),
+          'rx-noise-channel-utilization': _Gauge(0, 20, seed + radio_id + 2),
+          'tx-dot11-channel-utilization': _Gauge(0, 40, seed + radio_id + 3),
+          'counters': dict(
+              (name, _Counter(counter_rate * self._random.uniform(0.5, 1.5),
+                              self._start))
+              for name in ('failed-fcs-frames', 'noise-floor-failures',
+                           'rx-retries', 'tx-retries', 'rx-bytes',
+                           'tx-bytes'))})
+      radios[(str(radio_id),)] = {
+          'id': radio_id, 'config': config, 'state': state}
+    ssid_list = _List(_LIST_KEYS['ssid'])
+    for ssid_index in range(ssids):
+      name = 'ssid-%d' % ssid_index
+      config = {'name': name, 'enabled': True, 'hidden': False,
+                'operating-frequency': 'FREQ_2_5_GHZ',
+                'opmode': 'WPA2_PERSONAL' if ssid_index % 2 else 'OPEN',
+                'basic-data-rates': ['RATE_11MB', 'RATE_24MB'],
+                'supported-data-rates': ['RATE_11MB', 'RATE_24MB'],
+                'default-vlan': 1 + ssid_index}
+      client_list = _List(_LIST_KEYS['client'])
+      for client_index in range(clients):
+        mac = '0a:%02x:%02x:%02x:%02x:%02x' % (
+            index >> 16 & 0xff, index >> 8 & 0xff, index & 0xff, ssid_index,
+            client_index)
+        client_seed = seed + ssid_index * 131 + client_index
+        client_list[(mac,)] = {'mac': mac, 'state': {
+            'mac': mac,
+            'rssi': _Gauge(-85, -40, client_seed),
+            'snr': _Gauge(10, 50, client_seed),
+            'counters': {
+                'tx-bytes': _Counter(counter_rate * 10, self._start),
+                'rx-bytes': _Counter(counter_rate * 20, self._start),
+                'tx-retries': _Counter(counter_rate / 100, self._start)}}}
+      ssid_list[(name,)] = {'name': name, 'config': config,
+                            'state': dict(config),
+                            'clients': {'client': client_list}}
+    return {'hostname': hostname,
+            'config': {'hostname': hostname},
+            'state': {'hostname': hostname, 'opstate': 'UP'},
+            'radios': {'radio': radios},
+            'ssids': {'ssid': ssid_list}}
+
+  # Helpers.
+
+  def _Delay(self):
+    delay = self.latency
+    if self.jitter:
+      delay += random.uniform(0, self.jitter)
+    if delay:
+      time.sleep(delay)
+
+  def _Authenticate(self, context):
+    if self.username is None and self.password is None:
+      return
+    metadata = dict(context.invocation_metadata())
+    if (metadata.get('username') != self.username or
+        metadata.get('password') != self.password):
+      context.abort(grpc.StatusCode.UNAUTHENTICATED, 'Invalid credentials')
+
+  def _Find(self, elems):
+    """Returns (concrete elems, node) of every node matching elems."""
+    found = [([], self._root)]
+    for name, keys in elems:
+      matches = []
+      for concrete, node in found:
+        child = node.get(name) if isinstance(node, dict) else None
+        if isinstance(child, _List):
+          for key, entry in child.Match(keys):
+            matches.append((concrete + [(name, dict(zip(child.key_names,
+                                                         key)))], entry))
+        elif child is not None:
+          matches.append((concrete + [(name, {})], child))
+      found = matches
+    return found
+
+  def _Notification(self, elems_list, encoding, now):
+    """Returns a Notification of the current value of every path given."""
+    notification = gnmi_pb2.Notification(timestamp=int(now * 1e9))
+    with self._lock:
+      for elems in elems_list:
+        for concrete, node in self._Find(elems):
+          if encoding == gnmi_pb2.PROTO:
+            for leaf_elems, value in self._Leaves(concrete, node):
+              notification.update.add(path=_Path(leaf_elems),
+                                      val=_TypedValue(value, now))
+            continue
+          value = _ToJson(node, now)
+          if isinstance(value, dict) and concrete:
+            module = _MODULES.get(concrete[0][0])
+            if module:
+              value = dict(('%s:%s' % (module, name), child)
+                           for name, child in value.items())
+          encoded = json.dumps(value).encode('utf-8')
+          if encoding == gnmi_pb2.JSON:
+            val = gnmi_pb2.TypedValue(json_val=encoded)
+          else:
+            val = gnmi_pb2.TypedValue(json_ietf_val=encoded)
+          notification.update.add(path=_Path(concrete), val=val)
+    return notification
+
+  def _Leaves(self, elems, node):
+    """Yields (elems, value) of every leaf at or below node."""
+    if isinstance(node, _List):
+      for key, entry in node.items():
+        entry_elems = elems[:-1] + [(elems[-1][0],
+                                     dict(zip(node.key_names, key)))]
+        for leaf in self._Leaves(entry_elems, entry):
+          yield leaf
+    elif isinstance(node, dict):
+      for name, child in node.items():
+        for leaf in self._Leaves(elems + [(name, {})], child):
+          yield leaf
+    else:
+      yield elems, node
+
+  def _Notify(self, elems, deleted=False):
+    for listener in list(self._listeners):
+      listener.put(('change', (elems, deleted)))
+
+  def _SetNode(self, elems, value, replace):
+    """Creates or merges value at elems (gNMI update or replace)."""
+    node = self._root
+    for i, (name, keys) in enumerate(elems):
+      last = i == len(elems) - 1
+      if keys:
+        entries = node.get(name)
+        if not isinstance(entries, _List):
+          entries = node[name] = _List(_LIST_KEYS.get(name) or
+                                       tuple(sorted(keys)))
+        try:
+          key = tuple(keys[key_name] for key_name in entries.key_names)
+        except KeyError:
+          raise ValueError('Missing keys of %s in %s' % (
+              entries.key_names, gnmi_lib.PathToXpath(_Path(elems))))
+        entry = entries.get(key)
+        if entry is None or (last and replace):
+          entry = entries[key] = dict(zip(entries.key_names, key))
+        child = entry
+      elif last:
+        if replace or not isinstance(node.get(name), dict):
+          node[name] = value
+          return
+        child = node[name]
+      else:
+        child = node.get(name)
+        if not isinstance(child, dict) or isinstance(child, _List):
+          child = node[name] = {}
+      if last:
+        if not isinstance(value, dict):
+          raise ValueError('List entry %s set to a non-object value' %
+                           gnmi_lib.PathToXpath(_Path(elems)))
+        _Merge(child, value)
+        return
+      node = child
+
+  def _DeleteNode(self, elems):
+    """Deletes every node matching elems; returns whether any was found."""
+    if not elems:
+      return False
+    deleted = False
+    for concrete, parent in self._Find(elems[:-1]):
+      name, keys = elems[-1]
+      child = parent.get(name) if isinstance(parent, dict) else None
+      if isinstance(child, _List) and keys:
+        for key, _ in child.Match(keys):
+          del child[key]
+          deleted = True
+      elif child is not None:
+        del parent[name]
+        deleted = True
+    return deleted
+
+  # gNMI RPCs.
+
+  def Capabilities(self, request, context):
+    self._Authenticate(context)
+    self._Delay()
+    return gnmi_pb2.CapabilityResponse(
+        supported_models=[
+            gnmi_pb2.ModelData(name=name, organization=organization,
+                               version=version)
+            for name, organization, version in _SUPPORTED_MODELS],
+        supported_encodings=[gnmi_pb2.Encoding.Value(encoding)
+                             for encoding in self.encodings],
+        gNMI_version='0.7.0')
+
+  def Get(self, request, context):
+    self._Authenticate(context)
+    self._Delay()
+    now = time.time()
+    notification = self._Notification(
+        [_Elems(request.prefix, path) for path in request.path],
+        request.encoding, now)
+    if request.path and not notification.update:
+      context.abort(grpc.StatusCode.NOT_FOUND, 'No data for the paths given')
+    return gnmi_pb2.GetResponse(notification=[notification])
+
+  def Set(self, request, context):
+    self._Authenticate(context)
+    self._Delay()
+    response = gnmi_pb2.SetResponse(timestamp=int(time.time() * 1e9))
+    response.prefix.CopyFrom(request.prefix)
+    changes = []
+    try:
+      with self._lock:
+        for path in request.delete:
+          elems = _Elems(request.prefix, path)
+          self._DeleteNode(elems)
+          changes.append((elems, True))
+          response.response.add(path=path, op=gnmi_pb2.UpdateResult.DELETE)
+        for op, updates in ((gnmi_pb2.UpdateResult.REPLACE, request.replace),
+                            (gnmi_pb2.UpdateResult.UPDATE, request.update)):
+          for update in updates:
+            elems = _Elems(request.prefix, update.path)
+            value = _FromJson(gnmi_lib.DecodeTypedValue(update.val),
+                              elems[-1][0] if elems else None)
+            self._SetNode(elems, value,
+                          replace=op == gnmi_pb2.UpdateResult.REPLACE)
+            changes.append((elems, False))
+            response.response.add(path=update.path, op=op)
+    except ValueError as e:
+      context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+    for elems, deleted in changes:
+      self._Notify(elems, deleted)
+    return response
+
+  def Subscribe(self, request_iterator, context):
+    self._Authenticate(context)
+    try:
+      request = next(request_iterator)
+    except StopIteration:
+      return
+    sub_list = request.subscribe
+    encoding = sub_list.encoding
+    subscriptions = [(_Elems(sub_list.prefix, sub.path), sub)
+                     for sub in sub_list.subscription]
+    all_elems = [elems for elems, _ in subscriptions]
+    events = six.moves.queue.Queue()
+
+    def _ReadRequests():
+      try:
+        for request in request_iterator:
+          if request.HasField('poll'):
+            events.put(('poll', None))
+      except Exception:  # pylint: disable=broad-except
+        pass  # Stream cancelled.
+      events.put(('end', None))
+
+    reader = threading.Thread(target=_ReadRequests)
+    reader.daemon = True
+    reader.start()
+    self._Delay()
+    if sub_list.mode != gnmi_pb2.SubscriptionList.STREAM or (
+        not sub_list.updates_only):
+      yield gnmi_pb2.SubscribeResponse(
+          update=self._Notification(all_elems, encoding, time.time()))
+    yield gnmi_pb2.SubscribeResponse(sync_response=True)
+    if sub_list.mode == gnmi_pb2.SubscriptionList.ONCE:
+      return
+    if sub_list.mode == gnmi_pb2.SubscriptionList.POLL:
+      while True:
+        event, _ = events.get()
+        if event == 'end':
+          return
+        self._Delay()
+        yield gnmi_pb2.SubscribeResponse(
+            update=self._Notification(all_elems, encoding, time.time()))
+        yield gnmi_pb2.SubscribeResponse(sync_response=True)
+    for response in self._Stream(subscriptions, encoding, events, context):
+      yield response
+
+  def _Stream(self, subscriptions, encoding, events, context):
+    """Yields the updates of a STREAM subscription until it is cancelled."""
+    on_change = []
+    samples = []  # [next due time, interval, elems]
+    now = time.time()
+    for elems, sub in subscriptions:
+      if sub.mode == gnmi_pb2.ON_CHANGE:
+        on_change.append(elems)
+      else:  # SAMPLE, and TARGET_DEFINED which samples.
+        interval = (sub.sample_interval / 1e9 or
+                    self.default_sample_interval)
+        samples.append([now + interval, interval, elems])
+    self._listeners.add(events)
+    try:
+      while context.is_active():
+        timeout = 1.0
+        if samples:
+          timeout = max(0, min(due for due, _, _ in samples) - time.time())
+        try:
+          event, change = events.get(timeout=timeout)
+        except six.moves.queue.Empty:
+          event = None
+        if event == 'end':
+          return
+        if event == 'change':
+          for response in self._Changes(on_change, change, encoding):
+            yield response
+        now = time.time()
+        due = [sample for sample in samples if sample[0] <= now]
+        if due:
+          self._Delay()
+          yield gnmi_pb2.SubscribeResponse(update=self._Notification(
+              [elems for _, _, elems in due], encoding, now))
+          for sample in due:
+            while sample[0] <= now:  # Skip samples missed, if any.
+              sample[0] += sample[1]
+    finally:
+      self._listeners.discard(events)
+
+  def _Changes(self, on_change, change, encoding):
+    """Yields the ON_CHANGE updates caused by a Set of changed elems."""
+    changed, deleted = change
+    for elems in on_change:
+      if not _Overlaps(elems, changed):
+        continue
+      now = time.time()
+      if deleted and len(changed) >= len(elems):
+        notification = gnmi_pb2.Notification(timestamp=int(now * 1e9))
+        notification.delete.add().CopyFrom(_Path(changed))
+      else:  # Send the most specific of the two paths.
+        notification = self._Notification(
+            [changed if len(changed) > len(elems) else elems], encoding, now)
+      if notification.update or notification.delete:
+        yield gnmi_pb2.SubscribeResponse(update=notification)
+
+
+def Serve(target, port=0, cert=None, key=None, max_workers=64):
+  """Starts a gRPC server for a FakeTarget.
+
+  Args:
+    target: (FakeTarget) Servicer to serve.
+    port: (int) Port to listen on; any free port if 0.
+    cert: (bytes) PEM certificate of the server; serves plaintext if None.
+    key: (bytes) PEM private key of the server.
+    max_workers: (int) Concurrent RPCs served; each Subscribe stream holds
+      one worker for its lifetime.
+
+  Returns:
+    (grpc.Server, int) the started server and the port it listens on.
+  """
+  server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                       maximum_concurrent_rpcs=None)
+  gnmi_pb2_grpc.add_gNMIServicer_to_server(target, server)
+  address = '[::]:%d' % port
+  if cert:
+    credentials = grpc.ssl_server_credentials([(key, cert)])
+    port = server.add_secure_port(address, credentials)
+  else:
+    port = server.add_insecure_port(address)
+  server.start()
+  return server, port
+
+
+def _create_parser():
+  parser = argparse.ArgumentParser(description='Fake gNMI Target.')
+  parser.add_argument('--port', type=int, default=10161,
+                      help='Port to listen on.')
+  parser.add_argument('--num_aps', type=int, default=10,
+                      help='Access-points in the tree.')
+  parser.add_argument('--ssids', type=int, default=2,
+                      help='SSIDs configured on every access-point.')
+  parser.add_argument('--clients', type=int, default=5,
+                      help='Clients associated to every SSID.')
+  parser.add_argument('--counter_rate', type=float, default=1000.0,
+                      help='Growth of the counters, per second.')
+  parser.add_argument('--latency', type=float, default=0.0,
+                      help='Seconds added to every answer.')
+  parser.add_argument('--jitter', type=float, default=0.0,
+                      help='Up to this many more seconds added to answers.')
+  parser.add_argument('--cert', help='PEM certificate; plaintext if unset.')
+  parser.add_argument('--key', help='PEM private key of the certificate.')
+  parser.add_argument('--username', help='Username required from clients.')
+  parser.add_argument('--password', help='Password required from clients.')
+  parser.add_argument('--max_workers', type=int, default=64,
+                      help='Concurrent RPCs, including Subscribe streams.')
+  return parser
+
+
+def main():
+  args = _create_parser().parse_args()
+  logging.basicConfig(level=logging.INFO)
+  cert = key = None
+  if args.cert:
+    with open(args.cert, 'rb') as f:
+      cert = f.read()
+    with open(args.key, 'rb') as f:
+      key = f.read()
+  target = FakeTarget(num_aps=args.num_aps, ssids_per_ap=args.ssids,
+                      clients_per_ssid=args.clients,
+                      counter_rate=args.counter_rate, latency=args.latency,
+                      jitter=args.jitter, username=args.username,
+                      password=args.password)
+  server, port = Serve(target, args.port, cert, key, args.max_workers)
+  logging.info('Serving %d access-points on port %d', args.num_aps, port)
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    server.stop(0)
+
+
+if __name__ == '__main__':
+  main()
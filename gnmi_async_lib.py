@@ -0,0 +1,185 @@
+"""Python3 asyncio library used for interacting with network elements via gNMI.
+
+This library mirrors the Get, Set and Subscribe functions of gnmi_lib on top of
+grpc.aio channels, so that a single event loop can keep many RPCs to many
+Targets in flight at once. Requests are built, and responses decoded, by the
+same helpers gnmi_lib uses, and Get and Set share the retries, circuit
+breakers and metrics of gnmi_lib.
+
+Example:
+  stubs = [AsyncCreateStub(creds, ip, port, None) for ip in targets]
+  responses = await asyncio.gather(
+      *[AsyncGet(stub, paths, user, password) for stub in stubs])
+"""
+
+import asyncio
+import weakref
+import grpc
+from grpc import aio
+import gnmi_lib
+import gnmi_pb2_grpc
+
+# aio channels are bound to the event loop they were created on.
+_CHANNELS = {}  # (loop, channel key): aio.Channel
+_STUB_KEYS = weakref.WeakKeyDictionary()  # Stub: channel key.
+
+
+def AsyncCreateStub(creds, target, port, host_override, options=None):
+  """Creates a gNMI Stub on a grpc.aio channel.
+
+  Stubs to the same Target built from the same credentials and options share
+  a single channel per event loop. Must be called with an event loop running.
+
+  Args:
+    creds: (object) of gNMI Credentials class used to build the secure channel.
+    target: (str) gNMI Target.
+    port: (str) gNMI Target IP port.
+    host_override: (str) Hostname being overridden for Cert check.
+    options: (gnmi_lib.ChannelOptions) Optional compression and tuning.
+
+  Returns:
+    a gnmi_pb2_grpc object representing a gNMI Stub.
+  """
+  channel_key = gnmi_lib.ChannelKey(creds, target, port, host_override,
+                                    options)
+  key = (asyncio.get_running_loop(), channel_key)
+  channel = _CHANNELS.get(key)
+  if channel is None:
+    channel = _CHANNELS[key] = aio.secure_channel(
+        target + ':' + port, creds,
+        gnmi_lib.ChannelArgs(host_override, options))
+  stub = gnmi_pb2_grpc.gNMIStub(channel)
+  _STUB_KEYS[stub] = channel_key
+  return stub
+
+
+async def AsyncCloseChannels():
+  """Closes every channel opened by AsyncCreateStub on the running loop."""
+  loop = asyncio.get_running_loop()
+  for key in [k for k in _CHANNELS if k[0] is loop]:
+    await _CHANNELS.pop(key).close()
+
+
+async def _AsyncInvoke(stub, method, request, username, password,
+                       timeout=None, retry=gnmi_lib.NO_RETRY):
+  """Sends a unary RPC as gnmi_lib does, without blocking the event loop.
+
+  The Stub shares the circuit breaker of the sync Stubs to its Target.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    method: (str) Name of the Stub method, eg. 'Get'.
+    request: the request message.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (gnmi_lib.RetryPolicy) Only pass a policy retrying for idempotent
+      RPCs.
+
+  Returns:
+    the response message.
+
+  Raises:
+    gnmi_lib.CircuitOpenError: The circuit breaker of the Target is open.
+    grpc.RpcError: The last attempt failed.
+  """
+  attempts = gnmi_lib.RpcAttempts(stub, method, request, retry,
+                                  _STUB_KEYS.get(stub))
+  call = getattr(stub, method)
+  kwargs = gnmi_lib.Metadata(username, password)
+  while True:
+    attempts.Start()
+    try:
+      response = await call(request, timeout=timeout, **kwargs)
+    except grpc.RpcError as e:
+      attempts.Failed(e)
+      delay = attempts.Retry(e)
+      if delay is None:
+        raise
+      await asyncio.sleep(delay)
+      continue
+    attempts.Succeeded(response)
+    return response
+
+
+async def AsyncGet(stub, paths, username, password, prefix=None,
+                   encoding='JSON_IETF', timeout=None,
+                   retry=gnmi_lib.DEFAULT_RETRY):
+  """Create a gNMI GetRequest.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path, or a list of gNMI Paths fetched in one round trip.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    encoding: (str) Encoding requested from the Target.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (gnmi_lib.RetryPolicy) Retries of transient failures.
+
+  Returns:
+    a gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+  """
+  return await _AsyncInvoke(stub, 'Get',
+                            gnmi_lib.GetRequest(paths, prefix, encoding),
+                            username, password, timeout, retry)
+
+
+async def AsyncSet(stub, paths, username, password, json_value, set_type,
+                   timeout=None):
+  """Create a gNMI SetRequest.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    json_value: (str) JSON_IETF Value or file.
+    set_type: (str) Type of gNMI SetRequest to build.
+    timeout: (float) Deadline in seconds, or None.
+  Returns:
+    set_request: (class) gNMI SetRequest.
+  """
+  set_request = gnmi_lib.SetRequest(paths, json_value, set_type)
+  if set_request is not None:
+    return await _AsyncInvoke(stub, 'Set', set_request, username, password,
+                              timeout)
+
+
+async def AsyncSubscribe(stub, paths, username, password, sub_mode='on_change',
+                         sample_interval=None, prefix=None, updates_only=False,
+                         encoding='JSON_IETF'):
+  """Create a gNMI Subscribe STREAM and yield updates as they arrive.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path, gnmi_pb2.Subscription, or a list of either.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    sub_mode: (str) Mode used for plain Paths; see gnmi_lib.Subscription().
+    sample_interval: (int) Seconds between samples for 'sample' sub_mode.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    updates_only: (bool) Skip the initial state dump sent by the Target.
+    encoding: (str) Encoding requested from the Target.
+
+  Yields:
+    (timestamp, xpath, value) tuples, as per gnmi_lib.DecodeNotification().
+
+  Raises:
+    gnmi_lib.SubscribeError: The Target returned an error on the stream.
+  """
+  call = stub.Subscribe(**gnmi_lib.Metadata(username, password))
+  try:
+    await call.write(gnmi_lib.SubscribeRequest(
+        paths, 'STREAM', sub_mode, sample_interval, prefix, updates_only,
+        encoding))
+    async for response in call:
+      field = response.WhichOneof('response')
+      if field == 'update':
+        for update in gnmi_lib.DecodeNotification(response.update):
+          yield update
+      elif field == 'error':
+        raise gnmi_lib.SubscribeError('Subscribe error from Target: %s' %
+                                      response.error.message)
+  finally:
+    call.cancel()
@@ -0,0 +1,479 @@
+"""End-to-end benchmarks of gnmi_lib, configs_lib and the wlpc-gnmi monitor.
+
+Every benchmark runs against an in-process fake_target.FakeTarget, once per
+fleet size (access-points served) and payload size (clients per SSID, which
+sets the size of an access-point's state). Results are written as JSON, for
+comparison between releases:
+
+  parse_path      gnmi_lib.ParsePath(PathNames()) throughput, per xpath.
+  config_phy_mac  configs_lib.ConfigPhyMac latency, and the time taken by
+                  pybindJSON.dumps of the resulting tree.
+  get             Get latency percentiles of an access-point and of a leaf.
+  set             Set throughput and latency of an access-point's config.
+  monitor         Cost of one iteration of the wlpc-gnmi monitor loop, by
+                  phase: Get, _write_db (queueing the point), the
+                  comparison to intent and the channel utilization sample,
+                  writing through the --sink given to an in-memory stand-in
+                  of the InfluxDB client or a discarding HTTP server.
+
+Benchmarks whose dependencies cannot be imported are recorded as skipped.
+
+Usage:
+  python gnmi_benchmark.py --fleet_sizes 100,10000 --clients 0,20 \\
+      --output results.json
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import collections
+import importlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import six
+import fake_target
+import gnmi_lib
+import sink_lib
+import xpath_benchmark
+
+BENCHMARKS = ('parse_path', 'config_phy_mac', 'get', 'set', 'monitor')
+_DB = 'ap_telemetry'
+_AP_ROOT = '/access-points/access-point[hostname={hostname}]'
+_CU = _AP_ROOT + '/radios/radio[id=0]/state/total-channel-utilization'
+
+
+def _percentiles(seconds):
+  """Returns the distribution of durations, in milliseconds."""
+  ordered = sorted(seconds)
+  if not ordered:
+    return {'count': 0}
+  def _at(fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e3
+  return {'count': len(ordered),
+          'mean': sum(ordered) / len(ordered) * 1e3,
+          'p50': _at(0.50), 'p90': _at(0.90), 'p99': _at(0.99),
+          'max': ordered[-1] * 1e3}
+
+
+def _git_revision():
+  try:
+    return subprocess.check_output(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=open(os.devnull, 'w')).decode('ascii').strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+class _Quiet(object):
+  """Discards what is printed to stdout within the block."""
+
+  def __enter__(self):
+    self._stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+  def __exit__(self, *unused_exc_info):
+    sys.stdout.close()
+    sys.stdout = self._stdout
+
+
+_ResultSet = collections.namedtuple('_ResultSet', ['raw'])
+
+
+class _StandInDb(object):
+  """In-memory stand-in of InfluxDBClient, keeping the last value of series.
+
+  It answers the 'select last(value)' queries of wlpc-gnmi, so the monitor
+  loop is measured without the cost (and noise) of a database server.
+  """
+
+  _QUERY = re.compile(r'from "(?P<measurement>[^"]+)" '
+                      r'where ap_name=\'(?P<ap_name>[^\']*)\'')
+
+  def __init__(self):
+    self.database = None
+    self.points = 0
+    self._last = {}
+
+  def switch_database(self, database):
+    self.database = database
+
+  def write_points(self, points, time_precision=None):
+    del time_precision  # Unused.
+    for point in points:
+      self._last[(self.database, point['measurement'],
+                  point['tags']['ap_name'])] = point['fields']['value']
+    self.points += len(points)
+    return True
+
+  def query(self, query, database=None):
+    match = self._QUERY.search(query)
+    value = self._last[(database or self.database, match.group('measurement'),
+                        match.group('ap_name'))]
+    return _ResultSet({'series': [{'values': [[0, value]]}]})
+
+
+class _DiscardingHandler(six.moves.BaseHTTPServer.BaseHTTPRequestHandler):
+  """Answers InfluxDB /write requests, discarding the points."""
+
+  protocol_version = 'HTTP/1.1'  # Keep-alive.
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    self.rfile.read(int(self.headers['Content-Length']))
+    self.send_response(204)
+    self.send_header('Content-Length', '0')
+    self.end_headers()
+
+  def log_message(self, *unused_args):
+    pass
+
+
+class _DiscardingHttp(object):
+  """HTTP server standing in for InfluxDB behind sink_lib.HttpTransport.
+
+  The cost of encoding and sending line protocol is measured without that of
+  a database server.
+  """
+
+  def __init__(self):
+    self._server = six.moves.BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                       _DiscardingHandler)
+    self.port = self._server.server_address[1]
+    thread = threading.Thread(target=self._server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+  def Stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+
+class _Fleet(object):
+  """A FakeTarget serving a fleet, and Stubs to it."""
+
+  def __init__(self, args, num_aps, clients):
+    with open(args.cert, 'rb') as f:
+      self.cert = f.read()
+    with open(args.key, 'rb') as f:
+      key = f.read()
+    self.target = fake_target.FakeTarget(
+        num_aps=num_aps, ssids_per_ap=args.ssids, clients_per_ssid=clients,
+        latency=args.target_latency)
+    self.server, port = fake_target.Serve(self.target, cert=self.cert,
+                                          key=key)
+    self.port = str(port)
+    self.host_override = args.host_override
+    self.creds = gnmi_lib.CreateCreds('localhost', self.port, None, self.cert,
+                                      None, None)
+
+  def Stub(self, auth=None):
+    return gnmi_lib.CreateStub(self.creds, 'localhost', self.port,
+                               self.host_override, auth=auth)
+
+  def Hostnames(self, count):
+    """Returns count hostnames, cycling through the fleet."""
+    hostnames = self.target.hostnames
+    return [hostnames[i % len(hostnames)] for i in range(count)]
+
+  def Close(self):
+    self.server.stop(0)
+
+
+def _bench_parse_path(args):
+  results = []
+  for name, xpath in sorted(xpath_benchmark.XPATHS.items()):
+    seconds = timeit.timeit(
+        lambda: gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)),
+        number=args.parse_iterations)
+    results.append({'params': {'xpath': name},
+                    'ops_per_sec': args.parse_iterations / seconds,
+                    'us_per_op': seconds / args.parse_iterations * 1e6})
+  return results
+
+
+def _bench_get(args, fleet, params):
+  stub = fleet.Stub()
+  results = []
+  for name, template in (('access_point', _AP_ROOT), ('leaf', _CU)):
+    durations = []
+    response_bytes = 0
+    for i, hostname in enumerate(fleet.Hostnames(args.warmup +
+                                                 args.iterations)):
+      path = gnmi_lib.ParsePath(gnmi_lib.PathNames(
+          template.format(hostname=hostname)))
+      start = time.time()
+      response = gnmi_lib.Get(stub, [path])
+      if i >= args.warmup:
+        durations.append(time.time() - start)
+        response_bytes += response.ByteSize()
+    result_params = dict(params, path=name)
+    results.append({'params': result_params,
+                    'latency_ms': _percentiles(durations),
+                    'response_bytes': response_bytes // len(durations)})
+  return results
+
+
+def _ap_config(hostname, index, ssids):
+  """Returns the JSON_IETF config of an access-point, as ConfigPhyMac does."""
+  return {
+      'hostname': hostname,
+      'config': {'hostname': hostname},
+      'radios': {'radio': [{
+          'id': 0, 'operating-frequency': 'FREQ_2GHZ',
+          'config': {'id': 0, 'operating-frequency': 'FREQ_2GHZ',
+                     'enabled': True, 'dca': False, 'transmit-power': 3,
+                     'channel-width': 20, 'channel': 1 + index % 3 * 5}}]},
+      'ssids': {'ssid': [
+          {'name': 'ssid-%d' % i,
+           'config': {'name': 'ssid-%d' % i, 'enabled': True,
+                      'hidden': False, 'operating-frequency': 'FREQ_5GHZ',
+                      'opmode': 'OPEN'}} for i in range(ssids)]},
+  }
+
+
+def _bench_set(args, fleet, params):
+  stub = fleet.Stub()
+  durations = []
+  request_bytes = 0
+  hostnames = fleet.Hostnames(args.warmup + args.iterations)
+  wall_start = None
+  for i, hostname in enumerate(hostnames):
+    if i == args.warmup:
+      wall_start = time.time()
+    path = gnmi_lib.ParsePath(gnmi_lib.PathNames(
+        _AP_ROOT.format(hostname=hostname)))
+    json_value = _ap_config(hostname, i, args.ssids)
+    start = time.time()
+    gnmi_lib.Set(stub, path, None, None, json_value, 'update')
+    if i >= args.warmup:
+      durations.append(time.time() - start)
+      request_bytes += len(json.dumps(json_value))
+  wall = time.time() - wall_start
+  return [{'params': params, 'ops_per_sec': len(durations) / wall,
+           'latency_ms': _percentiles(durations),
+           'request_bytes': request_bytes // len(durations)}]
+
+
+def _load_wlpc(args):
+  """Imports wlpc-gnmi (and so configs_lib), with its flags parsed."""
+  try:
+    wlpc = importlib.import_module('wlpc-gnmi')
+  except Exception as e:  # pylint: disable=broad-except
+    # Eg. bindings generated by a pyangbind release this Python cannot load.
+    raise ImportError('Cannot import wlpc-gnmi: %s' % e)
+  from absl import flags  # pylint: disable=g-import-not-at-top
+  from absl import logging  # pylint: disable=g-import-not-at-top
+  if not flags.FLAGS.is_parsed():
+    flags.FLAGS(['gnmi_benchmark', '--rpc_timeout=%s' % args.rpc_timeout])
+  # Per-sample INFO logging would dominate the loop being measured.
+  logging.set_verbosity(logging.WARNING)
+  return wlpc
+
+
+def _ap_objects(wlpc, fleet, hostnames):
+  aps = []
+  for i, hostname in enumerate(hostnames):
+    ap = wlpc._create_apobj(  # pylint: disable=protected-access
+        'localhost:' + fleet.port, hostname,
+        '02:00:00:%02x:%02x:%02x' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff),
+        ['student_open', 'student_psk'])
+    ap.stub = fleet.Stub(ap.auth)
+    aps.append(ap)
+  return aps
+
+
+def _bench_config_phy_mac(args, fleet, params):
+  # pylint: disable=protected-access
+  wlpc = _load_wlpc(args)
+  configs_lib = wlpc.configs_lib
+  count = min(params['fleet_size'], args.max_config_aps)
+  aps = _ap_objects(wlpc, fleet, fleet.Hostnames(count))
+  # ConfigPhyMac adds every AP configured to a module-level tree.
+  configs_lib.access_point_configs = configs_lib.openconfig_access_points()
+  durations = []
+  with _Quiet():
+    for ap in aps:
+      start = time.time()
+      configs_lib.ConfigPhyMac(ap, [ap.openssid, ap.pskssid])
+      durations.append(time.time() - start)
+  dumps = timeit.repeat(
+      lambda: configs_lib.pybindJSON.dumps(configs_lib.access_point_configs,
+                                           mode='ietf', indent=2),
+      number=1, repeat=args.dumps_repeat)
+  return [{'params': dict(params, configured_aps=count),
+           'latency_ms': _percentiles(durations),
+           'dumps_ms': _percentiles(dumps)}]
+
+
+def _bench_monitor(args, fleet, params):
+  # pylint: disable=protected-access
+  wlpc = _load_wlpc(args)
+  db = _StandInDb()
+  http = None
+  if args.sink == 'http':
+    http = _DiscardingHttp()
+    sink = sink_lib.LineProtocolSink(
+        sink_lib.HttpTransport('127.0.0.1', http.port, _DB))
+  else:
+    sink = sink_lib.BatchWriter(db)
+  wlpc._SINKS[_DB] = sink
+  aps = _ap_objects(wlpc, fleet, fleet.Hostnames(
+      min(params['fleet_size'], args.iterations)))
+  for ap in aps:  # Intent is in sync with the Target's config.
+    config_state = wlpc._get_many(ap, ['config_state'])['config_state']
+    intent = {'radios': {'radio': [
+        {'config': wlpc._radio0_config(config_state.json_ietf_val)}]}}
+    db.switch_database(_DB)
+    db.write_points([{'measurement': 'config_intent',
+                      'tags': {'ap_name': ap.ap_name},
+                      'fields': {'value': json.dumps(intent)}}])
+  phases = collections.OrderedDict(
+      (phase, []) for phase in ('get', 'write_db', 'config_diff',
+                                'channel_utilization', 'total'))
+  for i in range(args.warmup + args.iterations):
+    ap = aps[i % len(aps)]
+    times = [time.time()]
+    state = wlpc._get_many(ap, ['config_state', 'r0-cu'])
+    times.append(time.time())
+    wlpc._write_db(_DB, 'config_state', ap,
+                   state['config_state'].json_ietf_val)
+    times.append(time.time())
+    wlpc._radio0_sync(db, _DB, ap, wlpc._radio0_config(
+        state['config_state'].json_ietf_val))
+    times.append(time.time())
+    cu_state = gnmi_lib.DecodeLeaf(state['r0-cu'], 'total-channel-utilization')
+    wlpc._write_db(_DB, 'channel_utilization', ap, cu_state)
+    times.append(time.time())
+    if i < args.warmup:
+      continue
+    for phase, start, end in zip(phases, times, times[1:]):
+      phases[phase].append(end - start)
+    phases['total'].append(times[-1] - times[0])
+  wlpc._close_sinks()
+  if http:
+    http.Stop()
+  return [{'params': params, 'points_written': sink.written,
+           'latency_ms': dict((phase, _percentiles(durations))
+                              for phase, durations in phases.items())}]
+
+
+_FLEET_BENCHMARKS = collections.OrderedDict([
+    ('config_phy_mac', _bench_config_phy_mac),
+    ('get', _bench_get),
+    ('set', _bench_set),
+    ('monitor', _bench_monitor),
+])
+
+
+def _run(args):
+  """Runs the benchmarks selected; returns the list of results."""
+  results = []
+  if 'parse_path' in args.benchmarks:
+    for result in _bench_parse_path(args):
+      results.append(dict(result, benchmark='parse_path'))
+  selected = [name for name in _FLEET_BENCHMARKS if name in args.benchmarks]
+  skipped = set()
+  for fleet_size in args.fleet_sizes:
+    for clients in args.clients:
+      if not selected:
+        break
+      params = {'fleet_size': fleet_size, 'clients_per_ssid': clients,
+                'ssids_per_ap': args.ssids}
+      fleet = _Fleet(args, fleet_size, clients)
+      try:
+        for name in selected:
+          if name in skipped:
+            continue
+          try:
+            bench_results = _FLEET_BENCHMARKS[name](args, fleet, params)
+          except ImportError as e:
+            skipped.add(name)
+            results.append({'benchmark': name, 'skipped': str(e)})
+            print('%-15s skipped: %s' % (name, e))
+            continue
+          for result in bench_results:
+            results.append(dict(result, benchmark=name))
+            print('%-15s %s' % (name, json.dumps(result, sort_keys=True)))
+      finally:
+        fleet.Close()
+  return results
+
+
+def _int_list(text):
+  return [int(value) for value in text.split(',')]
+
+
+def _create_parser():
+  parser = argparse.ArgumentParser(
+      description='Benchmarks gnmi_lib, configs_lib and the monitor loop.')
+  parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                      type=lambda text: text.split(','),
+                      help='Comma separated benchmarks to run, of %s.' %
+                      ', '.join(BENCHMARKS))
+  parser.add_argument('--fleet_sizes', type=_int_list, default=[10, 1000],
+                      help='Comma separated access-point counts.')
+  parser.add_argument('--clients', type=_int_list, default=[0, 20],
+                      help='Comma separated clients per SSID (payload size).')
+  parser.add_argument('--ssids', type=int, default=2,
+                      help='SSIDs of every access-point.')
+  parser.add_argument('--iterations', type=int, default=200,
+                      help='Measured RPCs or loop iterations per run.')
+  parser.add_argument('--warmup', type=int, default=10,
+                      help='Unmeasured RPCs or loop iterations per run.')
+  parser.add_argument('--parse_iterations', type=int, default=20000,
+                      help='ParsePath calls per xpath.')
+  parser.add_argument('--max_config_aps', type=int, default=500,
+                      help='Most APs configured by ConfigPhyMac, whose cost '
+                      'grows with every AP configured.')
+  parser.add_argument('--dumps_repeat', type=int, default=5,
+                      help='pybindJSON.dumps calls timed.')
+  parser.add_argument('--target_latency', type=float, default=0.0,
+                      help='Seconds the fake Target adds to every answer.')
+  parser.add_argument('--rpc_timeout', type=float, default=10,
+                      help='rpc_timeout flag of wlpc-gnmi.')
+  parser.add_argument('--cert', default='client.crt',
+                      help='PEM certificate of the fake Target.')
+  parser.add_argument('--key', default='client.key',
+                      help='PEM private key of the certificate.')
+  parser.add_argument('--host_override', default='AP',
+                      help='Name the certificate is checked against.')
+  parser.add_argument('--sink', choices=('client', 'http'), default='client',
+                      help='sink_lib sink the monitor benchmark writes '
+                      'through; see the --sink flag of wlpc-gnmi.')
+  parser.add_argument('--output', default='gnmi_benchmark.json',
+                      help='File the JSON results are written to.')
+  return parser
+
+
+def main():
+  args = _create_parser().parse_args()
+  unknown = set(args.benchmarks) - set(BENCHMARKS)
+  if unknown:
+    sys.exit('Unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+  started = time.time()
+  results = _run(args)
+  report = {
+      'started': started,
+      'duration': time.time() - started,
+      'revision': _git_revision(),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'args': vars(args),
+      'results': results,
+  }
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+    f.write('\n')
+  print('Results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,30 +1,29 @@
 """Python3 library used for interacting with network elements using gNMI.
 
-This library used for Get and SetRequests using gNMI.
+This library used for Get, Set and Subscribe Requests using gNMI.
 """
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+import array
+import collections
+import hashlib
 import json
+import random
 import re
-import ssl
 import sys
+import threading
+import time
+import weakref
+import certs_lib
+import gnmi_metrics
+import six
 sys.path.insert(0, './gnmi/proto/gnmi_ext/')
 import gnmi_pb2
 import gnmi_pb2_grpc
 
 
-_RE_PATH_COMPONENT = re.compile(r'''
-^
-(?P<pname>[^[]+)  # gNMI path name
-(\[(?P<key>\w+)   # gNMI path key
-=
-(?P<value>.*)    # gNMI path value
-\])?$
-''', re.VERBOSE)
-
-
 class Error(Exception):
   """Module-level Exception class."""
 
@@ -33,20 +32,162 @@ class XpathError(Error):
   """Error parsing xpath provided."""
 
 
+class SubscribeError(Error):
+  """Error returned by the Target on a Subscribe stream."""
+
+
+class CircuitOpenError(Error):
+  """RPC not sent as the circuit breaker of the Target is open."""
+
+
+def _Escaped(text, i):
+  """Returns True if the character at text[i] is escaped with a backslash."""
+  backslashes = 0
+  while i > backslashes and text[i - backslashes - 1] == '\\':
+    backslashes += 1
+  return backslashes % 2 == 1
+
+
+def _Find(text, char, start):
+  """Returns the index of the next unescaped char in text, or -1."""
+  i = text.find(char, start)
+  while i != -1 and _Escaped(text, i):
+    i = text.find(char, i + 1)
+  return i
+
+
+def _Unescape(text):
+  """Removes the backslash escapes from text."""
+  if '\\' not in text:
+    return text
+  chars = []
+  escaped = False
+  for char in text:
+    if escaped or char != '\\':
+      chars.append(char)
+      escaped = False
+    else:
+      escaped = True
+  return ''.join(chars)
+
+
 def PathNames(xpath):
   """Parses the xpath names.
 
   This takes an input string and converts it to a list of gNMI Path names. Those
   are later turned into a gNMI Path Class object for use in the Get/SetRequests.
+  A '/' inside a [key=value] or escaped with a backslash does not split names.
   Args:
     xpath: (str) xpath formatted path.
 
   Returns:
     list of gNMI path names.
+
+  Raises:
+    XpathError: A [key=value] is not terminated.
   """
   if not xpath or xpath == '/':  # A blank xpath was provided at CLI.
     return []
-  return xpath.strip().strip('/').split('/')  # Remove leading and trailing '/'.
+  xpath = xpath.strip().strip('/')  # Remove leading and trailing '/'.
+  if '\\' in xpath:
+    return _SplitEscaped(xpath)
+  parts = xpath.split('/')
+  if '[' not in xpath:
+    return parts
+  # Re-join the parts of a key value that contains a '/'. Without escapes, a
+  # key is still open if the last bracket of the name so far is a '['.
+  names = []
+  open_key = None
+  for part in parts:
+    if open_key is not None:
+      part = open_key + '/' + part
+    if '[' in part and part.rfind('[') > part.rfind(']'):
+      open_key = part
+    else:
+      open_key = None
+      names.append(part)
+  if open_key is not None:
+    raise XpathError('xpath key not terminated: %s' % open_key)
+  return names
+
+
+def _SplitEscaped(xpath):
+  """Splits an xpath containing backslash escapes into path names."""
+  names = []
+  start = pos = 0
+  while True:
+    slash = _Find(xpath, '/', pos)
+    bracket = _Find(xpath, '[', pos)
+    if bracket != -1 and (slash == -1 or bracket < slash):
+      pos = _Find(xpath, ']', bracket)  # Skip over the key value.
+      if pos == -1:
+        raise XpathError('xpath key not terminated: %s' % xpath[bracket:])
+      continue
+    if slash == -1:
+      names.append(xpath[start:])
+      return names
+    names.append(xpath[start:slash])
+    start = pos = slash + 1
+
+
+def _TokenizeNames(p_names):
+  """Splits path names into their name and [key=value] keys.
+
+  Args:
+    p_names: (list) of path names, eg. ['radios', 'radio[id=0]', 'a[k=v][j=w]'].
+
+  Returns:
+    list of (name, keys) tuples; keys is a dict of key name to value.
+
+  Raises:
+    XpathError: Unabled to parse a path name provided.
+  """
+  tokens = []
+  append = tokens.append
+  for word in p_names:
+    if '\\' in word:
+      append(_TokenizeEscapedElem(word))
+      continue
+    name, bracket, rest = word.partition('[')
+    if not bracket:
+      if not word:
+        raise XpathError('xpath component parse error: empty path name')
+      append((word, {}))
+      continue
+    if name and rest[-1:] == ']':
+      keys = {}
+      # Without escapes a key value cannot hold a ']', so '][' separates keys;
+      # any other ']', as in a[k=x]y], leaves one in a key or value.
+      for key_value in rest[:-1].split(']['):
+        key, equals, value = key_value.partition('=')
+        if not key or not equals or '[' in key or ']' in key or ']' in value:
+          break
+        keys[key] = value
+      else:
+        append((name, keys))
+        continue
+    raise XpathError('xpath component parse error: %s' % word)
+  return tokens
+
+
+def _TokenizeEscapedElem(word):
+  """Splits a path name containing backslash escapes; see _TokenizeNames."""
+  bracket = _Find(word, '[', 0)
+  if bracket == -1:
+    return _Unescape(word), {}
+  if bracket == 0:
+    raise XpathError('xpath component parse error: %s' % word)
+  keys = {}
+  pos = bracket
+  while pos < len(word):
+    equals = word.find('=', pos)
+    end = _Find(word, ']', equals + 1)
+    if (word[pos] != '[' or equals in (-1, pos + 1) or end == -1 or
+        word.find(']', pos, equals) != -1):
+      raise XpathError('xpath component parse error: %s' % word)
+    keys[word[pos + 1:equals]] = _Unescape(word[equals + 1:end])
+    pos = end + 1
+  return _Unescape(word[:bracket]), keys
 
 
 def ParsePath(p_names):
@@ -61,20 +202,230 @@ def ParsePath(p_names):
   Raises:
     XpathError: Unabled to parse the xpath provided.
   """
-  gnmi_elems = []
-  for word in p_names:
-    word_search = _RE_PATH_COMPONENT.search(word)
-    if not word_search:  # Invalid path specified.
-      raise XpathError('xpath component parse error: %s' % word)
-    if word_search.group('key') is not None:  # A path key was provided.
-      gnmi_elems.append(gnmi_pb2.PathElem(name=word_search.group(
-          'pname'), key={word_search.group('key'): word_search.group('value')}))
+  path = gnmi_pb2.Path()
+  add_elem = path.elem.add
+  for name, keys in _TokenizeNames(p_names):
+    if keys:
+      add_elem(name=name).key.update(keys)
     else:
-      gnmi_elems.append(gnmi_pb2.PathElem(name=word, key={}))
-  return gnmi_pb2.Path(elem=gnmi_elems)
+      add_elem(name=name)
+  return path
+
+
+class _LruCache(object):
+  """Small thread-safe least-recently-used cache."""
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  def Get(self, key, factory):
+    """Returns the cached value for key, calling factory() on a miss."""
+    with self._lock:
+      value = self._entries.pop(key, None)
+      if value is None:
+        value = factory()
+        if len(self._entries) >= self.max_size:
+          self._entries.popitem(last=False)
+      self._entries[key] = value  # (Re)inserted as most recently used.
+      return value
+
+  def __len__(self):
+    return len(self._entries)
+
+
+class PathTemplate(object):
+  """An xpath parsed once, with {placeholders} in its key values.
+
+  Only the key values are substituted per call, and fully materialized Paths
+  are kept in an LRU cache, so building the Path for a polling loop costs a
+  dict lookup rather than an xpath parse.
+
+  Example:
+    r_state = PathTemplate('/access-points/access-point[hostname={h}]/'
+                           'radios/radio[id={r}]/state')
+    paths = r_state.Path(h='ap-01.example.net', r=0)
+
+  Paths returned are shared by all callers and must not be modified.
+  """
+
+  def __init__(self, template, cache_size=4096):
+    """Parses the template.
+
+    Args:
+      template: (str) xpath formatted path, eg. '/a/b[name={name}]/c'.
+      cache_size: (int) Number of materialized Paths to keep.
+
+    Raises:
+      XpathError: Unabled to parse the xpath provided.
+    """
+    self.template = template
+    # [(name, [(key, value, is_placeholder)])], one tuple per PathElem.
+    self._elems = []
+    for elem in ParsePath(PathNames(template)).elem:
+      keys = [(k, v, '{' in v) for k, v in sorted(elem.key.items())]
+      self._elems.append((elem.name, keys))
+    self._cache = _LruCache(cache_size)
+
+  def _Build(self, values):
+    path = gnmi_pb2.Path()
+    for name, keys in self._elems:
+      elem = path.elem.add(name=name)
+      for key, value, is_placeholder in keys:
+        elem.key[key] = value.format(**values) if is_placeholder else value
+    return path, PathToXpath(path)
+
+  def _Materialize(self, values):
+    return self._cache.Get(tuple(sorted(values.items())),
+                           lambda: self._Build(values))
+
+  def Path(self, **values):
+    """Returns the gnmi_pb2.Path with placeholders substituted by values."""
+    return self._Materialize(values)[0]
+
+  def Xpath(self, **values):
+    """Returns the canonical xpath (see PathToXpath) of Path(**values)."""
+    return self._Materialize(values)[1]
+
+
+def _Unwrap(stub):
+  """Returns the Stub a wrapper, eg. record_lib.RecordingStub, delegates to."""
+  return getattr(stub, 'wrapped_stub', stub)
+
+
+class ChannelPool(object):
+  """Process-wide pool of gRPC channels shared by gNMI Stubs.
+
+  Channels are keyed by (target, port, host_override, credential
+  fingerprint), so every AP behind the same ap-manager shares one HTTP/2
+  connection and TLS handshake. Channels are reference counted by the Stubs
+  handed out, and closed once they have been unused for max_idle seconds.
+  """
+
+  def __init__(self, max_idle=300):
+    """Initializes the pool.
+
+    Args:
+      max_idle: (int) Seconds an unreferenced channel is kept open for.
+    """
+    self.max_idle = max_idle
+    self._lock = threading.Lock()
+    self._channels = {}  # key: [channel, refcount, idle_since]
+    self._stub_keys = weakref.WeakKeyDictionary()
+
+  def Acquire(self, key, channel_factory, auth=None):
+    """Returns a gNMI Stub on the pooled channel for key.
+
+    Args:
+      key: (tuple) Identifies the channel.
+      channel_factory: (callable) Returns a new channel when none is pooled.
+      auth: (StaticAuth or TokenAuth) Optional authentication of every RPC
+        sent by the Stub.
+
+    Returns:
+      a gnmi_pb2_grpc.gNMIStub object.
+    """
+    with self._lock:
+      self._EvictIdle(time.time())
+      entry = self._channels.get(key)
+      if entry is None:
+        entry = self._channels[key] = [channel_factory(), 0, None]
+      entry[1] += 1
+      entry[2] = None
+      channel = entry[0]
+      if auth is not None:
+        channel = gnmi_pb2_grpc.grpc.intercept_channel(
+            channel, AuthInterceptor(auth))
+      stub = gnmi_pb2_grpc.gNMIStub(channel)
+      self._stub_keys[stub] = key
+      return stub
+
+  def Release(self, stub):
+    """Drops the reference a Stub holds on its channel.
+
+    Args:
+      stub: (gNMIStub) returned by Acquire().
+    """
+    with self._lock:
+      self._Unref(self._stub_keys.pop(_Unwrap(stub), None))
+      self._EvictIdle(time.time())
 
+  def Rebind(self, stub, key, channel_factory, auth=None):
+    """Moves a Stub, in place, to the pooled channel for key.
 
-def CreateCreds(target, port, get_cert, root_cert, cert_chain, private_key):
+    Every holder of the Stub, including wrappers, then sends its RPCs over
+    the new channel; the reference on the old one is dropped.
+
+    Args:
+      stub: (gNMIStub) returned by Acquire().
+      key: (tuple) Identifies the new channel.
+      channel_factory: (callable) Returns a new channel when none is pooled.
+      auth: (StaticAuth or TokenAuth) As passed to Acquire().
+    """
+    stub = _Unwrap(stub)
+    with self._lock:
+      entry = self._channels.get(key)
+      if entry is None:
+        entry = self._channels[key] = [channel_factory(), 0, None]
+      entry[1] += 1
+      entry[2] = None
+      channel = entry[0]
+      if auth is not None:
+        channel = gnmi_pb2_grpc.grpc.intercept_channel(
+            channel, AuthInterceptor(auth))
+      gnmi_pb2_grpc.gNMIStub.__init__(stub, channel)
+      self._Unref(self._stub_keys.get(stub))
+      self._stub_keys[stub] = key
+
+  def _Unref(self, key):
+    entry = self._channels.get(key)
+    if entry is not None:
+      entry[1] -= 1
+      if entry[1] <= 0:
+        entry[2] = time.time()
+
+  def KeyFor(self, stub):
+    """Returns the pool key of the channel a Stub is using, or None."""
+    return self._stub_keys.get(_Unwrap(stub))
+
+  def ChannelFor(self, stub):
+    """Returns the pooled channel a Stub is using, or None."""
+    entry = self._channels.get(self._stub_keys.get(_Unwrap(stub)))
+    return entry[0] if entry else None
+
+  def __len__(self):
+    return len(self._channels)
+
+  def _EvictIdle(self, now):
+    for key, (channel, _, idle_since) in list(self._channels.items()):
+      if idle_since is not None and now - idle_since >= self.max_idle:
+        del self._channels[key]
+        channel.close()
+
+
+_CHANNEL_POOL = ChannelPool()
+_CREDS_FINGERPRINTS = weakref.WeakKeyDictionary()
+# Credentials whose root certificate was obtained from the Target: the
+# (target, port, cert_chain, private_key) to obtain it again with.
+_CERT_SOURCES = weakref.WeakKeyDictionary()
+# Stub built by CreateStub: (creds, target, port, host_override, options, auth).
+_STUB_ORIGINS = weakref.WeakKeyDictionary()
+
+
+def _Fingerprint(*materials):
+  """Returns a sha256 hex digest identifying credential materials."""
+  digest = hashlib.sha256()
+  for material in materials:
+    if isinstance(material, six.text_type):
+      material = material.encode('utf-8')
+    digest.update(material or b'')
+    digest.update(b'\0')
+  return digest.hexdigest()
+
+
+def CreateCreds(target, port, get_cert, root_cert, cert_chain, private_key,
+                refresh=False):
   """Define credentials used in gNMI Requests.
 
   Args:
@@ -84,82 +435,2000 @@ def CreateCreds(target, port, get_cert, root_cert, cert_chain, private_key):
     root_cert: (str) Root certificate to use in the gRPC channel.
     cert_chain: (str) Certificate chain to use in the gRPC channel.
     private_key: (str) Private key to use in the gRPC channel.
+    refresh: (bool) Re-obtain the certificate from the Target rather than
+      using the one in certs_lib.CERT_CACHE, eg. after a failed handshake.
 
   Returns:
     a gRPC.ssl_channel_credentials object.
   """
   if get_cert:
-    print('Obtaining certificate from Target')
-    rcert = ssl.get_server_certificate((target, port)).encode('utf-8')
-    return gnmi_pb2_grpc.grpc.ssl_channel_credentials(
-        root_certificates=rcert, private_key=private_key,
-        certificate_chain=cert_chain)
-  return gnmi_pb2_grpc.grpc.ssl_channel_credentials(
+    root_cert = certs_lib.CERT_CACHE.Get(target, port, refresh)
+  creds = gnmi_pb2_grpc.grpc.ssl_channel_credentials(
     root_certificates=root_cert, private_key=private_key,
     certificate_chain=cert_chain)
+  _CREDS_FINGERPRINTS[creds] = _Fingerprint(root_cert, cert_chain, private_key)
+  if get_cert:
+    _CERT_SOURCES[creds] = (target, port, cert_chain, private_key)
+  return creds
+
+
+class ChannelOptions(collections.namedtuple('ChannelOptions', [
+    'compression', 'max_receive_message_length', 'keepalive_time_ms',
+    'keepalive_timeout_ms', 'keepalive_permit_without_calls',
+    'http2_initial_window_size', 'http2_bdp_probe',
+    'initial_reconnect_backoff_ms', 'max_reconnect_backoff_ms'])):
+  """Tuning options applied to the gRPC channel of a gNMI Stub.
+
+  Every option defaults to None, which leaves the gRPC default in place.
+
+  Attributes:
+    compression: (str) 'gzip' or 'deflate' compression of requests; also
+      advertised to the Target, which may then compress its responses.
+    max_receive_message_length: (int) Largest response accepted, in bytes.
+    keepalive_time_ms: (int) Interval between HTTP/2 keepalive pings.
+    keepalive_timeout_ms: (int) Time to wait for a keepalive ping ack.
+    keepalive_permit_without_calls: (bool) Ping even with no RPC in flight.
+    http2_initial_window_size: (int) Initial HTTP/2 stream window, in bytes.
+    http2_bdp_probe: (bool) Grow the window by probing bandwidth-delay product.
+    initial_reconnect_backoff_ms: (int) First backoff after a lost connection.
+    max_reconnect_backoff_ms: (int) Largest backoff between reconnections.
+  """
+  __slots__ = ()
+
+  _COMPRESSION = {'deflate': 1, 'gzip': 2}
+  _ARGS = (
+      ('max_receive_message_length', 'grpc.max_receive_message_length'),
+      ('keepalive_time_ms', 'grpc.keepalive_time_ms'),
+      ('keepalive_timeout_ms', 'grpc.keepalive_timeout_ms'),
+      ('keepalive_permit_without_calls',
+       'grpc.keepalive_permit_without_calls'),
+      ('http2_initial_window_size', 'grpc.http2.lookahead_bytes'),
+      ('http2_bdp_probe', 'grpc.http2.bdp_probe'),
+      ('initial_reconnect_backoff_ms', 'grpc.initial_reconnect_backoff_ms'),
+      ('max_reconnect_backoff_ms', 'grpc.max_reconnect_backoff_ms'),
+  )
+
+  def __new__(cls, compression=None, max_receive_message_length=None,
+              keepalive_time_ms=None, keepalive_timeout_ms=None,
+              keepalive_permit_without_calls=None,
+              http2_initial_window_size=None, http2_bdp_probe=None,
+              initial_reconnect_backoff_ms=None, max_reconnect_backoff_ms=None):
+    if compression is not None and compression not in cls._COMPRESSION:
+      raise ValueError('compression must be one of %s, not %s' % (
+          sorted(cls._COMPRESSION), compression))
+    return super(ChannelOptions, cls).__new__(
+        cls, compression, max_receive_message_length, keepalive_time_ms,
+        keepalive_timeout_ms, keepalive_permit_without_calls,
+        http2_initial_window_size, http2_bdp_probe,
+        initial_reconnect_backoff_ms, max_reconnect_backoff_ms)
+
+  def ChannelArgs(self):
+    """Returns the options as a list of gRPC channel arguments."""
+    args = []
+    if self.compression:
+      args.append(('grpc.default_compression_algorithm',
+                   self._COMPRESSION[self.compression]))
+    for field, arg in self._ARGS:
+      value = getattr(self, field)
+      if value is not None:
+        args.append((arg, int(value)))
+    return args
+
+
+class StaticAuth(object):
+  """username/password authentication, attached to every RPC of a channel.
+
+  The metadata is built once, and shared by every call.
+  """
+
+  def __init__(self, username, password):
+    self.metadata = (('username', username), ('password', password))
+
+
+class TokenAuth(object):
+  """Token authentication, refreshed by a background thread.
+
+  RPCs always carry the last token obtained; a failed refresh keeps the
+  previous token until the next attempt succeeds.
+  """
+
+  def __init__(self, fetch_token, refresh_interval=300,
+               header='authorization', scheme='Bearer'):
+    """Obtains the first token and starts the refresh thread.
+
+    Args:
+      fetch_token: (callable) Returns a new token (str).
+      refresh_interval: (float) Seconds between refreshes.
+      header: (str) Metadata key carrying the token.
+      scheme: (str) Prefixed to the token, or None to send it as is.
+    """
+    self._fetch_token = fetch_token
+    self._header = header
+    self._scheme = scheme
+    self.refresh_interval = refresh_interval
+    self.last_error = None
+    self.metadata = self._Metadata(fetch_token())
+    self._stop = threading.Event()
+    refresher = threading.Thread(target=self._Refresh)
+    refresher.daemon = True
+    refresher.start()
+
+  def _Metadata(self, token):
+    value = '%s %s' % (self._scheme, token) if self._scheme else token
+    return ((self._header, value),)
+
+  def _Refresh(self):
+    while not self._stop.wait(self.refresh_interval):
+      try:
+        # Replacing the tuple is atomic; calls in flight keep the old one.
+        self.metadata = self._Metadata(self._fetch_token())
+        self.last_error = None
+      except Exception as e:  # pylint: disable=broad-except
+        self.last_error = e
+
+  def Close(self):
+    """Stops the refresh thread."""
+    self._stop.set()
+
+
+class _CallDetails(
+    collections.namedtuple('_CallDetails', [
+        'method', 'timeout', 'metadata', 'credentials', 'wait_for_ready',
+        'compression']),
+    gnmi_pb2_grpc.grpc.ClientCallDetails):
+  """grpc.ClientCallDetails with the authentication metadata attached."""
+
+
+class AuthInterceptor(gnmi_pb2_grpc.grpc.UnaryUnaryClientInterceptor,
+                      gnmi_pb2_grpc.grpc.UnaryStreamClientInterceptor,
+                      gnmi_pb2_grpc.grpc.StreamUnaryClientInterceptor,
+                      gnmi_pb2_grpc.grpc.StreamStreamClientInterceptor):
+  """Attaches the metadata of a StaticAuth or TokenAuth to every RPC."""
+
+  def __init__(self, auth):
+    self._auth = auth
+
+  def _Details(self, details):
+    metadata = self._auth.metadata
+    if details.metadata:
+      metadata = tuple(details.metadata) + metadata
+    return _CallDetails(details.method, details.timeout, metadata,
+                        details.credentials,
+                        getattr(details, 'wait_for_ready', None),
+                        getattr(details, 'compression', None))
+
+  def intercept_unary_unary(self, continuation, details, request):
+    return continuation(self._Details(details), request)
+
+  def intercept_unary_stream(self, continuation, details, request):
+    return continuation(self._Details(details), request)
+
+  def intercept_stream_unary(self, continuation, details, request_iterator):
+    return continuation(self._Details(details), request_iterator)
+
+  def intercept_stream_stream(self, continuation, details, request_iterator):
+    return continuation(self._Details(details), request_iterator)
+
+
+def ChannelKey(creds, target, port, host_override, options=None):
+  """Returns the key identifying the channel of a Stub.
+
+  Stubs built with equal keys may share a channel; see CreateStub().
+
+  Args:
+    creds: (object) of gNMI Credentials class used to build the secure channel.
+    target: (str) gNMI Target.
+    port: (str) gNMI Target IP port.
+    host_override: (str) Hostname being overridden for Cert check.
+    options: (ChannelOptions) Optional compression and channel tuning.
+
+  Returns:
+    a hashable key.
+  """
+  # Credentials not built by CreateCreds are only shared with themselves.
+  fingerprint = _CREDS_FINGERPRINTS.get(creds, id(creds))
+  return target, port, host_override, fingerprint, options
+
+
+def ChannelArgs(host_override, options=None):
+  """Returns the arguments CreateStub builds a channel with.
+
+  Args:
+    host_override: (str) Hostname being overridden for Cert check.
+    options: (ChannelOptions) Optional compression and channel tuning.
+
+  Returns:
+    list of (name, value) gRPC channel arguments, or None.
+  """
+  args = options.ChannelArgs() if options else []
+  if host_override:
+    args.append(('grpc.ssl_target_name_override', host_override,))
+  return args or None
 
 
-def CreateStub(creds, target, port, host_override):
+def CreateStub(creds, target, port, host_override, options=None, auth=None):
   """Creates a gNMI Stub.
 
+  Stubs to the same Target built from the same credentials and options share
+  a single pooled channel; call ReleaseStub() once a Stub is no longer used.
+  When the certificate of creds was obtained from the Target (see
+  CreateCreds) and an RPC fails its TLS handshake, the certificate is
+  obtained again and the Stub moved to a channel trusting it.
+
   Args:
     creds: (object) of gNMI Credentials class used to build the secure channel.
     target: (str) gNMI Target.
     port: (str) gNMI Target IP port.
     host_override: (str) Hostname being overridden for Cert check.
+    options: (ChannelOptions) Optional compression and channel tuning.
+    auth: (StaticAuth or TokenAuth) Authentication attached to every RPC of
+      the Stub, in which case username and password need not be passed to
+      Get, Set or Subscribe.
 
   Returns:
     a gnmi_pb2_grpc object representing a gNMI Stub.
   """
-  if host_override:
-    channel = gnmi_pb2_grpc.grpc.secure_channel(target + ':' + port, creds, ((
-        'grpc.ssl_target_name_override', host_override,),))
-  else:
-    channel = gnmi_pb2_grpc.grpc.secure_channel(target + ':' + port, creds)
-  return gnmi_pb2_grpc.gNMIStub(channel)
+  stub = _CHANNEL_POOL.Acquire(
+      ChannelKey(creds, target, port, host_override, options),
+      _ChannelFactory(creds, target, port, host_override, options), auth)
+  _STUB_ORIGINS[stub] = (creds, target, port, host_override, options, auth)
+  return stub
 
 
-def Get(stub, paths, username, password):
-  """Create a gNMI GetRequest.
+def _ChannelFactory(creds, target, port, host_override, options):
+  """Returns a callable building the channel of CreateStub."""
+  def _Channel():
+    return gnmi_pb2_grpc.grpc.secure_channel(
+        target + ':' + port, creds, ChannelArgs(host_override, options))
+  return _Channel
+
+
+def ReleaseStub(stub):
+  """Releases a Stub built by CreateStub, closing its channel once idle.
+
+  Args:
+    stub: (gNMIStub) gNMI Stub returned by CreateStub.
+  """
+  _CHANNEL_POOL.Release(stub)
+
+
+_HANDSHAKE_FAILURE = re.compile(r'handshake failed|SSL_ERROR', re.I)
+
+
+def _RefreshCert(stub, error):
+  """Moves a Stub to a channel trusting the certificate its Target presents.
+
+  Only done when error is a failed TLS handshake, and the certificate of the
+  Stub's credentials was obtained from the Target, which may since have
+  presented another one; see CreateCreds.
+
+  Args:
+    stub: (gNMIStub) gNMI Stub returned by CreateStub.
+    error: (grpc.RpcError) Error of an RPC sent over the Stub.
+
+  Returns:
+    True if the Stub was moved, and so the RPC is worth sending again.
+  """
+  if (error.code() != _StatusCode.UNAVAILABLE or
+      not _HANDSHAKE_FAILURE.search(error.details() or '')):
+    return False
+  origin = _STUB_ORIGINS.get(_Unwrap(stub))
+  source = origin and _CERT_SOURCES.get(origin[0])
+  if source is None:
+    return False
+  creds, target, port, host_override, options, auth = origin
+  try:
+    new_creds = CreateCreds(source[0], source[1], True, None, source[2],
+                            source[3], refresh=True)
+  except certs_lib.Error:
+    return False
+  if _CREDS_FINGERPRINTS[new_creds] == _CREDS_FINGERPRINTS[creds]:
+    return False  # Not a stale certificate.
+  _CHANNEL_POOL.Rebind(
+      stub, ChannelKey(new_creds, target, port, host_override, options),
+      _ChannelFactory(new_creds, target, port, host_override, options), auth)
+  _STUB_ORIGINS[_Unwrap(stub)] = (new_creds, target, port, host_override,
+                                  options, auth)
+  return True
+
+
+_StatusCode = gnmi_pb2_grpc.grpc.StatusCode
+# Codes meaning the Target could not be reached or did not answer in time, as
+# opposed to the Target answering with an error.
+_TRANSPORT_FAILURES = frozenset([_StatusCode.UNAVAILABLE,
+                                 _StatusCode.DEADLINE_EXCEEDED])
+
+
+class RetryPolicy(object):
+  """Retries of an idempotent RPC, with capped exponential backoff.
+
+  The delay before retry n is drawn uniformly from [0, min(max_backoff,
+  initial_backoff * multiplier ** n)] ("full jitter"), so that the clients of a
+  Target which just came back do not all retry at the same instant.
+  """
+
+  def __init__(self, max_attempts=3, initial_backoff=0.2, max_backoff=5.0,
+               multiplier=2.0, retryable_codes=_TRANSPORT_FAILURES):
+    """Initializes the policy.
+
+    Args:
+      max_attempts: (int) Attempts made in total, including the first one.
+      initial_backoff: (float) Upper bound of the first delay, in seconds.
+      max_backoff: (float) Upper bound of any delay, in seconds.
+      multiplier: (float) Growth of the upper bound after each attempt.
+      retryable_codes: (frozenset) of grpc.StatusCode worth retrying.
+    """
+    self.max_attempts = max(1, max_attempts)
+    self.initial_backoff = initial_backoff
+    self.max_backoff = max_backoff
+    self.multiplier = multiplier
+    self.retryable_codes = frozenset(retryable_codes)
+
+  def Backoff(self, attempt):
+    """Returns the seconds to wait after the failure of attempt (from 0)."""
+    cap = min(self.max_backoff,
+              self.initial_backoff * self.multiplier ** attempt)
+    return random.uniform(0, cap)
+
+  def ShouldRetry(self, attempt, code):
+    """Whether to retry after attempt (from 0) failed with code."""
+    return attempt + 1 < self.max_attempts and code in self.retryable_codes
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+DEFAULT_RETRY = RetryPolicy()
+
+
+class CircuitBreaker(object):
+  """Sheds RPCs to a Target which keeps failing to answer.
+
+  After failure_threshold consecutive transport failures (UNAVAILABLE or
+  DEADLINE_EXCEEDED) the circuit opens, and RPCs fail immediately with
+  CircuitOpenError instead of waiting for their deadline. Once reset_timeout
+  seconds have passed a single trial RPC is let through: the circuit closes if
+  it succeeds, and opens again if it fails.
+  """
+
+  CLOSED = 'closed'
+  OPEN = 'open'
+  HALF_OPEN = 'half-open'
+
+  def __init__(self, failure_threshold=5, reset_timeout=30):
+    """Initializes a closed circuit.
+
+    Args:
+      failure_threshold: (int) Consecutive failures which open the circuit.
+      reset_timeout: (float) Seconds the circuit stays open for.
+    """
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self._lock = threading.Lock()
+    self._state = self.CLOSED
+    self._failures = 0
+    self._opened_at = None
+
+  @property
+  def state(self):
+    with self._lock:
+      if (self._state == self.OPEN and
+          time.time() - self._opened_at >= self.reset_timeout):
+        return self.HALF_OPEN
+      return self._state
+
+  def Allow(self):
+    """Returns whether an RPC may be sent, claiming the trial RPC if due."""
+    with self._lock:
+      if self._state == self.CLOSED:
+        return True
+      if (self._state == self.OPEN and
+          time.time() - self._opened_at >= self.reset_timeout):
+        self._state = self.HALF_OPEN
+        return True
+      return False  # Open, or the trial RPC is already in flight.
+
+  def RecordSuccess(self):
+    with self._lock:
+      self._state = self.CLOSED
+      self._failures = 0
+
+  def RecordFailure(self):
+    with self._lock:
+      self._failures += 1
+      if (self._state == self.HALF_OPEN or
+          self._failures >= self.failure_threshold):
+        self._state = self.OPEN
+        self._opened_at = time.time()
+
+  def Record(self, code):
+    """Records the outcome of an RPC which ended with grpc.StatusCode code."""
+    if code in _TRANSPORT_FAILURES:
+      self.RecordFailure()
+    else:
+      self.RecordSuccess()  # The Target answered, even if with an error.
+
+
+_BREAKERS_LOCK = threading.Lock()
+_BREAKERS = {}  # Pooled channel key: CircuitBreaker.
+_STUB_BREAKERS = weakref.WeakKeyDictionary()  # Unpooled stub: CircuitBreaker.
+
+
+def CircuitBreakerFor(stub, key=None):
+  """Returns the CircuitBreaker of a Stub's Target.
+
+  Stubs sharing a pooled channel share a breaker, as they reach the same
+  Target over the same connection.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    key: (tuple) ChannelKey of a Stub whose channel is not pooled, eg. a
+      grpc.aio channel, to share the breaker of the pooled channel with.
+
+  Returns:
+    a CircuitBreaker object.
+  """
+  if key is None:
+    key = _CHANNEL_POOL.KeyFor(stub)
+  with _BREAKERS_LOCK:
+    if key is None:
+      return _STUB_BREAKERS.setdefault(stub, CircuitBreaker())
+    return _BREAKERS.setdefault(key, CircuitBreaker())
+
+
+_COLLECTOR = gnmi_metrics.NullCollector()
+
+
+def SetCollector(collector):
+  """Sets the collector RPC metrics are reported to; see gnmi_metrics.
+
+  Args:
+    collector: (gnmi_metrics.NullCollector) or a subclass of it.
+
+  Returns:
+    the collector previously set.
+  """
+  global _COLLECTOR
+  previous, _COLLECTOR = _COLLECTOR, collector
+  return previous
+
+
+def _TargetLabel(stub, key=None):
+  """Returns the 'target:port' of a Stub's channel, for errors and metrics."""
+  if key is None:
+    key = _CHANNEL_POOL.KeyFor(stub)
+  return '%s:%s' % key[:2] if key else 'unknown'
+
+
+def _ObserveDecode(stub, rpc, start):
+  if _COLLECTOR.enabled:
+    _COLLECTOR.ObserveDecode(_TargetLabel(stub), rpc, time.time() - start)
+
+
+def _CheckCircuit(stub, breaker, rpc, key=None):
+  if not breaker.Allow():
+    if _COLLECTOR.enabled:
+      _COLLECTOR.CountStatus(_TargetLabel(stub, key), rpc, 'CIRCUIT_OPEN')
+    raise CircuitOpenError('Circuit open for %s after repeated failures' %
+                           _TargetLabel(stub, key))
+
+
+class RpcAttempts(object):
+  """The attempts at a unary RPC, as recorded in its Target's CircuitBreaker.
+
+  Each attempt is checked against the breaker, and its outcome recorded in
+  the breaker and the collector. Shared by the sync API and gnmi_async_lib,
+  so that both see the same breaker state, retries and metrics:
+
+    attempts = RpcAttempts(stub, 'Get', request, retry)
+    while True:
+      attempts.Start()
+      try:
+        response = stub.Get(request, timeout=timeout)
+      except grpc.RpcError as e:
+        attempts.Failed(e)
+        delay = attempts.Retry(e)
+        if delay is None:
+          raise
+        time.sleep(delay)
+        continue
+      attempts.Succeeded(response)
+      return response
+  """
+
+  def __init__(self, stub, method, request, retry=NO_RETRY, key=None):
+    """Initializes the attempts.
+
+    Args:
+      stub: (class) gNMI Stub used to build the secure channel.
+      method: (str) Name of the Stub method, eg. 'Get'.
+      request: the request message.
+      retry: (RetryPolicy) Only pass a policy retrying for idempotent RPCs.
+      key: (tuple) ChannelKey of a Stub whose channel is not pooled; see
+        CircuitBreakerFor().
+    """
+    self.stub = stub
+    self.method = method
+    self.request = request
+    self.retry = retry
+    self.attempt = 0
+    self._key = key
+    self._collector = _COLLECTOR
+    self._target = (_TargetLabel(stub, key) if self._collector.enabled else
+                    None)
+    self._start = None
+    self.Rebound()
+
+  def Rebound(self):
+    """Looks up the breaker again, after the Stub moved to another channel."""
+    self.breaker = CircuitBreakerFor(self.stub, self._key)
+
+  def Start(self):
+    """Starts an attempt.
+
+    Raises:
+      CircuitOpenError: The circuit breaker of the Target is open.
+    """
+    _CheckCircuit(self.stub, self.breaker, self.method, self._key)
+    self._start = time.time()
+
+  def Failed(self, error):
+    """Records the failure of the attempt.
+
+    Args:
+      error: (grpc.RpcError) the attempt failed with.
+    """
+    self.breaker.Record(error.code())
+    if self._collector.enabled:
+      self._collector.ObserveLatency(self._target, self.method,
+                                     time.time() - self._start)
+      self._collector.CountStatus(self._target, self.method,
+                                  error.code().name)
+
+  def Retry(self, error):
+    """Whether to retry after the attempt failed with error.
+
+    Args:
+      error: (grpc.RpcError) the attempt failed with.
+
+    Returns:
+      (float) Seconds to wait before the next attempt, or None if it is not
+      to be retried.
+    """
+    if not self.retry.ShouldRetry(self.attempt, error.code()):
+      return None
+    delay = self.retry.Backoff(self.attempt)
+    self.attempt += 1
+    return delay
+
+  def Succeeded(self, response):
+    """Records the success of the attempt, which answered response."""
+    self.breaker.RecordSuccess()
+    if self._collector.enabled:
+      self._collector.ObserveLatency(self._target, self.method,
+                                     time.time() - self._start)
+      self._collector.ObserveBytes(self._target, self.method,
+                                   self.request.ByteSize(),
+                                   response.ByteSize())
+      self._collector.CountStatus(self._target, self.method, 'OK')
+
+
+def _Invoke(stub, method, request, username, password, timeout=None,
+            retry=NO_RETRY):
+  """Sends a unary RPC with a deadline, retries and the circuit breaker.
 
   Args:
     stub: (class) gNMI Stub used to build the secure channel.
-    paths: gNMI Path
+    method: (str) Name of the Stub method, eg. 'Get'.
+    request: the request message.
     username: (str) Username used when building the channel.
     password: (str) Password used when building the channel.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (RetryPolicy) Only pass a policy retrying for idempotent RPCs.
 
   Returns:
-    a gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+    the response message.
+
+  Raises:
+    CircuitOpenError: The circuit breaker of the Target is open.
+    grpc.RpcError: The last attempt failed.
   """
-  if username and password:  # User/pass supplied for Authentication.
-    return stub.Get(
-        gnmi_pb2.GetRequest(path=[paths], encoding='JSON_IETF'),
-        metadata=[('username', username), ('password', password)])
-  return stub.Get(gnmi_pb2.GetRequest(path=[paths], encoding='JSON_IETF'))
+  attempts = RpcAttempts(stub, method, request, retry)
+  call = getattr(stub, method)
+  kwargs = Metadata(username, password)
+  refreshed = False
+  while True:
+    attempts.Start()
+    try:
+      response = call(request, timeout=timeout, **kwargs)
+    except gnmi_pb2_grpc.grpc.RpcError as e:
+      attempts.Failed(e)
+      if not refreshed and _RefreshCert(stub, e):
+        refreshed = True  # Once per call, and not counted as a retry.
+        attempts.Rebound()
+        call = getattr(stub, method)
+        continue
+      delay = attempts.Retry(e)
+      if delay is None:
+        raise
+      time.sleep(delay)
+      continue
+    attempts.Succeeded(response)
+    return response
 
 
-def Set(stub, paths, username, password, json_value, set_type):
-  """Create a gNMI SetRequest.
+def Capabilities(stub, username=None, password=None, timeout=None,
+                 retry=DEFAULT_RETRY):
+  """Create a gNMI CapabilityRequest.
 
   Args:
     stub: (class) gNMI Stub used to build the secure channel.
-    paths: gNMI Path.
     username: (str) Username used when building the channel.
     password: (str) Password used when building the channel.
-    json_value: (str) JSON_IETF Value or file.
-    set_type: (str) Type of gNMI SetRequest to build.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (RetryPolicy) Retries of transient failures.
+
   Returns:
-    set_request: (class) gNMI SetRequest.
+    a gnmi_pb2.CapabilityResponse object.
   """
-  val = gnmi_pb2.TypedValue()
-  val.json_ietf_val = json.dumps(json_value)
-  path_val = gnmi_pb2.Update(path=paths, val=val,)
-  if set_type == 'update':
-    return stub.Set(gnmi_pb2.SetRequest(update=[path_val]), metadata=[
-        ('username', username), ('password', password)])
-  elif set_type == 'replace':
-    return stub.Set(gnmi_pb2.SetRequest(replace=[path_val]), metadata=[
-        ('username', username), ('password', password)])
-  elif set_type == 'delete':
-    return stub.Set(gnmi_pb2.SetRequest(prefix=paths), metadata=[
-        ('username', username), ('password', password)])
+  return _Invoke(stub, 'Capabilities', gnmi_pb2.CapabilityRequest(),
+                 username, password, timeout, retry)
+
+
+class CapabilityCache(object):
+  """Caches the CapabilityResponse of each Target.
+
+  Entries are keyed by the channel a Stub uses, so every Stub sharing a pooled
+  channel shares one entry. An entry expires after ttl seconds, and is dropped
+  as soon as its channel loses its connection, as the Target may have been
+  upgraded by the time it reconnects.
+
+  Failed CapabilityRequests are cached too, so a Target which is down, or
+  does not implement the RPC, is not asked again on every call: UNIMPLEMENTED
+  for ttl seconds, other failures for failure_ttl seconds or until the
+  channel connects again.
+  """
+
+  def __init__(self, ttl=3600, failure_ttl=60):
+    self.ttl = ttl
+    self.failure_ttl = failure_ttl
+    self._lock = threading.Lock()
+    # channel or stub: (expiry, CapabilityResponse or None, RpcError or None)
+    self._entries = weakref.WeakKeyDictionary()
+    self._subscribed = weakref.WeakSet()  # Channels watched for connectivity.
+
+  def Get(self, stub, username=None, password=None, timeout=None):
+    """Returns the (possibly cached) CapabilityResponse of a Stub's Target.
+
+    Args:
+      stub: (class) gNMI Stub used to build the secure channel.
+      username: (str) Username used when building the channel.
+      password: (str) Password used when building the channel.
+      timeout: (float) Deadline of the CapabilityRequest, if one is sent.
+
+    Returns:
+      a gnmi_pb2.CapabilityResponse object.
+
+    Raises:
+      grpc.RpcError: The CapabilityRequest failed, now or recently.
+    """
+    channel = _CHANNEL_POOL.ChannelFor(stub)
+    owner = stub if channel is None else channel
+    with self._lock:
+      entry = self._entries.get(owner)
+      subscribe = channel is not None and channel not in self._subscribed
+      if subscribe:
+        self._subscribed.add(channel)
+    if subscribe:
+      channel.subscribe(lambda state: self._OnConnectivity(channel, state))
+    if entry is not None and time.time() < entry[0]:
+      if entry[2] is not None:
+        raise entry[2]
+      return entry[1]
+    try:
+      response = Capabilities(stub, username, password, timeout)
+    except gnmi_pb2_grpc.grpc.RpcError as e:
+      ttl = self.failure_ttl
+      if e.code() == _StatusCode.UNIMPLEMENTED:
+        ttl = self.ttl
+      with self._lock:
+        self._entries[owner] = (time.time() + ttl, None, e)
+      raise
+    with self._lock:
+      self._entries[owner] = (time.time() + self.ttl, response, None)
+    return response
+
+  def Invalidate(self, stub):
+    """Drops the entry of a Stub's Target."""
+    channel = _CHANNEL_POOL.ChannelFor(stub)
+    with self._lock:
+      self._entries.pop(stub if channel is None else channel, None)
+
+  def _OnConnectivity(self, channel, state):
+    ready = state == gnmi_pb2_grpc.grpc.ChannelConnectivity.READY
+    with self._lock:
+      entry = self._entries.get(channel)
+      # Responses are dropped once disconnected, transient failures once
+      # connected again; UNIMPLEMENTED only expires.
+      if entry is None or (entry[2] is None) == ready or (
+          entry[2] is not None and
+          entry[2].code() == _StatusCode.UNIMPLEMENTED):
+        return
+      del self._entries[channel]
+
+
+_CAPABILITY_CACHE = CapabilityCache()
+AUTO_ENCODING = 'auto'
+# Cheapest to decode first: PROTO carries scalar TypedValues, JSON_IETF and
+# JSON carry strings that must be parsed.
+ENCODING_PREFERENCE = ('PROTO', 'JSON_IETF', 'JSON')
+
+
+def NegotiateEncoding(stub, username=None, password=None,
+                      preference=ENCODING_PREFERENCE, timeout=None):
+  """Returns the most preferred encoding supported by a Stub's Target.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    preference: (tuple) of gNMI Encoding names, most preferred first.
+    timeout: (float) Deadline of the CapabilityRequest, if one is sent.
+
+  Returns:
+    (str) gNMI Encoding name; JSON_IETF if the Target does not implement the
+    Capabilities RPC or supports none of the preferred encodings.
+  """
+  try:
+    capabilities = _CAPABILITY_CACHE.Get(stub, username, password, timeout)
+  except gnmi_pb2_grpc.grpc.RpcError:
+    return 'JSON_IETF'
+  supported = set(capabilities.supported_encodings)
+  for encoding in preference:
+    if gnmi_pb2.Encoding.Value(encoding) in supported:
+      return encoding
+  return 'JSON_IETF'
+
+
+def _ResolveEncoding(stub, username, password, encoding, timeout=None):
+  """Returns encoding, negotiated with the Target if it is AUTO_ENCODING."""
+  if encoding == AUTO_ENCODING:
+    return NegotiateEncoding(stub, username, password, timeout=timeout)
+  return encoding
+
+
+def Metadata(username, password):
+  """Returns the gRPC call kwargs carrying user/pass authentication.
+
+  Stubs created with an auth (see CreateStub) need none, and pass no
+  username or password.
+
+  Args:
+    username: (str) Username, or None.
+    password: (str) Password, or None.
+
+  Returns:
+    dict of keyword arguments for a gRPC call; empty without credentials.
+  """
+  if username and password:
+    return {'metadata': [('username', username), ('password', password)]}
+  return {}
+
+
+def GetRequest(paths, prefix=None, encoding='JSON_IETF'):
+  """Builds the GetRequest sent by Get.
+
+  Args:
+    paths: gNMI Path, or a list of gNMI Paths.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    encoding: (str) Encoding requested from the Target.
+
+  Returns:
+    a gnmi_pb2.GetRequest.
+  """
+  if not isinstance(paths, (list, tuple)):
+    paths = [paths]
+  get_request = gnmi_pb2.GetRequest(path=paths, encoding=encoding)
+  if prefix is not None:
+    get_request.prefix.CopyFrom(prefix)
+  return get_request
+
+
+def Get(stub, paths, username=None, password=None, prefix=None,
+        encoding='JSON_IETF', timeout=None, retry=DEFAULT_RETRY):
+  """Create a gNMI GetRequest.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path, or a list of gNMI Paths fetched in one round trip.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    encoding: (str) Encoding requested from the Target, or AUTO_ENCODING to
+      use the cheapest one the Target supports; see NegotiateEncoding().
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (RetryPolicy) Retries of transient failures; NO_RETRY disables.
+
+  Returns:
+    a gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+
+  Raises:
+    CircuitOpenError: The Target failed repeatedly; see CircuitBreaker.
+    grpc.RpcError: The last attempt failed.
+  """
+  encoding = _ResolveEncoding(stub, username, password, encoding, timeout)
+  return _Invoke(stub, 'Get', GetRequest(paths, prefix, encoding),
+                 username, password, timeout, retry)
+
+
+def IndexGetResponse(response):
+  """Indexes every update of a GetResponse by its full xpath.
+
+  Args:
+    response: (gnmi_pb2.GetResponse) from Get.
+
+  Returns:
+    OrderedDict of xpath (see PathToXpath) to gnmi_pb2.TypedValue, covering
+    every update of every notification, in the order they were received.
+  """
+  indexed = collections.OrderedDict()
+  for notification in response.notification:
+    for update in notification.update:
+      indexed[PathToXpath(update.path, notification.prefix)] = update.val
+  return indexed
+
+
+def GetIndexed(stub, paths, username=None, password=None, prefix=None,
+               encoding='JSON_IETF', timeout=None, retry=DEFAULT_RETRY):
+  """Get many paths in one GetRequest, indexed by xpath.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path, or a list of gNMI Paths.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    encoding: (str) Encoding requested from the Target, or AUTO_ENCODING.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+    retry: (RetryPolicy) Retries of transient failures; NO_RETRY disables.
+
+  Returns:
+    OrderedDict of xpath to gnmi_pb2.TypedValue, as per IndexGetResponse().
+  """
+  response = Get(stub, paths, username, password, prefix, encoding, timeout,
+                 retry)
+  start = time.time()
+  indexed = IndexGetResponse(response)
+  _ObserveDecode(stub, 'Get', start)
+  return indexed
+
+
+def SetRequest(paths, json_value, set_type):
+  """Builds the SetRequest sent by Set.
+
+  Args:
+    paths: gNMI Path.
+    json_value: (str) JSON_IETF Value or file.
+    set_type: (str) 'update', 'replace' or 'delete'.
+
+  Returns:
+    a gnmi_pb2.SetRequest, or None for an unknown set_type.
+  """
+  if set_type == 'update':
+    return SetBuilder().Update(paths, json_value).Build()
+  elif set_type == 'replace':
+    return SetBuilder().Replace(paths, json_value).Build()
+  elif set_type == 'delete':
+    return gnmi_pb2.SetRequest(prefix=paths)
+
+
+class SetBuilder(object):
+  """Accumulates many delete/replace/update operations into one SetRequest.
+
+  The Target applies every operation of a SetRequest as a single transaction:
+  either all of them take effect or none do. Operations are applied in the
+  order delete, replace, update, as per the gNMI specification.
+
+  Example:
+    results = (SetBuilder(prefix=ap_path)
+               .Replace(radio_path, radio_json)
+               .Update(ssid_path, ssid_json)
+               .Delete(old_ssid_path)
+               .Send(stub, username, password))
+  """
+
+  def __init__(self, prefix=None):
+    """Initializes an empty SetBuilder.
+
+    Args:
+      prefix: (gnmi_pb2.Path) Optional prefix common to all operations.
+    """
+    self._set_request = gnmi_pb2.SetRequest()
+    if prefix is not None:
+      self._set_request.prefix.CopyFrom(prefix)
+
+  def Delete(self, path):
+    """Adds a delete of path (relative to the prefix)."""
+    self._set_request.delete.add().CopyFrom(path)
+    return self
+
+  def Replace(self, path, json_value):
+    """Adds a replace of path with json_value, or a gnmi_pb2.TypedValue."""
+    self._set_request.replace.add(path=path, val=_TypedValue(json_value))
+    return self
+
+  def Update(self, path, json_value):
+    """Adds an update of path with json_value, or a gnmi_pb2.TypedValue."""
+    self._set_request.update.add(path=path, val=_TypedValue(json_value))
+    return self
+
+  def __len__(self):
+    return (len(self._set_request.delete) + len(self._set_request.replace) +
+            len(self._set_request.update))
+
+  def Build(self):
+    """Returns a copy of the accumulated gnmi_pb2.SetRequest."""
+    set_request = gnmi_pb2.SetRequest()
+    set_request.CopyFrom(self._set_request)
+    return set_request
+
+  def Send(self, stub, username=None, password=None, timeout=None):
+    """Sends every accumulated operation in one atomic SetRequest.
+
+    A SetRequest is never retried, as it may have been applied by the Target
+    before the failure was seen.
+
+    Args:
+      stub: (class) gNMI Stub used to build the secure channel.
+      username: (str) Username used when building the channel.
+      password: (str) Password used when building the channel.
+      timeout: (float) Deadline in seconds, or None.
+
+    Returns:
+      OrderedDict of xpath to the gnmi_pb2.UpdateResult for that path.
+    """
+    response = _Invoke(stub, 'Set', self._set_request, username, password,
+                       timeout)
+    return IndexSetResponse(response)
+
+
+def _TypedValue(json_value):
+  """Wraps a value as a JSON_IETF TypedValue, unless already a TypedValue."""
+  if isinstance(json_value, gnmi_pb2.TypedValue):
+    return json_value
+  return gnmi_pb2.TypedValue(
+      json_ietf_val=json.dumps(json_value).encode('utf-8'))
+
+
+def IndexSetResponse(response):
+  """Indexes the results of a SetResponse by their full xpath.
+
+  Args:
+    response: (gnmi_pb2.SetResponse) from Set or SetBuilder.Send.
+
+  Returns:
+    OrderedDict of xpath (see PathToXpath) to gnmi_pb2.UpdateResult.
+  """
+  indexed = collections.OrderedDict()
+  for result in response.response:
+    indexed[PathToXpath(result.path, response.prefix)] = result
+  return indexed
+
+
+def Set(stub, paths, username, password, json_value, set_type, timeout=None):
+  """Create a gNMI SetRequest.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    json_value: (str) JSON_IETF Value or file.
+    set_type: (str) Type of gNMI SetRequest to build.
+    timeout: (float) Deadline in seconds, or None. Never retried.
+  Returns:
+    set_request: (class) gNMI SetRequest.
+  """
+  set_request = SetRequest(paths, json_value, set_type)
+  if set_request is not None:
+    return _Invoke(stub, 'Set', set_request, username, password, timeout)
+
+
+def _EscapeKeyValue(value):
+  """Escapes a key value so that PathNames/ParsePath read it back as is."""
+  if '\\' in value or ']' in value:
+    return value.replace('\\', '\\\\').replace(']', '\\]')
+  return value
+
+
+def PathToXpath(path, prefix=None):
+  """Converts a gNMI Path back into an xpath string.
+
+  Args:
+    path: (gnmi_pb2.Path) gNMI Path.
+    prefix: (gnmi_pb2.Path) Optional prefix the path is relative to.
+
+  Returns:
+    (str) xpath formatted path; keys are sorted so the result is stable.
+  """
+  elems = list(prefix.elem) if prefix is not None else []
+  elems.extend(path.elem)
+  words = []
+  for elem in elems:
+    keys = ''.join('[%s=%s]' % (k, _EscapeKeyValue(elem.key[k]))
+                   for k in sorted(elem.key))
+    name = elem.name
+    if '/' in name or '[' in name:
+      name = name.replace('/', '\\/').replace('[', '\\[')
+    words.append(name + keys)
+  return '/' + '/'.join(words)
+
+
+def _DecodeJson(val):
+  return json.loads(val.json_ietf_val or val.json_val)
+
+
+def _DecodeDecimal(val):
+  return val.decimal_val.digits / 10.0 ** val.decimal_val.precision
+
+
+def _DecodeLeafList(val):
+  return [DecodeTypedValue(v) for v in val.leaflist_val.element]
+
+
+# TypedValue 'value' oneof field name to decoder. Scalars are read straight
+# from the protobuf; only JSON encoded values go through the JSON parser.
+_TYPED_VALUE_DECODERS = {
+    'string_val': lambda val: val.string_val,
+    'int_val': lambda val: val.int_val,
+    'uint_val': lambda val: val.uint_val,
+    'bool_val': lambda val: val.bool_val,
+    'float_val': lambda val: val.float_val,
+    'bytes_val': lambda val: val.bytes_val,
+    'ascii_val': lambda val: val.ascii_val,
+    'decimal_val': _DecodeDecimal,
+    'leaflist_val': _DecodeLeafList,
+    'json_ietf_val': _DecodeJson,
+    'json_val': _DecodeJson,
+    'any_val': lambda val: val.any_val,
+    'proto_bytes': lambda val: val.proto_bytes,
+    None: lambda val: None,
+}
+
+
+def DecodeTypedValue(val):
+  """Decodes a gNMI TypedValue into a native Python value.
+
+  Args:
+    val: (gnmi_pb2.TypedValue) value from a Notification.
+
+  Returns:
+    the decoded value; JSON encoded values are returned as dict/list.
+  """
+  return _TYPED_VALUE_DECODERS[val.WhichOneof('value')](val)
+
+
+def UnwrapLeaf(value, name):
+  """Unwraps a leaf value a Target returned wrapped in a JSON object.
+
+  Some Targets answer a JSON_IETF request for a leaf with an object holding
+  the leaf, eg. {"openconfig-access-points:total-channel-utilization": 12}.
+
+  Args:
+    value: decoded value, as returned by DecodeTypedValue.
+    name: (str) Name of the leaf, with or without its module prefix.
+
+  Returns:
+    the value of the leaf.
+  """
+  if isinstance(value, dict) and len(value) == 1:
+    key, leaf = next(iter(value.items()))
+    if key.split(':')[-1] == name.split(':')[-1]:
+      return leaf
+  return value
+
+
+def DecodeLeaf(val, name):
+  """Decodes the TypedValue of a leaf; see DecodeTypedValue and UnwrapLeaf."""
+  field = val.WhichOneof('value')
+  if field == 'json_ietf_val' or field == 'json_val':
+    return UnwrapLeaf(_DecodeJson(val), name)
+  return _TYPED_VALUE_DECODERS[field](val)
+
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_STRUCTURE = re.compile(r'["{}\[\]]')
+_JSON_STRING_TAIL = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+_JSON_NUMBER = json.scanner.NUMBER_RE
+_JSON_LITERALS = {'t': ('true', True), 'f': ('false', False),
+                  'n': ('null', None)}
+_JSON_OBJECT = 0  # Container, or list entry whose keys are known.
+_JSON_LIST = 1
+_JSON_ENTRY = 2  # List entry whose keys are still being read.
+_JSON_OPENED = 0  # Expecting the first member or entry, or the close.
+_JSON_VALUE = 1  # Expecting a ',' or the close.
+_JSON_COMMA = 2  # Expecting a member or entry.
+
+
+def _JsonScalar(text, i):
+  """Returns (value, key text, end) of the JSON string/number/literal at i."""
+  char = text[i]
+  if char == '"':
+    value, end = json.decoder.scanstring(text, i + 1)
+    return value, value, end
+  if char in _JSON_LITERALS:
+    word, value = _JSON_LITERALS[char]
+    if text.startswith(word, i):
+      return value, word, i + len(word)
+  else:
+    match = _JSON_NUMBER.match(text, i)
+    if match is not None:
+      integer, frac, exp = match.groups()
+      if frac or exp:
+        return float(match.group()), match.group(), match.end()
+      return int(integer), integer, match.end()
+  raise Error('Invalid JSON value at offset %d' % i)
+
+
+def _JsonSkip(text, i, depth):
+  """Returns the offset following the container depth levels up from i."""
+  search = _JSON_STRUCTURE.search
+  while True:
+    match = search(text, i)
+    if match is None:
+      raise Error('Truncated JSON')
+    i = match.end()
+    char = text[i - 1]
+    if char == '"':
+      i = _JSON_STRING_TAIL.match(text, i).end()
+    elif char == '{' or char == '[':
+      depth += 1
+    else:
+      depth -= 1
+      if depth == 0:
+        return i
+
+
+def _JsonEnd(text, i):
+  """Raises Error unless the document ends at offset i."""
+  if i != len(text):
+    raise Error('Extra data at offset %d' % i)
+
+
+class _JsonSubtrees(object):
+  """Decides which parts of a JSON document IterJsonLeaves descends into."""
+
+  def __init__(self, subtrees):
+    self._subtrees = tuple(subtrees)
+
+  def Leaf(self, xpath):
+    """Whether xpath is one of the subtrees, or below one."""
+    for subtree in self._subtrees:
+      if xpath.startswith(subtree) and (
+          len(xpath) == len(subtree) or xpath[len(subtree)] in '/['):
+        return True
+    return False
+
+  def Container(self, xpath):
+    """Whether xpath is below one of the subtrees, or above one."""
+    if self.Leaf(xpath):
+      return True
+    for subtree in self._subtrees:
+      if subtree.startswith(xpath) and subtree[len(xpath)] in '/[':
+        return True
+    return False
+
+
+class _AllSubtrees(object):
+
+  def Leaf(self, unused_xpath):
+    return True
+
+  Container = Leaf
+
+
+def _ListEntryXpath(xpath, keys, index):
+  """Returns the xpath of a list entry; see IterJsonLeaves."""
+  if not keys:
+    return '%s[%d]' % (xpath, index)
+  return xpath + ''.join(
+      '[%s=%s]' % (name, _EscapeKeyValue(key)) for name, key, _ in
+      sorted(keys, key=lambda k: k[0]))
+
+
+def IterJsonLeaves(json_value, subtrees=None, prefix='', strip_modules=True):
+  """Walks a JSON_IETF document, yielding its leaves as they are read.
+
+  The document is never built as a whole: only the leaf being yielded is
+  decoded, and subtrees not selected are skipped over without decoding.
+
+  Lists are JSON arrays of entries. As a JSON_IETF document carries no schema,
+  an entry is keyed by the scalar members preceding its first container,
+  which is where OpenConfig lists hold their keys; an entry with no such
+  members is addressed by its position, eg. radio[0]. Leaf-lists, and empty
+  arrays, are yielded as a single list value; empty objects yield nothing.
+  Subtrees which are skipped are only checked to be balanced.
+
+  Example:
+    for xpath, value in IterJsonLeaves(update.val.json_ietf_val,
+                                       subtrees=['/radios/radio']):
+      ...
+
+  Args:
+    json_value: (bytes or str) JSON_IETF document, eg. a json_ietf_val.
+    subtrees: (list) of xpaths, relative to the document root, to yield the
+      leaves of; eg. '/radios/radio[id=0]'. Every leaf if None.
+    prefix: (str) Prepended to every xpath yielded, eg. the update's xpath.
+    strip_modules: (bool) Drop the 'module:' prefix of member names.
+
+  Yields:
+    (xpath, value) tuples, xpath formatted as per PathToXpath.
+
+  Raises:
+    Error: The document is not valid JSON.
+  """
+  text = json_value
+  if isinstance(text, bytes):
+    text = text.decode('utf-8')
+  select = _AllSubtrees() if subtrees is None else _JsonSubtrees(subtrees)
+  whitespace = _JSON_WHITESPACE.match
+  try:
+    i = whitespace(text).end()
+    if text[i] == '{':
+      stack = [[_JSON_OBJECT, '', None, 0, _JSON_OPENED]]
+      i += 1
+    elif text[i] == '[':
+      stack = [[_JSON_OBJECT, '', None, 0, _JSON_OPENED]]
+      text = '{"":%s}' % text  # Root list: walk it as an anonymous member.
+      i = 1
+    else:
+      value, _, i = _JsonScalar(text, i)
+      _JsonEnd(text, whitespace(text, i).end())
+      yield prefix, value
+      return
+    while stack:
+      i = whitespace(text, i).end()
+      char = text[i]
+      frame = stack[-1]
+      kind, xpath = frame[0], frame[1]
+      if char == ',':
+        if frame[4] != _JSON_VALUE:
+          raise Error('Unexpected "," at offset %d' % i)
+        frame[4] = _JSON_COMMA
+        i += 1
+        continue
+      if char == '}' or char == ']':
+        if frame[4] == _JSON_COMMA or (char == ']') != (kind == _JSON_LIST):
+          raise Error('Unexpected "%s" at offset %d' % (char, i))
+        i += 1
+        stack.pop()
+        if kind == _JSON_ENTRY:  # Every member was a key.
+          xpath = _ListEntryXpath(xpath, frame[2], frame[3])
+          if select.Container(xpath):
+            for name, _, value in frame[2]:
+              if select.Leaf(xpath + '/' + name):
+                yield prefix + xpath + '/' + name, value
+        continue
+      if frame[4] == _JSON_VALUE:
+        raise Error('Expected "," at offset %d' % i)
+      frame[4] = _JSON_VALUE
+      if kind == _JSON_LIST:
+        if char != '{':
+          raise Error('Expected a list entry at offset %d' % i)
+        frame[3] += 1
+        stack.append([_JSON_ENTRY, xpath, [], frame[3] - 1, _JSON_OPENED])
+        i += 1
+        continue
+      if char != '"':
+        raise Error('Expected a member name at offset %d' % i)
+      name, i = json.decoder.scanstring(text, i + 1)
+      if strip_modules:
+        name = name.rpartition(':')[2]
+      if '/' in name or '[' in name:
+        name = name.replace('/', '\\/').replace('[', '\\[')
+      i = whitespace(text, i).end()
+      if text[i] != ':':
+        raise Error('Expected ":" at offset %d' % i)
+      i = whitespace(text, i + 1).end()
+      char = text[i]
+      if kind == _JSON_ENTRY:
+        if char != '{' and char != '[':
+          value, key, i = _JsonScalar(text, i)
+          frame[2].append((name, key, value))
+          continue
+        keys = frame[2]
+        xpath = frame[1] = _ListEntryXpath(xpath, keys, frame[3])
+        frame[0] = _JSON_OBJECT
+        if not select.Container(xpath):
+          i = _JsonSkip(text, i, 1)
+          stack.pop()
+          continue
+        for key_name, _, value in keys:
+          if select.Leaf(xpath + '/' + key_name):
+            yield prefix + xpath + '/' + key_name, value
+      member = xpath + '/' + name if name else xpath
+      if char == '{':
+        if select.Container(member):
+          stack.append([_JSON_OBJECT, member, None, 0, _JSON_OPENED])
+          i += 1
+        else:
+          i = _JsonSkip(text, i + 1, 1)
+      elif char == '[':
+        i = whitespace(text, i + 1).end()
+        if text[i] == '{':
+          if select.Container(member):
+            stack.append([_JSON_LIST, member, None, 0, _JSON_OPENED])
+          else:
+            i = _JsonSkip(text, i, 1)
+        else:  # Leaf-list, or empty array.
+          values = []
+          while text[i] != ']':
+            value, _, i = _JsonScalar(text, i)
+            values.append(value)
+            i = whitespace(text, i).end()
+            if text[i] == ',':
+              i = whitespace(text, i + 1).end()
+              if text[i] == ']':
+                raise Error('Unexpected "]" at offset %d' % i)
+            elif text[i] != ']':
+              raise Error('Expected "," at offset %d' % i)
+          i += 1
+          if select.Leaf(member):
+            yield prefix + member, values
+      else:
+        value, _, i = _JsonScalar(text, i)
+        if select.Leaf(member):
+          yield prefix + member, value
+    _JsonEnd(text, whitespace(text, i).end())
+  except IndexError:
+    raise Error('Truncated JSON')
+
+
+try:
+  _INT64, _UINT64 = 'q', 'Q'
+  array.array(_INT64)
+except ValueError:  # Python 2, where long is 64 bits on LP64 platforms.
+  _INT64, _UINT64 = 'l', 'L'
+
+
+class PathTable(object):
+  """Interns xpaths as small integer ids.
+
+  A table may be shared by any number of LeafBatches, so that a path keeps
+  its id from one batch to the next.
+  """
+
+  def __init__(self):
+    self._ids = {}
+    self.xpaths = []
+
+  def Id(self, xpath):
+    """Returns the id of xpath, allocating one if it is new."""
+    path_id = self._ids.get(xpath)
+    if path_id is None:
+      path_id = self._ids[xpath] = len(self.xpaths)
+      self.xpaths.append(xpath)
+    return path_id
+
+  def Xpath(self, path_id):
+    return self.xpaths[path_id]
+
+  def __len__(self):
+    return len(self.xpaths)
+
+
+class LeafBatch(object):
+  """Every leaf of any number of gNMI responses, flattened into columns.
+
+  Row i of the batch is the leaf path_ids[i] (see PathTable), as of
+  timestamps[i] (ns since the epoch), with a value of kind kinds[i]. The value
+  is column(kinds[i])[slots[i]]: INT and BOOL values are held in ints, UINT in
+  uints, FLOAT in floats, and STRING and OBJECT values in objects. DELETE rows
+  have no value. Every update and delete of every notification is added, with
+  the notification prefix applied.
+
+  Example:
+    batch = LeafBatch()
+    batch.Add(Get(stub, paths))
+    for xpath, timestamp, value in batch:
+      ...
+  """
+
+  DELETE, INT, UINT, FLOAT, BOOL, STRING, OBJECT = range(7)
+
+  # TypedValue 'value' oneof field name to (kind, column attribute).
+  _SCALARS = {
+      'int_val': (INT, 'ints'),
+      'uint_val': (UINT, 'uints'),
+      'float_val': (FLOAT, 'floats'),
+      'bool_val': (BOOL, 'ints'),
+      'string_val': (STRING, 'objects'),
+      'ascii_val': (STRING, 'objects'),
+  }
+
+  def __init__(self, path_table=None, expand_json=True):
+    """Initializes an empty batch.
+
+    Args:
+      path_table: (PathTable) Interns the xpaths; a new one if None.
+      expand_json: (bool) Add every leaf of JSON encoded values as a row of
+        its own (see IterJsonLeaves), rather than one OBJECT row per update.
+    """
+    self.paths = PathTable() if path_table is None else path_table
+    self.expand_json = expand_json
+    self.Clear()
+
+  def Clear(self):
+    """Drops every row, keeping the PathTable."""
+    self.path_ids = array.array('l')
+    self.timestamps = array.array(_INT64)
+    self.kinds = array.array('B')
+    self.slots = array.array('l')
+    self.ints = array.array(_INT64)
+    self.uints = array.array(_UINT64)
+    self.floats = array.array('d')
+    self.objects = []
+
+  def Add(self, response):
+    """Adds every leaf of a response.
+
+    Args:
+      response: gnmi_pb2.GetResponse, SubscribeResponse or Notification.
+
+    Returns:
+      (bool) whether response was a SubscribeResponse sync_response.
+
+    Raises:
+      SubscribeError: response is a SubscribeResponse error.
+    """
+    if isinstance(response, gnmi_pb2.Notification):
+      self.AddNotification(response)
+    elif isinstance(response, gnmi_pb2.SubscribeResponse):
+      field = response.WhichOneof('response')
+      if field == 'update':
+        self.AddNotification(response.update)
+      elif field == 'error':
+        raise SubscribeError('Subscribe error from Target: %s' %
+                             response.error.message)
+      return field == 'sync_response'
+    else:
+      for notification in response.notification:
+        self.AddNotification(notification)
+    return False
+
+  def AddNotification(self, notification):
+    """Adds every update and delete of a gnmi_pb2.Notification."""
+    prefix = notification.prefix
+    timestamp = notification.timestamp
+    path_id = self.paths.Id
+    for update in notification.update:
+      xpath = PathToXpath(update.path, prefix)
+      val = update.val
+      field = val.WhichOneof('value')
+      scalar = self._SCALARS.get(field)
+      if scalar is not None:
+        kind, column = scalar
+        column = getattr(self, column)
+        self._Append(path_id(xpath), timestamp, kind, len(column))
+        column.append(getattr(val, field))
+      elif self.expand_json and (field == 'json_ietf_val' or
+                                 field == 'json_val'):
+        # A leaf may be wrapped in an object of its own name; see UnwrapLeaf.
+        wrapped = xpath + '/' + xpath.rpartition('/')[2]
+        for leaf_xpath, value in IterJsonLeaves(
+            getattr(val, field), prefix=xpath.rstrip('/')):
+          if leaf_xpath == wrapped:
+            leaf_xpath = xpath
+          self.AddValue(path_id(leaf_xpath), timestamp, value)
+      else:
+        self.AddValue(path_id(xpath), timestamp, DecodeTypedValue(val))
+    for path in notification.delete:
+      self._Append(path_id(PathToXpath(path, prefix)), timestamp,
+                   self.DELETE, -1)
+
+  def AddValue(self, path_id, timestamp, value):
+    """Adds a row holding a decoded Python value."""
+    value_type = type(value)
+    if value_type is bool:
+      self._Append(path_id, timestamp, self.BOOL, len(self.ints))
+      self.ints.append(value)
+    elif value_type is float:
+      self._Append(path_id, timestamp, self.FLOAT, len(self.floats))
+      self.floats.append(value)
+    elif (isinstance(value, six.integer_types) and
+          -(1 << 63) <= value < (1 << 63)):
+      self._Append(path_id, timestamp, self.INT, len(self.ints))
+      self.ints.append(value)
+    else:
+      kind = (self.STRING if isinstance(value, six.string_types) else
+              self.OBJECT)
+      self._Append(path_id, timestamp, kind, len(self.objects))
+      self.objects.append(value)
+
+  def _Append(self, path_id, timestamp, kind, slot):
+    self.path_ids.append(path_id)
+    self.timestamps.append(timestamp)
+    self.kinds.append(kind)
+    self.slots.append(slot)
+
+  def Column(self, kind):
+    """Returns the column holding the values of kind, None for DELETE."""
+    if kind == self.INT or kind == self.BOOL:
+      return self.ints
+    if kind == self.UINT:
+      return self.uints
+    if kind == self.FLOAT:
+      return self.floats
+    if kind == self.DELETE:
+      return None
+    return self.objects
+
+  def Value(self, i):
+    """Returns the value of row i as DecodeTypedValue would, None if deleted."""
+    kind = self.kinds[i]
+    if kind == self.DELETE:
+      return None
+    value = self.Column(kind)[self.slots[i]]
+    return bool(value) if kind == self.BOOL else value
+
+  def Xpath(self, i):
+    return self.paths.xpaths[self.path_ids[i]]
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __iter__(self):
+    """Yields (xpath, timestamp, value) rows, as per DecodeNotification()."""
+    xpaths = self.paths.xpaths
+    for i in six.moves.range(len(self.kinds)):
+      yield xpaths[self.path_ids[i]], self.timestamps[i], self.Value(i)
+
+
+def GetLeaves(stub, paths, username=None, password=None, prefix=None,
+              timeout=None):
+  """Get leaf values in one GetRequest, decoded without the JSON parser.
+
+  The encoding is negotiated with the Target (see NegotiateEncoding), so that
+  Targets supporting PROTO answer with scalar TypedValues.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path of a leaf, or a list of them.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    timeout: (float) Deadline of each attempt in seconds, or None.
+
+  Returns:
+    OrderedDict of xpath (see PathToXpath) to the decoded leaf value.
+  """
+  response = Get(stub, paths, username, password, prefix, AUTO_ENCODING,
+                 timeout)
+  start = time.time()
+  leaves = collections.OrderedDict()
+  for xpath, val in IndexGetResponse(response).items():
+    leaves[xpath] = DecodeLeaf(val, xpath.rsplit('/', 1)[-1])
+  _ObserveDecode(stub, 'Get', start)
+  return leaves
+
+
+def SubscribeLeaves(stub, paths, username=None, password=None,
+                    sub_mode='sample', sample_interval=None, prefix=None):
+  """Subscribe to leaf values, decoded without the JSON parser.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path of a leaf, gnmi_pb2.Subscription, or a list of either.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    sub_mode: (str) Mode used for plain Paths; see Subscription().
+    sample_interval: (int) Seconds between samples for 'sample' sub_mode.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+
+  Yields:
+    (timestamp, xpath, value) tuples, as per DecodeNotification().
+  """
+  for timestamp, xpath, value in Subscribe(
+      stub, paths, username, password, sub_mode, sample_interval, prefix,
+      encoding=AUTO_ENCODING):
+    yield timestamp, xpath, UnwrapLeaf(value, xpath.rsplit('/', 1)[-1])
+
+
+def DecodeNotification(notification):
+  """Decodes every update and delete contained in a gNMI Notification.
+
+  Args:
+    notification: (gnmi_pb2.Notification) from a Get or Subscribe response.
+
+  Yields:
+    (timestamp, xpath, value) tuples. Deleted paths have a value of None.
+  """
+  prefix = notification.prefix
+  for update in notification.update:
+    yield (notification.timestamp, PathToXpath(update.path, prefix),
+           DecodeTypedValue(update.val))
+  for path in notification.delete:
+    yield notification.timestamp, PathToXpath(path, prefix), None
+
+
+def Subscription(path, sub_mode='on_change', sample_interval=None):
+  """Creates a gNMI Subscription for use in a SubscriptionList.
+
+  Args:
+    path: (gnmi_pb2.Path) gNMI Path to subscribe to.
+    sub_mode: (str) one of 'on_change', 'sample' or 'target_defined'.
+    sample_interval: (int) Seconds between samples when sub_mode is 'sample'.
+
+  Returns:
+    a gnmi_pb2.Subscription object.
+  """
+  subscription = gnmi_pb2.Subscription(path=path, mode=sub_mode.upper())
+  if sample_interval:
+    subscription.sample_interval = int(sample_interval * 1e9)
+  return subscription
+
+
+class _RequestQueue(object):
+  """Blocking request iterator used for the client side of a Subscribe RPC.
+
+  gRPC consumes the iterator from its own thread. Keeping the iterator open
+  until Close() is called keeps the client half of the stream open, as some
+  Targets tear the subscription down once the client stops sending.
+  """
+
+  _CLOSE = object()
+
+  def __init__(self):
+    self._queue = six.moves.queue.Queue()
+
+  def Send(self, request):
+    self._queue.put(request)
+
+  def Close(self):
+    self._queue.put(self._CLOSE)
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    request = self._queue.get()
+    if request is self._CLOSE:
+      raise StopIteration()
+    return request
+
+  next = __next__  # Python 2.
+
+
+def SubscribeRequest(paths, list_mode, sub_mode, sample_interval, prefix,
+                     updates_only, encoding):
+  """Builds the SubscribeRequest that opens a subscription.
+
+  Args:
+    paths: gNMI Path, gnmi_pb2.Subscription, or a list of either.
+    list_mode: (str) 'STREAM', 'POLL' or 'ONCE'.
+    sub_mode: (str) Mode used for plain Paths; see Subscription().
+    sample_interval: (int) Seconds between samples for 'sample' sub_mode.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    updates_only: (bool) Skip the initial state dump sent by the Target.
+    encoding: (str) Encoding requested from the Target.
+
+  Returns:
+    a gnmi_pb2.SubscribeRequest.
+  """
+  if not isinstance(paths, (list, tuple)):
+    paths = [paths]
+  subscriptions = []
+  for path in paths:
+    if isinstance(path, gnmi_pb2.Subscription):
+      subscriptions.append(path)
+    else:
+      subscriptions.append(Subscription(path, sub_mode, sample_interval))
+  sub_list = gnmi_pb2.SubscriptionList(
+      subscription=subscriptions, mode=list_mode, encoding=encoding,
+      updates_only=updates_only)
+  if prefix is not None:
+    sub_list.prefix.CopyFrom(prefix)
+  return gnmi_pb2.SubscribeRequest(subscribe=sub_list)
+
+
+def Subscribe(stub, paths, username=None, password=None,
+              sub_mode='on_change', sample_interval=None, prefix=None,
+              updates_only=False, encoding='JSON_IETF', retry=DEFAULT_RETRY):
+  """Create a gNMI Subscribe STREAM and yield updates as they arrive.
+
+  See SubscribeNotifications() for the arguments.
+
+  Yields:
+    (timestamp, xpath, value) tuples, as per DecodeNotification().
+  """
+  for updates in SubscribeNotifications(stub, paths, username, password,
+                                        sub_mode, sample_interval, prefix,
+                                        updates_only, encoding, retry):
+    if updates is not None:
+      for update in updates:
+        yield update
+
+
+def SubscribeNotifications(stub, paths, username=None, password=None,
+                           sub_mode='on_change', sample_interval=None,
+                           prefix=None, updates_only=False,
+                           encoding='JSON_IETF', retry=DEFAULT_RETRY):
+  """Create a gNMI Subscribe STREAM and yield notifications as they arrive.
+
+  Unlike Subscribe(), the updates a Target sends together, in a single
+  Notification, are yielded together, and the end of the initial state is
+  marked; with the PROTO encoding a container arrives one leaf per update,
+  so a consumer can act once per change rather than once per leaf.
+
+  A single long-lived stream is opened to the Target; only the leaves which
+  change (ON_CHANGE) or are sampled (SAMPLE) are sent by the Target. Opening
+  the stream is retried as per retry until the Target's first response; once
+  updates have been yielded a failure is raised, as re-opening the stream
+  would replay the initial state.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Path, gnmi_pb2.Subscription, or a list of either.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    sub_mode: (str) Mode used for plain Paths; see Subscription().
+    sample_interval: (int) Seconds between samples for 'sample' sub_mode.
+    prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+    updates_only: (bool) Skip the initial state dump sent by the Target.
+    encoding: (str) Encoding requested from the Target, or AUTO_ENCODING.
+    retry: (RetryPolicy) Retries of transient failures to open the stream.
+
+  Yields:
+    For each Notification, the list of its (timestamp, xpath, value) tuples,
+    as per DecodeNotification(); None for the sync_response which follows
+    the initial state.
+
+  Raises:
+    SubscribeError: The Target returned an error on the stream.
+    CircuitOpenError: The Target failed repeatedly; see CircuitBreaker.
+    grpc.RpcError: The stream failed.
+  """
+  encoding = _ResolveEncoding(stub, username, password, encoding)
+  subscribe_request = SubscribeRequest(paths, 'STREAM', sub_mode,
+                                       sample_interval, prefix, updates_only,
+                                       encoding)
+  breaker = CircuitBreakerFor(stub)
+  collector = _COLLECTOR
+  target = _TargetLabel(stub) if collector.enabled else None
+  attempt = 0
+  refreshed = False
+  while True:
+    _CheckCircuit(stub, breaker, 'Subscribe')
+    requests = _RequestQueue()
+    requests.Send(subscribe_request)
+    start = time.time()
+    responses = stub.Subscribe(requests, **Metadata(username, password))
+    received = False
+    try:
+      for response in responses:
+        if not received:
+          received = True
+          breaker.RecordSuccess()
+          if collector.enabled:  # Latency of a stream: to its first response.
+            collector.ObserveLatency(target, 'Subscribe', time.time() - start)
+            collector.ObserveBytes(target, 'Subscribe',
+                                   request_bytes=subscribe_request.ByteSize())
+        field = response.WhichOneof('response')
+        if field == 'update':
+          if collector.enabled:
+            collector.ObserveBytes(target, 'Subscribe',
+                                   response_bytes=response.ByteSize())
+            start = time.time()
+          updates = list(DecodeNotification(response.update))
+          if collector.enabled:
+            collector.ObserveDecode(target, 'Subscribe', time.time() - start)
+          yield updates
+        elif field == 'sync_response':
+          yield None
+        elif field == 'error':
+          raise SubscribeError('Subscribe error from Target: %s' %
+                               response.error.message)
+      if collector.enabled:
+        collector.CountStatus(target, 'Subscribe', 'OK')
+      return
+    except gnmi_pb2_grpc.grpc.RpcError as e:
+      breaker.Record(e.code())
+      if collector.enabled:
+        collector.CountStatus(target, 'Subscribe', e.code().name)
+      if not received and not refreshed and _RefreshCert(stub, e):
+        refreshed = True  # Once per call, and not counted as a retry.
+        breaker = CircuitBreakerFor(stub)
+        continue
+      if received or not retry.ShouldRetry(attempt, e.code()):
+        raise
+    finally:
+      requests.Close()
+      responses.cancel()
+    time.sleep(retry.Backoff(attempt))
+    attempt += 1
+
+
+class PollSubscription(object):
+  """A gNMI Subscribe POLL stream held open to a single Target.
+
+  The Target sends the current state of the subscribed paths followed by a
+  sync_response when the subscription is created, and again after every Poll.
+  Responses are read by a background thread, so that Collect() can give up on
+  a Target which stops answering.
+  """
+
+  def __init__(self, stub, paths, username=None, password=None, prefix=None,
+               encoding='JSON_IETF'):
+    """Opens the POLL subscription.
+
+    Args:
+      stub: (class) gNMI Stub used to build the secure channel.
+      paths: gNMI Path, gnmi_pb2.Subscription, or a list of either.
+      username: (str) Username used when building the channel.
+      password: (str) Password used when building the channel.
+      prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+      encoding: (str) Encoding requested from the Target, or AUTO_ENCODING.
+    """
+    encoding = _ResolveEncoding(stub, username, password, encoding)
+    self._breaker = CircuitBreakerFor(stub)
+    _CheckCircuit(stub, self._breaker, 'Poll')
+    self._target = _TargetLabel(stub)
+    self._triggered = None
+    self._requests = _RequestQueue()
+    self._requests.Send(SubscribeRequest(paths, 'POLL', 'target_defined',
+                                         None, prefix, False, encoding))
+    self._responses = stub.Subscribe(self._requests,
+                                     **Metadata(username, password))
+    self._initial_sync = True
+    self._received = six.moves.queue.Queue()
+    reader = threading.Thread(target=self._Read)
+    reader.daemon = True
+    reader.start()
+
+  def _Read(self):
+    try:
+      for response in self._responses:
+        self._received.put((time.time(), response))
+    except gnmi_pb2_grpc.grpc.RpcError as e:
+      self._received.put((time.time(), e))
+    self._received.put((time.time(), None))  # Stream closed.
+
+  def Trigger(self):
+    """Sends a Poll, without waiting for the Target to answer."""
+    self._triggered = time.time()
+    self._requests.Send(gnmi_pb2.SubscribeRequest(poll=gnmi_pb2.Poll()))
+
+  def Collect(self, timeout=None):
+    """Reads the updates sent in answer to the last Trigger().
+
+    Args:
+      timeout: (float) Seconds to wait for the Target's answer, or None. The
+        subscription is closed if the Target does not answer in time.
+
+    Returns:
+      list of (timestamp, xpath, value) tuples, as per DecodeNotification().
+
+    Raises:
+      SubscribeError: The Target returned an error, closed the stream or
+        did not answer in time.
+    """
+    collector = _COLLECTOR
+    deadline = None if timeout is None else time.time() + timeout
+    updates = []
+    decode_time = 0
+    while True:
+      try:
+        received_at, response = self._received.get(
+            timeout=None if deadline is None else
+            max(0, deadline - time.time()))
+      except six.moves.queue.Empty:
+        self._breaker.RecordFailure()
+        if collector.enabled:
+          collector.CountStatus(self._target, 'Poll', 'DEADLINE_EXCEEDED')
+        self.Close()
+        raise SubscribeError('Target did not answer the Poll within %ss' %
+                             timeout)
+      if response is None:
+        raise SubscribeError('Target closed the POLL subscription')
+      if isinstance(response, gnmi_pb2_grpc.grpc.RpcError):
+        self._breaker.Record(response.code())
+        if collector.enabled:
+          collector.CountStatus(self._target, 'Poll', response.code().name)
+        raise SubscribeError('POLL subscription failed: %s' %
+                             response.details())
+      field = response.WhichOneof('response')
+      if field == 'update':
+        start = time.time()
+        updates.extend(DecodeNotification(response.update))
+        if collector.enabled:
+          decode_time += time.time() - start
+          collector.ObserveBytes(self._target, 'Poll',
+                                 response_bytes=response.ByteSize())
+      elif field == 'error':
+        raise SubscribeError('Subscribe error from Target: %s' %
+                             response.error.message)
+      elif field == 'sync_response':
+        self._breaker.RecordSuccess()
+        if not self._initial_sync:
+          if collector.enabled:
+            if self._triggered is not None:
+              collector.ObserveLatency(self._target, 'Poll',
+                                       received_at - self._triggered)
+            collector.ObserveDecode(self._target, 'Poll', decode_time)
+            collector.CountStatus(self._target, 'Poll', 'OK')
+          return updates
+        self._initial_sync = False  # Drop the state sent on creation.
+        updates = []
+        decode_time = 0
+
+  def Poll(self, timeout=None):
+    """Sends a Poll and returns the resulting updates."""
+    self.Trigger()
+    return self.Collect(timeout)
+
+  def Close(self):
+    self._requests.Close()
+    self._responses.cancel()
+
+
+class Poller(object):
+  """Fires a Poll on every open POLL subscription at the same tick.
+
+  Each subscription is built once, so a tick costs one small Poll message per
+  Target instead of a full GetRequest. All Polls are sent before any answer is
+  read, which keeps the Targets' sample timestamps aligned.
+  """
+
+  def __init__(self):
+    self._subscriptions = collections.OrderedDict()
+
+  def Add(self, name, stub, paths, username=None, password=None, prefix=None,
+          encoding='JSON_IETF'):
+    """Opens a POLL subscription and adds it to the tick.
+
+    Args:
+      name: (str) Unique name of the subscription, eg. the AP hostname.
+      stub: (class) gNMI Stub used to build the secure channel.
+      paths: gNMI Path, gnmi_pb2.Subscription, or a list of either.
+      username: (str) Username used when building the channel.
+      password: (str) Password used when building the channel.
+      prefix: (gnmi_pb2.Path) Optional prefix common to all paths.
+      encoding: (str) Encoding requested from the Target, or AUTO_ENCODING.
+    """
+    self.Remove(name)
+    self._subscriptions[name] = PollSubscription(
+        stub, paths, username, password, prefix, encoding)
+
+  def __contains__(self, name):
+    return name in self._subscriptions
+
+  def Remove(self, name):
+    subscription = self._subscriptions.pop(name, None)
+    if subscription:
+      subscription.Close()
+
+  def Tick(self, timeout=None):
+    """Polls every subscription.
+
+    Args:
+      timeout: (float) Seconds to wait for all the Targets to answer, or None.
+        A Target answering late does not delay the others' results.
+
+    Returns:
+      OrderedDict of name to the list of (timestamp, xpath, value) updates.
+      A subscription that failed maps to the SubscribeError raised; it is
+      closed, and should be added again.
+    """
+    for subscription in self._subscriptions.values():
+      subscription.Trigger()
+    deadline = None if timeout is None else time.time() + timeout
+    results = collections.OrderedDict()
+    for name, subscription in self._subscriptions.items():
+      remaining = None if deadline is None else max(0, deadline - time.time())
+      try:
+        results[name] = subscription.Collect(remaining)
+      except SubscribeError as e:
+        results[name] = e
+    return results
+
+  def Close(self):
+    for name in list(self._subscriptions):
+      self.Remove(name)
@@ -0,0 +1,148 @@
+"""Unit tests for gnmi_lib."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import json
+import unittest
+import gnmi_lib
+import six
+
+
+def _JsonLeaves(value, xpath=''):
+  """Yields the leaves of a decoded document as IterJsonLeaves addresses them.
+
+  A reference for IterJsonLeaves, built on json.loads.
+  """
+  for name, member in value.items():
+    member_xpath = xpath + '/' + name.rpartition(':')[2]
+    if isinstance(member, dict):
+      for leaf in _JsonLeaves(member, member_xpath):
+        yield leaf
+    elif isinstance(member, list) and member and isinstance(member[0], dict):
+      for index, entry in enumerate(member):
+        keys = []
+        for key_name, key in entry.items():
+          if isinstance(key, (dict, list)):
+            break
+          keys.append((key_name, key))
+        if keys:
+          entry_xpath = member_xpath + ''.join(
+              '[%s=%s]' % (k, v if isinstance(v, six.string_types) else
+                           json.dumps(v)) for k, v in sorted(keys))
+        else:
+          entry_xpath = '%s[%d]' % (member_xpath, index)
+        for leaf in _JsonLeaves(entry, entry_xpath):
+          yield leaf
+    else:
+      yield member_xpath, member
+
+
+_VALID = [
+    '{}',
+    '{"a": 1}',
+    '{"a": 1.5, "b": -2e3, "c": true, "d": false, "e": null, "f": "x\\"y"}',
+    '{"oc:a": {"b": {"c": "d"}}}',
+    '{"a": [], "b": [1], "c": [1, "two", false], "d": {}}',
+    ' { "a" : [ 1 , 2 ] , "b" : { } } ',
+    '{"radios": {"radio": [{"id": 0, "config": {"id": 0, "channel": 1}},'
+    ' {"id": 1, "config": {"id": 1, "channel": 36}}]}}',
+    '{"ssid": [{"name": "a", "enabled": true}, {"name": "b"}]}',
+    '{"entry": [{"config": {"x": 1}}, {"config": {"x": 2}}]}',
+    '{"entry": [{"id": 0, "tags": ["a", "b"], "c": {"d": 1}}]}',
+]
+
+_MALFORMED = [
+    '',
+    '{',
+    '{"a": 1',
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{"a": 1,}',
+    '{, "a": 1}',
+    '{"a": 1,, "b": 2}',
+    '{"a": [1 2]}',
+    '{"a": [1,]}',
+    '{"a": [,1]}',
+    '{"a": [1, 2}',
+    '{"a": {"b": 1]}',
+    '{"a": [{"b": 1} {"b": 2}]}',
+    '{"a": [{"b": 1},]}',
+    '{"a": 1} x',
+    '{"a": 1}}',
+    '{"a": tru}',
+    '1 2',
+]
+
+
+def _Elems(xpath):
+  """Returns the (name, keys) of each elem of xpath, as ParsePath builds it."""
+  path = gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+  return [(elem.name, dict(elem.key)) for elem in path.elem]
+
+
+class ParsePathTest(unittest.TestCase):
+
+  def testKeys(self):
+    self.assertEqual(
+        _Elems('/a/b[k=v]/c[k=v][j=w]'),
+        [('a', {}), ('b', {'k': 'v'}), ('c', {'k': 'v', 'j': 'w'})])
+
+  def testSlashInValue(self):
+    self.assertEqual(
+        _Elems('/interfaces/interface[name=Ethernet1/1]/state'),
+        [('interfaces', {}), ('interface', {'name': 'Ethernet1/1'}),
+         ('state', {})])
+
+  def testEscapedBracketInValue(self):
+    self.assertEqual(_Elems('/a[k=x\\]y]/b'), [('a', {'k': 'x]y'}), ('b', {})])
+    self.assertEqual(_Elems('/a[k=x\\]][j=\\\\]'),
+                     [('a', {'k': 'x]', 'j': '\\'})])
+
+  def testEscapedName(self):
+    self.assertEqual(_Elems('/a\\/b/c\\[d[k=v]'),
+                     [('a/b', {}), ('c[d', {'k': 'v'})])
+
+  def testUnescapedBracketInValue(self):
+    for xpath in ('/a[k=x]y]', '/a[k=x]y]/b', '/a[k=x]junk[j=y]', '/a[k=v]]'):
+      with self.assertRaises(gnmi_lib.XpathError, msg=xpath):
+        _Elems(xpath)
+
+  def testMalformed(self):
+    for xpath in ('/a[k=v', '/[k=v]', '/a[=v]', '/a[k]', '/a//b'):
+      with self.assertRaises(gnmi_lib.XpathError, msg=xpath):
+        _Elems(xpath)
+
+  def testPathToXpathRoundTrip(self):
+    for xpath in ('/a/b[k=v]', '/a[k=x\\]y]', '/a[k=1/2]/b', '/a[k=\\\\]'):
+      path = gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+      self.assertEqual(gnmi_lib.ParsePath(gnmi_lib.PathNames(
+          gnmi_lib.PathToXpath(path))), path, xpath)
+
+
+class IterJsonLeavesTest(unittest.TestCase):
+
+  def testMatchesJsonLoads(self):
+    for text in _VALID:
+      self.assertEqual(list(gnmi_lib.IterJsonLeaves(text)),
+                       list(_JsonLeaves(json.loads(text))), text)
+
+  def testRejectsMalformed(self):
+    for text in _MALFORMED:
+      with self.assertRaises(gnmi_lib.Error, msg=text):
+        list(gnmi_lib.IterJsonLeaves(text))
+
+  def testRootScalar(self):
+    self.assertEqual(list(gnmi_lib.IterJsonLeaves(b'7', prefix='/a')),
+                     [('/a', 7)])
+
+  def testSubtrees(self):
+    text = _VALID[6]
+    self.assertEqual(
+        list(gnmi_lib.IterJsonLeaves(text, ['/radios/radio[id=1]/config'])),
+        [('/radios/radio[id=1]/config/id', 1),
+         ('/radios/radio[id=1]/config/channel', 36)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,262 @@
+"""Instrumentation of gNMI RPCs made by gnmi_lib.
+
+gnmi_lib reports the latency, request/response sizes, decode time and gRPC
+status of every RPC to a collector, set with gnmi_lib.SetCollector(). The
+default NullCollector records nothing and costs nothing, as gnmi_lib skips the
+measurements altogether. MetricsCollector keeps per-target, per-RPC histograms
+and counters, and renders them in the Prometheus text exposition format.
+
+Example:
+  collector = gnmi_metrics.MetricsCollector()
+  gnmi_lib.SetCollector(collector)
+  ...
+  gnmi_metrics.WriteTextfile(collector, '/var/lib/node_exporter/gnmi.prom')
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import bisect
+import os
+import tempfile
+import threading
+
+# Upper bounds, in seconds, of the latency and decode time buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Upper bounds, in bytes, of the message size buckets.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+
+class NullCollector(object):
+  """Collector recording nothing; the default."""
+
+  enabled = False
+
+  def ObserveLatency(self, target, rpc, seconds):
+    """Records the time a Target took to answer an RPC."""
+
+  def ObserveBytes(self, target, rpc, request_bytes=None, response_bytes=None):
+    """Records the serialized size of a request and/or response message."""
+
+  def ObserveDecode(self, target, rpc, seconds):
+    """Records the time spent decoding a response."""
+
+  def CountStatus(self, target, rpc, code):
+    """Counts an RPC attempt which ended with code, a grpc.StatusCode name."""
+
+  def SetGauge(self, target, name, value):
+    """Sets the current value of a gauge, eg. the depth of a write queue."""
+
+  def CountTicksSkipped(self, reason, count=1):
+    """Counts ticks of a monitoring schedule which did not run."""
+
+  def ObserveTickLate(self, seconds):
+    """Records how late a tick of a monitoring schedule ran, or would have."""
+
+
+class Histogram(object):
+  """Counts of observations falling in fixed buckets, with their sum."""
+
+  def __init__(self, buckets):
+    self.buckets = tuple(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf.
+    self.sum = 0
+    self.count = 0
+
+  def Observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def Cumulative(self):
+    """Returns (upper bound, count of observations <= bound) tuples."""
+    total = 0
+    cumulative = []
+    for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+      total += count
+      cumulative.append((bound, total))
+    return cumulative
+
+
+def _EscapeLabel(value):
+  return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+          .replace('\n', '\\n'))
+
+
+def _Labels(names, values, *extras):
+  labels = ','.join(['%s="%s"' % (name, _EscapeLabel(value))
+                     for name, value in zip(names, values)] +
+                    [extra for extra in extras if extra])
+  return '{%s}' % labels
+
+
+def _FormatBound(bound):
+  return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _AppendHistogram(lines, name, histogram, names, values, const_labels):
+  """Appends the bucket, sum and count lines of a histogram to lines."""
+  for bound, count in histogram.Cumulative():
+    bucket_labels = _Labels(names, values, const_labels,
+                            'le="%s"' % _FormatBound(bound))
+    lines.append('%s_bucket%s %d' % (name, bucket_labels, count))
+  labels = _Labels(names, values, const_labels)
+  if labels == '{}':
+    labels = ''
+  lines.append('%s_sum%s %r' % (name, labels, float(histogram.sum)))
+  lines.append('%s_count%s %d' % (name, labels, histogram.count))
+
+
+class MetricsCollector(NullCollector):
+  """Keeps per-target, per-RPC histograms and status counts.
+
+  Also counts the ticks a monitoring schedule skipped, by reason, and how late
+  its ticks ran; those belong to the collector itself, not to a Target.
+  """
+
+  enabled = True
+
+  _HISTOGRAMS = (
+      # (attribute, metric name, help, bucket attribute)
+      ('latency', 'gnmi_rpc_latency_seconds',
+       'Time the Target took to answer a gNMI RPC.', 'latency_buckets'),
+      ('request_bytes', 'gnmi_rpc_request_bytes',
+       'Serialized size of gNMI request messages.', 'size_buckets'),
+      ('response_bytes', 'gnmi_rpc_response_bytes',
+       'Serialized size of gNMI response messages.', 'size_buckets'),
+      ('decode', 'gnmi_decode_seconds',
+       'Time spent decoding gNMI responses.', 'latency_buckets'),
+  )
+
+  def __init__(self, latency_buckets=LATENCY_BUCKETS,
+               size_buckets=SIZE_BUCKETS, labels=None):
+    """Initializes an empty collector.
+
+    Args:
+      latency_buckets: (tuple) Upper bounds of time buckets, in seconds.
+      size_buckets: (tuple) Upper bounds of message size buckets, in bytes.
+      labels: (dict) Label name to value added to every metric, eg. to tell
+        apart the worker processes of a sharded collector.
+    """
+    self.latency_buckets = latency_buckets
+    self.size_buckets = size_buckets
+    self._const_labels = ','.join(
+        '%s="%s"' % (name, _EscapeLabel(value))
+        for name, value in sorted((labels or {}).items()))
+    self._lock = threading.Lock()
+    self.Reset()
+
+  def Reset(self):
+    """Drops every observation."""
+    with self._lock:
+      for attribute, _, _, _ in self._HISTOGRAMS:
+        setattr(self, attribute, {})  # (target, rpc): Histogram
+      self.status = {}  # (target, rpc, code): count
+      self.gauges = {}  # (name, target): value
+      self.ticks_skipped = {}  # reason: count
+      self.tick_late = Histogram(self.latency_buckets)
+
+  def _Observe(self, histograms, buckets, target, rpc, value):
+    with self._lock:
+      histogram = histograms.get((target, rpc))
+      if histogram is None:
+        histogram = histograms[(target, rpc)] = Histogram(buckets)
+      histogram.Observe(value)
+
+  def ObserveLatency(self, target, rpc, seconds):
+    self._Observe(self.latency, self.latency_buckets, target, rpc, seconds)
+
+  def ObserveBytes(self, target, rpc, request_bytes=None, response_bytes=None):
+    if request_bytes is not None:
+      self._Observe(self.request_bytes, self.size_buckets, target, rpc,
+                    request_bytes)
+    if response_bytes is not None:
+      self._Observe(self.response_bytes, self.size_buckets, target, rpc,
+                    response_bytes)
+
+  def ObserveDecode(self, target, rpc, seconds):
+    self._Observe(self.decode, self.latency_buckets, target, rpc, seconds)
+
+  def CountStatus(self, target, rpc, code):
+    key = (target, rpc, code)
+    with self._lock:
+      self.status[key] = self.status.get(key, 0) + 1
+
+  def SetGauge(self, target, name, value):
+    with self._lock:
+      self.gauges[(name, target)] = value
+
+  def CountTicksSkipped(self, reason, count=1):
+    with self._lock:
+      self.ticks_skipped[reason] = self.ticks_skipped.get(reason, 0) + count
+
+  def ObserveTickLate(self, seconds):
+    with self._lock:
+      self.tick_late.Observe(seconds)
+
+  def PrometheusText(self):
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    with self._lock:
+      for attribute, name, help_text, _ in self._HISTOGRAMS:
+        histograms = getattr(self, attribute)
+        if not histograms:
+          continue
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s histogram' % name)
+        for key in sorted(histograms):
+          _AppendHistogram(lines, name, histograms[key], ('target', 'rpc'),
+                           key, self._const_labels)
+      if self.status:
+        lines.append('# HELP gnmi_rpc_status_total gNMI RPC attempts by gRPC '
+                     'status code.')
+        lines.append('# TYPE gnmi_rpc_status_total counter')
+        for key in sorted(self.status):
+          lines.append('gnmi_rpc_status_total%s %d' % (
+              _Labels(('target', 'rpc', 'code'), key, self._const_labels),
+              self.status[key]))
+      last_name = None
+      for name, target in sorted(self.gauges):
+        if name != last_name:
+          lines.append('# TYPE %s gauge' % name)
+          last_name = name
+        lines.append('%s%s %r' % (
+            name, _Labels(('target',), (target,), self._const_labels),
+            float(self.gauges[(name, target)])))
+      if self.ticks_skipped:
+        lines.append('# HELP monitor_ticks_skipped_total Ticks of the '
+                     'monitoring schedule which did not run, by reason.')
+        lines.append('# TYPE monitor_ticks_skipped_total counter')
+        for reason in sorted(self.ticks_skipped):
+          lines.append('monitor_ticks_skipped_total%s %d' % (
+              _Labels(('reason',), (reason,), self._const_labels),
+              self.ticks_skipped[reason]))
+      if self.tick_late.count:
+        lines.append('# HELP monitor_tick_late_seconds Time past its deadline '
+                     'a tick of the monitoring schedule ran, or was skipped.')
+        lines.append('# TYPE monitor_tick_late_seconds histogram')
+        _AppendHistogram(lines, 'monitor_tick_late_seconds', self.tick_late,
+                         (), (), self._const_labels)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def WriteTextfile(collector, path):
+  """Atomically writes the metrics of collector to path.
+
+  The file is suitable for the node_exporter textfile collector.
+
+  Args:
+    collector: (MetricsCollector) Metrics to write.
+    path: (str) File to write.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write(collector.PrometheusText())
+    os.rename(tmp_path, path)
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
@@ -0,0 +1,137 @@
+"""Inventory of the access-points to provision, configure and monitor.
+
+An inventory lists, for every AP, its name (hostname), MAC address and gNMI
+Target (IP/FQDN:TCP_PORT of the AP, or of its ap-manager), and optionally
+the SSIDs it is to broadcast. It is read from any of:
+
+  CSV, with a header row:
+    name,mac,target,ssids
+    ap-01.example.net,00:11:74:87:C0:7F,10.0.0.1:8080,open;psk
+
+  YAML (requires PyYAML), a list of mappings:
+    - {name: ap-01.example.net, mac: '00:11:74:87:C0:7F',
+       target: 'openconfig.mist.com:443', ssids: [open, psk]}
+
+  JSON lines, one object per line:
+    {"name": "ap-01.example.net", "mac": "00:11:74:87:C0:7F", ...}
+
+The format is chosen from the file extension: .csv, .yaml/.yml, or
+.jsonl/.json.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import csv
+import json
+import os
+import six
+
+try:
+  import yaml  # pylint: disable=g-import-not-at-top
+except ImportError:
+  yaml = None
+
+_REQUIRED = ('name', 'mac', 'target')
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class InventoryEntry(collections.namedtuple('InventoryEntry', [
+    'name', 'mac', 'target', 'ssids'])):
+  """An access-point of the inventory.
+
+  Attributes:
+    name: (str) Access Point hostname.
+    mac: (str) Access Point MAC address.
+    target: (str) gNMI Target IP/FQDN:TCP_PORT.
+    ssids: (tuple) SSIDs to configure on the AP; empty if not listed.
+  """
+
+
+def _Entry(fields, source):
+  """Returns the InventoryEntry of a row, validating it."""
+  if not isinstance(fields, dict):
+    raise Error('%s: expected a mapping, got %r' % (source, fields))
+  missing = [name for name in _REQUIRED if not fields.get(name)]
+  if missing:
+    raise Error('%s: missing %s' % (source, ', '.join(missing)))
+  target = str(fields['target'])
+  if ':' not in target:
+    raise Error('%s: target %r is not IP/FQDN:TCP_PORT' % (source, target))
+  ssids = fields.get('ssids') or ()
+  if isinstance(ssids, six.string_types):
+    ssids = [ssid for ssid in ssids.split(';') if ssid]
+  return InventoryEntry(str(fields['name']), str(fields['mac']), target,
+                        tuple(str(ssid) for ssid in ssids))
+
+
+def _ReadCsv(f, path):
+  for line, row in enumerate(csv.DictReader(f), 2):
+    yield _Entry(row, '%s:%d' % (path, line))
+
+
+def _ReadYaml(f, path):
+  if yaml is None:
+    raise Error('PyYAML is required to read %s' % path)
+  try:
+    rows = yaml.safe_load(f) or []
+  except yaml.YAMLError as e:
+    raise Error('%s: %s' % (path, e))
+  if not isinstance(rows, list):
+    raise Error('%s: expected a list of access-points' % path)
+  for index, row in enumerate(rows):
+    yield _Entry(row, '%s[%d]' % (path, index))
+
+
+def _ReadJsonLines(f, path):
+  for line, text in enumerate(f, 1):
+    if not text.strip():
+      continue
+    try:
+      row = json.loads(text)
+    except ValueError as e:
+      raise Error('%s:%d: %s' % (path, line, e))
+    yield _Entry(row, '%s:%d' % (path, line))
+
+
+_READERS = {
+    '.csv': _ReadCsv,
+    '.yaml': _ReadYaml,
+    '.yml': _ReadYaml,
+    '.json': _ReadJsonLines,
+    '.jsonl': _ReadJsonLines,
+}
+
+
+def Load(path):
+  """Reads an inventory file.
+
+  Args:
+    path: (str) CSV, YAML or JSON lines file; see the module docstring.
+
+  Returns:
+    list of InventoryEntry, in the order of the file.
+
+  Raises:
+    Error: The file is malformed, lists no AP or an AP twice, or is of an
+      unknown format.
+  """
+  reader = _READERS.get(os.path.splitext(path)[1].lower())
+  if reader is None:
+    raise Error('Unknown inventory format of %s; expected one of %s' % (
+        path, ', '.join(sorted(_READERS))))
+  entries = []
+  seen = set()
+  with open(path) as f:
+    for entry in reader(f, path):
+      if entry.name in seen:
+        raise Error('%s: %s is listed more than once' % (path, entry.name))
+      seen.add(entry.name)
+      entries.append(entry)
+  if not entries:
+    raise Error('%s: lists no access-points' % path)
+  return entries
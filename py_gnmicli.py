@@ -18,10 +18,11 @@ This utility can be utilized as a reference, or standalone utility, for
 interacting with Network Elements which support OpenConfig and gNMI.
 
 Current supported gNMI features:
+- CapabilityRequest
 - GetRequest
 - SetRequest (Update, Replace, Delete)
 - Target hostname override
-- Auto-loads Target cert from Target if not specified
+- Auto-loads Target cert from Target if not specified, cached between runs
 - User/password based authentication
 - Certifificate based authentication
 
@@ -36,8 +37,6 @@ import argparse
 import json
 import logging
 import os
-import re
-import ssl
 import sys
 import six
 try:
@@ -47,19 +46,11 @@ except ImportError:
         'sudo apt-get install -y pip\n'
         'sudo pip install --no-binary=protobuf -I grpcio-tools==1.15.0')
 import gnmi_pb2_grpc
+import certs_lib
+import gnmi_lib
 
 __version__ = '0.3'
 
-_RE_PATH_COMPONENT = re.compile(r'''
-^
-(?P<pname>[^[]+)  # gNMI path name
-(\[(?P<key>\w+)   # gNMI path key
-=
-(?P<value>.*)    # gNMI path value
-\])?$
-''', re.VERBOSE)
-
-
 class Error(Exception):
   """Module-level Exception class."""
 
@@ -104,7 +95,8 @@ def _create_parser():
                       'when establishing a gNMI Channel to the Target',
                       required=False)
   parser.add_argument('-m', '--mode', choices=[
-      'get', 'set-update', 'set-replace', 'set-delete', 'subscribe'], help=
+      'get', 'set-update', 'set-replace', 'set-delete', 'subscribe',
+      'capabilities'], help=
                       'Mode of operation when interacting with network element.'
                       ' Default=get. If set, it can be either value \nor JSON '
                       'file (prepend filename with "@")', default='get')
@@ -125,15 +117,37 @@ def _create_parser():
   parser.add_argument('-g', '--get_cert', help='Obtain certificate from gNMI '
                       'Target when establishing secure gRPC channel.',
                       required=False, action='store_true')
+  parser.add_argument('--cert_cache_dir', type=str, help='Directory the '
+                      'certificates obtained with --get_cert are cached in. '
+                      'Empty to disable the on-disk cache.',
+                      default=certs_lib.DEFAULT_CACHE_DIR, required=False)
+  parser.add_argument('--cert_fingerprint', type=str, help='Expected sha256 '
+                      'fingerprint of the certificate obtained with '
+                      '--get_cert.', required=False)
   parser.add_argument('-x', '--xpath', type=str, help='The gNMI path utilized'
-                      'in the GetRequest or Subscirbe', required=True)
+                      'in the GetRequest or Subscirbe. Required for every mode'
+                      ' except capabilities', required=False)
   parser.add_argument('-o', '--host_override', type=str, help='Use this as '
                       'Targets hostname/peername when checking it\'s'
                       'certificate CN. You can check the cert with:\nopenssl '
                       'x509 -in certificate.crt -text -noout', required=False)
+  parser.add_argument('--compression', choices=['gzip', 'deflate'],
+                      help='Compression requested on the gRPC channel.',
+                      required=False)
+  parser.add_argument('--max_receive_message_length', type=int, help='Largest'
+                      ' response accepted from the Target, in bytes.',
+                      required=False)
+  parser.add_argument('--keepalive_time_ms', type=int, help='Interval between'
+                      ' HTTP/2 keepalive pings.', required=False)
+  parser.add_argument('--http2_initial_window_size', type=int, help='Initial '
+                      'HTTP/2 stream window, in bytes.', required=False)
+  parser.add_argument('--initial_reconnect_backoff_ms', type=int, help='First'
+                      ' backoff after a failed connection.', required=False)
   parser.add_argument('-f', '--format', type=str, action='store', help='Format '
-                      'of the GetResponse to be printed. Default=JSON.',
-                      choices=['json', 'protobuff'], default='json',
+                      'of the GetResponse to be printed: json, protobuff, or '
+                      'leaves for one "xpath: value" line per leaf, printed '
+                      'as it is decoded. Default=JSON.',
+                      choices=['json', 'protobuff', 'leaves'], default='json',
                       required=False)
   parser.add_argument('-V', '--version', help='Print program version',
                       action='store_true', required=False)
@@ -152,10 +166,14 @@ def _path_names(xpath):
 
   Returns:
     list of gNMI path names.
+
+  Raises:
+    XpathError: Unabled to parse the xpath provided.
   """
-  if not xpath or xpath == '/':  # A blank xpath was provided at CLI.
-    return []
-  return xpath.strip().strip('/').split('/')  # Remove leading and trailing '/'.
+  try:
+    return gnmi_lib.PathNames(xpath)
+  except gnmi_lib.XpathError as e:
+    raise XpathError(str(e))
 
 
 def _parse_path(p_names):
@@ -170,20 +188,31 @@ def _parse_path(p_names):
   Raises:
     XpathError: Unabled to parse the xpath provided.
   """
-  gnmi_elems = []
-  for word in p_names:
-    word_search = _RE_PATH_COMPONENT.search(word)
-    if not word_search:  # Invalid path specified.
-      raise XpathError('xpath component parse error: %s' % word)
-    if word_search.group('key') is not None:  # A path key was provided.
-      gnmi_elems.append(gnmi_pb2.PathElem(name=word_search.group(
-          'pname'), key={word_search.group('key'): word_search.group('value')}))
-    else:
-      gnmi_elems.append(gnmi_pb2.PathElem(name=word, key={}))
-  return gnmi_pb2.Path(elem=gnmi_elems)
+  try:
+    return gnmi_lib.ParsePath(p_names)
+  except gnmi_lib.XpathError as e:
+    raise XpathError(str(e))
+
 
+def _create_channel(creds, target, port, host_override, options=None):
+  """Creates the secure channel used by the gNMI Stub.
 
-def _create_stub(creds, target, port, host_override):
+  Args:
+    creds: (object) of gNMI Credentials class used to build the secure channel.
+    target: (str) gNMI Target.
+    port: (str) gNMI Target IP port.
+    host_override: (str) Hostname being overridden for Cert check.
+    options: (gnmi_lib.ChannelOptions) Optional compression and tuning.
+
+  Returns:
+    a grpc.Channel object.
+  """
+  return gnmi_pb2_grpc.grpc.secure_channel(
+      target + ':' + port, creds,
+      gnmi_lib.ChannelArgs(host_override, options))
+
+
+def _create_stub(creds, target, port, host_override, options=None):
   """Creates a gNMI Stub.
 
   Args:
@@ -191,16 +220,22 @@ def _create_stub(creds, target, port, host_override):
     target: (str) gNMI Target.
     port: (str) gNMI Target IP port.
     host_override: (str) Hostname being overridden for Cert check.
+    options: (gnmi_lib.ChannelOptions) Optional compression and tuning.
 
   Returns:
     a gnmi_pb2_grpc object representing a gNMI Stub.
   """
-  if host_override:
-    channel = gnmi_pb2_grpc.grpc.secure_channel(target + ':' + port, creds, ((
-        'grpc.ssl_target_name_override', host_override,),))
-  else:
-    channel = gnmi_pb2_grpc.grpc.secure_channel(target + ':' + port, creds)
-  return gnmi_pb2_grpc.gNMIStub(channel)
+  return gnmi_pb2_grpc.gNMIStub(
+      _create_channel(creds, target, port, host_override, options))
+
+
+def _channel_ready(channel, timeout=5):
+  """Returns True once the channel has connected, including TLS handshake."""
+  try:
+    gnmi_pb2_grpc.grpc.channel_ready_future(channel).result(timeout=timeout)
+    return True
+  except gnmi_pb2_grpc.grpc.FutureTimeoutError:
+    return False
 
 
 def _format_type(json_value):
@@ -298,7 +333,8 @@ def _set(stub, paths, set_type, username, password, json_value):
   return stub.Set(gnmi_pb2.SetRequest(replace=[path_val]), **kwargs)
 
 
-def _build_creds(target, port, get_cert, root_cert, cert_chain, private_key):
+def _build_creds(target, port, get_cert, root_cert, cert_chain, private_key,
+                 refresh=False):
   """Define credentials used in gNMI Requests.
 
   Args:
@@ -308,13 +344,13 @@ def _build_creds(target, port, get_cert, root_cert, cert_chain, private_key):
     root_cert: (str) Root certificate to use in the gRPC channel.
     cert_chain: (str) Certificate chain to use in the gRPC channel.
     private_key: (str) Private key to use in the gRPC channel.
+    refresh: (bool) Re-obtain the certificate rather than using the cache.
 
   Returns:
     a gRPC.ssl_channel_credentials object.
   """
   if get_cert:
-    logging.info('Obtaining certificate from Target')
-    rcert = ssl.get_server_certificate((target, port)).encode('utf-8')
+    rcert = certs_lib.CERT_CACHE.Get(target, port, refresh)
     return gnmi_pb2_grpc.grpc.ssl_channel_credentials(
         root_certificates=rcert, private_key=private_key,
         certificate_chain=cert_chain)
@@ -342,6 +378,20 @@ def _open_certs(**kwargs):
   return kwargs
 
 
+def _print_leaves(response):
+  """Prints every leaf of a GetResponse, without building its JSON."""
+  for notification in response.notification:
+    for update in notification.update:
+      xpath = gnmi_lib.PathToXpath(update.path, notification.prefix)
+      if update.val.WhichOneof('value') in ('json_ietf_val', 'json_val'):
+        json_value = update.val.json_ietf_val or update.val.json_val
+        leaves = gnmi_lib.IterJsonLeaves(json_value, prefix=xpath.rstrip('/'))
+      else:
+        leaves = [(xpath, gnmi_lib.DecodeTypedValue(update.val))]
+      for leaf_xpath, value in leaves:
+        print('%s: %s' % (leaf_xpath, json.dumps(value)))
+
+
 def main():
   argparser = _create_parser()
   args = vars(argparser.parse_args())
@@ -364,13 +414,35 @@ def main():
   user = args['username']
   password = args['password']
   form = args['format']
+  if not xpath and mode != 'capabilities':
+    argparser.error('the following arguments are required: -x/--xpath')
   paths = _parse_path(_path_names(xpath))
   kwargs = {'root_cert': root_cert, 'cert_chain': cert_chain,
             'private_key': private_key}
   certs = _open_certs(**kwargs)
+  certs_lib.CERT_CACHE.cache_dir = (
+      os.path.expanduser(args['cert_cache_dir']) or None)
+  if args['cert_fingerprint']:
+    certs_lib.CERT_CACHE.pins['%s:%s' % (target, port)] = (
+        args['cert_fingerprint'])
   creds = _build_creds(target, port, get_cert, certs['root_cert'],
                        certs['cert_chain'], certs['private_key'])
-  stub = _create_stub(creds, target, port, host_override)
+  options = gnmi_lib.ChannelOptions(
+      compression=args['compression'],
+      max_receive_message_length=args['max_receive_message_length'],
+      keepalive_time_ms=args['keepalive_time_ms'],
+      http2_initial_window_size=args['http2_initial_window_size'],
+      initial_reconnect_backoff_ms=args['initial_reconnect_backoff_ms'])
+  channel = _create_channel(creds, target, port, host_override, options)
+  if get_cert and not _channel_ready(channel):
+    # The cached certificate may be stale; obtain it again from the Target.
+    logging.info('TLS handshake failed, refreshing certificate of Target')
+    channel.close()
+    creds = _build_creds(target, port, get_cert, certs['root_cert'],
+                         certs['cert_chain'], certs['private_key'],
+                         refresh=True)
+    channel = _create_channel(creds, target, port, host_override, options)
+  stub = gnmi_pb2_grpc.gNMIStub(channel)
   if mode == 'get':
     print('Performing GetRequest, encoding=JSON_IETF', 'to', target,
           ' with the following gNMI Path\n', '-'*25, '\n', paths)
@@ -378,6 +450,8 @@ def main():
     print('The GetResponse is below\n' + '-'*25 + '\n')
     if form == 'protobuff':
       print(response)
+    elif form == 'leaves':
+      _print_leaves(response)
     elif response.notification[0].update[0].val.json_ietf_val:
       print(json.dumps(json.loads(response.notification[0].update[0].val.
                                   json_ietf_val), indent=2))
@@ -402,6 +476,10 @@ def main():
   elif mode == 'subscribe':
     print('This mode not available in this version')
     sys.exit()
+  elif mode == 'capabilities':
+    print('Performing CapabilityRequest to', target)
+    response = gnmi_lib.Capabilities(stub, user, password)
+    print('The CapabilityResponse is below\n' + '-'*25 + '\n', response)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,389 @@
+"""Record and replay of gNMI sessions, for offline performance testing.
+
+RecordingStub wraps a gNMI Stub and writes every request and response sent
+over it, with its timing, to a Recorder. A recording is a compact sequence of
+length-prefixed records, each holding a serialized gnmi_pb2 message:
+
+  file header:  magic (8 bytes), wall clock time of the recording (double)
+  record:       call id (uint32), rpc (uint8), direction (uint8),
+                offset from the start in seconds (double), length (uint32),
+                followed by length bytes of payload.
+
+ReplayServicer serves a recording back as a gNMI Target: every request is
+answered with the response recorded for the same request, after the latency
+recorded, and Subscribe streams are replayed at their recorded pace, scaled
+by a speed factor.
+
+Example, recording the monitor against production Targets:
+  python wlpc-gnmi.py --mode monitor --gnmi_record monitor.gnmirec
+
+and replaying it ten times faster:
+  python record_lib.py monitor.gnmirec --speed 10 --port 10161 \\
+      --cert server.crt --key server.key
+
+Only the synchronous Stub is recorded; gnmi_async_lib channels are not.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import collections
+import itertools
+import logging
+import struct
+import threading
+import time
+import six
+import gnmi_pb2
+import gnmi_pb2_grpc
+
+grpc = gnmi_pb2_grpc.grpc
+
+_MAGIC = b'GNMIREC1'
+_FILE_HEADER = struct.Struct('!8sd')
+_HEADER = struct.Struct('!IBBdI')
+
+RPCS = ('Capabilities', 'Get', 'Set', 'Subscribe')
+REQUEST, RESPONSE, ERROR = 0, 1, 2
+_MESSAGES = {
+    ('Capabilities', REQUEST): gnmi_pb2.CapabilityRequest,
+    ('Capabilities', RESPONSE): gnmi_pb2.CapabilityResponse,
+    ('Get', REQUEST): gnmi_pb2.GetRequest,
+    ('Get', RESPONSE): gnmi_pb2.GetResponse,
+    ('Set', REQUEST): gnmi_pb2.SetRequest,
+    ('Set', RESPONSE): gnmi_pb2.SetResponse,
+    ('Subscribe', REQUEST): gnmi_pb2.SubscribeRequest,
+    ('Subscribe', RESPONSE): gnmi_pb2.SubscribeResponse,
+}
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class Record(collections.namedtuple('Record', [
+    'call_id', 'rpc', 'direction', 'offset', 'payload'])):
+  """A request, response or error recorded on a call.
+
+  Attributes:
+    call_id: (int) Identifies the RPC; shared by a stream's messages.
+    rpc: (str) One of RPCS.
+    direction: (int) REQUEST, RESPONSE or ERROR.
+    offset: (float) Seconds since the start of the recording.
+    payload: (bytes) Serialized message; for an ERROR, the status code name
+      and details separated by a newline.
+  """
+
+  def Message(self):
+    """Returns the gnmi_pb2 message of a REQUEST or RESPONSE."""
+    return _MESSAGES[(self.rpc, self.direction)].FromString(self.payload)
+
+  def Status(self):
+    """Returns the (grpc.StatusCode, details) of an ERROR."""
+    code, _, details = self.payload.decode('utf-8').partition('\n')
+    return grpc.StatusCode[code], details
+
+
+class Recorder(object):
+  """Writes records to a file; safe to share between threads and Stubs."""
+
+  def __init__(self, path, flush_interval=1.0):
+    """Creates the recording, truncating any file at path.
+
+    Args:
+      path: (str) File to write to.
+      flush_interval: (float) Most seconds a record stays buffered, so a
+        recording process which is killed loses little.
+    """
+    self._file = open(path, 'wb')
+    self._lock = threading.Lock()
+    self._call_ids = itertools.count(1)
+    self.flush_interval = flush_interval
+    self.start = self._flushed = time.time()
+    self._file.write(_FILE_HEADER.pack(_MAGIC, self.start))
+
+  def NewCall(self):
+    """Returns the id of a new call."""
+    with self._lock:
+      return next(self._call_ids)
+
+  def Write(self, call_id, rpc, direction, payload):
+    """Appends a record, timed now."""
+    now = time.time()
+    header = _HEADER.pack(call_id, RPCS.index(rpc), direction,
+                          now - self.start, len(payload))
+    with self._lock:
+      if self._file.closed:
+        return  # Late responses of a stream cancelled by Close().
+      self._file.write(header)
+      self._file.write(payload)
+      if now - self._flushed >= self.flush_interval:
+        self._file.flush()
+        self._flushed = now
+
+  def WriteError(self, call_id, rpc, error):
+    """Appends the status of a failed call, from a grpc.RpcError."""
+    self.Write(call_id, rpc, ERROR,
+               ('%s\n%s' % (error.code().name, error.details() or '')
+               ).encode('utf-8'))
+
+  def Close(self):
+    with self._lock:
+      self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused_exc_info):
+    self.Close()
+
+
+def ReadRecords(path):
+  """Reads a recording.
+
+  Args:
+    path: (str) File written by a Recorder.
+
+  Yields:
+    Record tuples, in the order they were recorded.
+
+  Raises:
+    Error: The file is not a recording.
+  """
+  with open(path, 'rb') as f:
+    magic, _ = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+    if magic != _MAGIC:
+      raise Error('%s is not a gNMI recording' % path)
+    while True:
+      header = f.read(_HEADER.size)
+      if len(header) < _HEADER.size:
+        return  # A truncated last record is dropped.
+      call_id, rpc, direction, offset, length = _HEADER.unpack(header)
+      payload = f.read(length)
+      if len(payload) < length:
+        return
+      yield Record(call_id, RPCS[rpc], direction, offset, payload)
+
+
+class _RecordingUnary(object):
+  """Records the calls of a unary-unary method of a Stub."""
+
+  def __init__(self, recorder, rpc, stub):
+    self._recorder = recorder
+    self._rpc = rpc
+    self._stub = stub  # Looked up per call; see gnmi_lib.ChannelPool.Rebind.
+
+  def __call__(self, request, *args, **kwargs):
+    call_id = self._recorder.NewCall()
+    self._recorder.Write(call_id, self._rpc, REQUEST,
+                         request.SerializeToString())
+    try:
+      response = getattr(self._stub, self._rpc)(request, *args, **kwargs)
+    except grpc.RpcError as e:
+      self._recorder.WriteError(call_id, self._rpc, e)
+      raise
+    self._recorder.Write(call_id, self._rpc, RESPONSE,
+                         response.SerializeToString())
+    return response
+
+
+class _RecordingStream(object):
+  """Iterates a Subscribe call's responses, recording them as they arrive."""
+
+  def __init__(self, recorder, call_id, call):
+    self._recorder = recorder
+    self._call_id = call_id
+    self._call = call
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    try:
+      response = next(self._call)
+    except grpc.RpcError as e:
+      if e.code() != grpc.StatusCode.CANCELLED:
+        self._recorder.WriteError(self._call_id, 'Subscribe', e)
+      raise
+    self._recorder.Write(self._call_id, 'Subscribe', RESPONSE,
+                         response.SerializeToString())
+    return response
+
+  next = __next__
+
+  def __getattr__(self, name):  # cancel(), code(), ...
+    return getattr(self._call, name)
+
+
+class RecordingStub(object):
+  """gNMI Stub recording every request and response sent over a Stub.
+
+  The Stub wrapped keeps its pooled channel, circuit breaker and metrics
+  label in gnmi_lib.
+  """
+
+  def __init__(self, stub, recorder):
+    """Wraps stub.
+
+    Args:
+      stub: (gNMIStub) Stub to record, eg. from gnmi_lib.CreateStub.
+      recorder: (Recorder) Recording written to.
+    """
+    self.wrapped_stub = stub
+    self._recorder = recorder
+    for rpc in ('Capabilities', 'Get', 'Set'):
+      setattr(self, rpc, _RecordingUnary(recorder, rpc, stub))
+
+  def Subscribe(self, request_iterator, *args, **kwargs):
+    recorder = self._recorder
+    call_id = recorder.NewCall()
+
+    def _Requests():
+      for request in request_iterator:
+        recorder.Write(call_id, 'Subscribe', REQUEST,
+                       request.SerializeToString())
+        yield request
+
+    return _RecordingStream(recorder, call_id, self.wrapped_stub.Subscribe(
+        _Requests(), *args, **kwargs))
+
+
+def _RequestKey(record):
+  """Returns the key a request is matched on, independent of field order."""
+  return record.rpc, record.Message().SerializeToString(deterministic=True)
+
+
+class ReplayServicer(gnmi_pb2_grpc.gNMIServicer):
+  """gNMI servicer answering requests with the responses of a recording.
+
+  A request is answered by the calls recorded for an identical request, in
+  turn, cycling once they have all been served. Requests which were never
+  recorded fail with NOT_FOUND.
+  """
+
+  def __init__(self, records, speed=1.0):
+    """Indexes the recording.
+
+    Args:
+      records: (str) Path of a recording, or an iterable of Records.
+      speed: (float) Pace of the replay relative to the recording, eg. 10 to
+        replay ten times faster; float('inf') replays without any delay.
+
+    Raises:
+      Error: speed is not positive.
+    """
+    if speed <= 0:
+      raise Error('Replay speed must be positive, not %r' % speed)
+    self.speed = speed
+    if isinstance(records, six.string_types):
+      records = ReadRecords(records)
+    calls = collections.OrderedDict()
+    for record in records:
+      calls.setdefault(record.call_id, []).append(record)
+    self._lock = threading.Lock()
+    self._calls = {}  # (rpc, request bytes): deque of lists of Records
+    for call in calls.values():
+      if call[0].direction != REQUEST:
+        continue  # The recording started within the call.
+      self._calls.setdefault(_RequestKey(call[0]),
+                             collections.deque()).append(call)
+
+  def __len__(self):
+    return sum(len(calls) for calls in self._calls.values())
+
+  def _NextCall(self, rpc, request, context):
+    key = (rpc, request.SerializeToString(deterministic=True))
+    with self._lock:
+      calls = self._calls.get(key)
+      if not calls:
+        context.abort(grpc.StatusCode.NOT_FOUND,
+                      'No %s call recorded for this request' % rpc)
+      call = calls.popleft()
+      calls.append(call)
+    return call
+
+  def _Sleep(self, seconds):
+    if seconds > 0 and self.speed != float('inf'):
+      time.sleep(seconds / self.speed)
+
+  def _Unary(self, rpc, request, context):
+    call = self._NextCall(rpc, request, context)
+    if len(call) < 2:
+      context.abort(grpc.StatusCode.UNAVAILABLE,
+                    'The recording ended before the %s call did' % rpc)
+    answer = call[1]
+    self._Sleep(answer.offset - call[0].offset)
+    if answer.direction == ERROR:
+      context.abort(*answer.Status())
+    return answer.Message()
+
+  def Capabilities(self, request, context):
+    return self._Unary('Capabilities', request, context)
+
+  def Get(self, request, context):
+    return self._Unary('Get', request, context)
+
+  def Set(self, request, context):
+    return self._Unary('Set', request, context)
+
+  def Subscribe(self, request_iterator, context):
+    try:
+      request = next(request_iterator)
+    except StopIteration:
+      return
+    call = self._NextCall('Subscribe', request, context)
+    started, base = time.time(), call[0].offset
+    for record in call[1:]:
+      if record.direction == REQUEST:  # Eg. a Poll; wait for the client's.
+        try:
+          next(request_iterator)
+        except StopIteration:
+          return
+        started, base = time.time(), record.offset
+        continue
+      delay = (record.offset - base) / self.speed - (time.time() - started)
+      if delay > 0:
+        time.sleep(delay)
+      if record.direction == ERROR:
+        context.abort(*record.Status())
+      yield record.Message()
+
+
+def _create_parser():
+  parser = argparse.ArgumentParser(description='Replays a gNMI recording.')
+  parser.add_argument('recording', help='File written by a Recorder.')
+  parser.add_argument('--speed', type=float, default=1.0,
+                      help='Pace relative to the recording; inf for no delay.')
+  parser.add_argument('--port', type=int, default=10161,
+                      help='Port to listen on.')
+  parser.add_argument('--cert', help='PEM certificate; plaintext if unset.')
+  parser.add_argument('--key', help='PEM private key of the certificate.')
+  parser.add_argument('--max_workers', type=int, default=64,
+                      help='Concurrent RPCs, including Subscribe streams.')
+  return parser
+
+
+def main():
+  import fake_target  # pylint: disable=g-import-not-at-top
+  args = _create_parser().parse_args()
+  logging.basicConfig(level=logging.INFO)
+  cert = key = None
+  if args.cert:
+    with open(args.cert, 'rb') as f:
+      cert = f.read()
+    with open(args.key, 'rb') as f:
+      key = f.read()
+  servicer = ReplayServicer(args.recording, args.speed)
+  server, port = fake_target.Serve(servicer, args.port, cert, key,
+                                   args.max_workers)
+  logging.info('Replaying %d calls on port %d', len(servicer), port)
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    server.stop(0)
+
+
+if __name__ == '__main__':
+  main()
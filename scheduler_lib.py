@@ -0,0 +1,177 @@
+"""Fixed-rate tick scheduler for periodic collection from many APs.
+
+Ticks fire on absolute deadlines, multiples of the interval since the epoch,
+so the period does not drift by the time the work takes. Each AP is given a
+fixed offset within the interval, derived from its name, so the APs of a
+fleet are spread evenly across the interval rather than all hitting the
+ap-manager at once, and every process collecting an AP ticks it at the same
+phase.
+
+Ticks are never queued: when the scheduler falls behind by more than an
+interval, the missed ticks of an AP are skipped and reported as an Overrun,
+as are ticks which the callback could not start because the previous one was
+still being worked on.
+
+Example:
+  scheduler = scheduler_lib.TickScheduler(5)
+  for ap in aps:
+    scheduler.Add(ap.ap_name)
+  scheduler.Run(lambda name, tick: pool.apply_async(collect, (name,)))
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import heapq
+import itertools
+import math
+import threading
+import time
+import zlib
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class Overrun(collections.namedtuple('Overrun', [
+    'name', 'tick', 'late', 'skipped', 'busy'])):
+  """A tick of a name which did not run as scheduled.
+
+  Attributes:
+    name: (str) Name whose tick overran.
+    tick: (float) Time the tick was due, seconds since the epoch.
+    late: (float) Seconds between the tick being due and being dispatched.
+    skipped: (int) Earlier ticks dropped because they were an interval or
+      more late.
+    busy: (bool) The callback did not start the tick, as the previous one
+      was still being worked on.
+  """
+
+
+class TickScheduler(object):
+  """Dispatches the ticks of named items on absolute, jittered deadlines."""
+
+  def __init__(self, interval, spread=1.0, on_overrun=None, clock=time.time):
+    """Initializes a scheduler without any item.
+
+    Args:
+      interval: (float) Seconds between two ticks of an item.
+      spread: (float) Fraction of the interval the items' offsets are spread
+        across; 0 ticks every item at the same time.
+      on_overrun: (callable) Called with an Overrun, from the thread running
+        the scheduler; must not block.
+      clock: (callable) Returns the current time in seconds.
+
+    Raises:
+      Error: interval is not positive, or spread is not within [0, 1].
+    """
+    if interval <= 0:
+      raise Error('Tick interval must be positive, not %r' % interval)
+    if not 0 <= spread <= 1:
+      raise Error('Tick spread must be within [0, 1], not %r' % spread)
+    self.interval = interval
+    self.spread = spread
+    self.on_overrun = on_overrun
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._wakeup = threading.Event()
+    self._heap = []  # (deadline, sequence, name)
+    self._sequences = {}  # name: sequence of its entry in the heap
+    self._counter = itertools.count()
+    self.ticks = 0
+    self.skipped = 0
+    self.busy = 0
+    self.max_late = 0.0
+
+  def Offset(self, name):
+    """Returns the offset of name's ticks within the interval, in seconds."""
+    crc = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    return crc / 2.0 ** 32 * self.interval * self.spread
+
+  def _Push(self, name, deadline):
+    sequence = next(self._counter)
+    self._sequences[name] = sequence
+    heapq.heappush(self._heap, (deadline, sequence, name))
+
+  def Add(self, name):
+    """Schedules the ticks of name, from its next deadline on."""
+    offset = self.Offset(name)
+    now = self._clock()
+    deadline = (math.floor((now - offset) / self.interval) + 1) * (
+        self.interval) + offset
+    with self._lock:
+      self._Push(name, deadline)
+    self._wakeup.set()
+
+  def Remove(self, name):
+    """Stops the ticks of name."""
+    with self._lock:
+      self._sequences.pop(name, None)  # Its heap entry is dropped when due.
+
+  def __contains__(self, name):
+    return name in self._sequences
+
+  def __len__(self):
+    return len(self._sequences)
+
+  def _Report(self, overrun):
+    self.skipped += overrun.skipped
+    self.busy += overrun.busy
+    if self.on_overrun:
+      self.on_overrun(overrun)
+
+  def RunOnce(self, callback, timeout=None):
+    """Waits for the next due tick, and dispatches it.
+
+    Args:
+      callback: (callable) Called with (name, tick), the time the tick was
+        due. Returns False if it could not start the tick, as the previous
+        one is still being worked on; any other value means it started.
+      timeout: (float) Most seconds to wait for a tick to be due, or None.
+
+    Returns:
+      (bool) whether a tick was dispatched.
+    """
+    give_up = None if timeout is None else self._clock() + timeout
+    while True:
+      self._wakeup.clear()
+      with self._lock:
+        while self._heap and (self._sequences.get(self._heap[0][2]) !=
+                              self._heap[0][1]):
+          heapq.heappop(self._heap)  # Removed, or re-added since.
+        now = self._clock()
+        deadline = self._heap[0][0] if self._heap else None
+        if deadline is not None and deadline <= now:
+          _, _, name = heapq.heappop(self._heap)
+          late = now - deadline
+          skipped = int(late // self.interval)
+          tick = deadline + skipped * self.interval
+          self._Push(name, tick + self.interval)
+          break
+      wait = self.interval if deadline is None else deadline - now
+      if give_up is not None:
+        if now >= give_up:
+          return False
+        wait = min(wait, give_up - now)
+      self._wakeup.wait(wait)
+    self.ticks += 1
+    self.max_late = max(self.max_late, late - skipped * self.interval)
+    if skipped:
+      self._Report(Overrun(name, tick, late, skipped, False))
+    if callback(name, tick) is False:
+      self._Report(Overrun(name, tick, late, 0, True))
+    return True
+
+  def Run(self, callback, stop=None):
+    """Dispatches ticks until stop is set.
+
+    Args:
+      callback: (callable) See RunOnce(). It is called from this thread, so
+        it should hand long work off, eg. to a thread pool; the ticks due
+        while it runs are dispatched late, or skipped.
+      stop: (threading.Event) Ends the loop once set, or None to run forever.
+    """
+    while stop is None or not stop.is_set():
+      self.RunOnce(callback, timeout=None if stop is None else self.interval)
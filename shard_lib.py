@@ -0,0 +1,298 @@
+"""Sharding of an AP inventory across worker processes.
+
+A single CPython process is bound to one core for JSON decoding; Supervisor
+spreads the inventory across N worker processes instead, each owning the APs
+a ConsistentHashRing assigns it, with its own gNMI channels and DB client.
+
+When a worker dies, its APs are moved to the surviving workers at once and
+the worker is respawned after a backoff, taking its APs back. Resize()
+changes the number of workers. Thanks to the consistent hash, only the APs of
+the workers added or removed move.
+
+Workers are told their shard over a multiprocessing.Queue: every item put on
+it is the complete list of items the worker now owns, and None asks the
+worker to exit. A worker is run as target(worker_id, queue, *args):
+
+  def Worker(worker_id, queue):
+    for items in iter(queue.get, None):
+      ...  # Start monitoring new items, stop monitoring the others.
+
+Workers are always forked, whatever the platform's default start method, so
+they inherit the supervisor's state, eg. its parsed flags; the supervisor
+should not open gRPC channels before starting them. Where fork is not
+available, eg. on Windows, Supervisor raises Error.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import bisect
+import collections
+import hashlib
+import logging
+import multiprocessing
+import time
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+def _Hash(key):
+  return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class ConsistentHashRing(object):
+  """Maps keys to nodes, moving few keys when nodes are added or removed."""
+
+  def __init__(self, nodes=(), vnodes=100):
+    """Initializes the ring.
+
+    Args:
+      nodes: (iterable) of str, the initial nodes.
+      vnodes: (int) Points of every node on the ring; more points spread
+        the keys more evenly.
+    """
+    self.vnodes = vnodes
+    self._nodes = set()
+    self._hashes = []
+    self._owners = []
+    for node in nodes:
+      self.Add(node)
+
+  def _Rebuild(self, points):
+    points.sort()
+    self._hashes = [point for point, _ in points]
+    self._owners = [node for _, node in points]
+
+  def Add(self, node):
+    if node in self._nodes:
+      return
+    self._nodes.add(node)
+    points = list(zip(self._hashes, self._owners))
+    points.extend((_Hash('%s#%d' % (node, i)), node)
+                  for i in range(self.vnodes))
+    self._Rebuild(points)
+
+  def Remove(self, node):
+    if node not in self._nodes:
+      return
+    self._nodes.discard(node)
+    self._Rebuild([(point, owner) for point, owner
+                   in zip(self._hashes, self._owners) if owner != node])
+
+  @property
+  def nodes(self):
+    return sorted(self._nodes)
+
+  def __len__(self):
+    return len(self._nodes)
+
+  def __contains__(self, node):
+    return node in self._nodes
+
+  def Owner(self, key):
+    """Returns the node owning key.
+
+    Raises:
+      Error: The ring has no node.
+    """
+    if not self._hashes:
+      raise Error('No node to own %r' % key)
+    i = bisect.bisect(self._hashes, _Hash(key)) % len(self._hashes)
+    return self._owners[i]
+
+  def Assign(self, keys):
+    """Returns a dict of node to the list of the keys it owns."""
+    shards = dict((node, []) for node in self._nodes)
+    for key in keys:
+      shards[self.Owner(key)].append(key)
+    return shards
+
+
+def _ForkContext():
+  """Returns the multiprocessing context which forks its processes."""
+  try:
+    return multiprocessing.get_context('fork')
+  except AttributeError:  # Python 2, which always forks on POSIX.
+    return multiprocessing
+  except ValueError:
+    raise Error('Workers must be forked, which this platform cannot do')
+
+
+class _Worker(object):
+
+  def __init__(self, process, queue):
+    self.process = process
+    self.queue = queue
+    self.assigned = None  # frozenset of the keys last sent.
+    self.started = time.time()
+
+
+class Supervisor(object):
+  """Runs worker processes, each owning a consistent-hash shard of items."""
+
+  def __init__(self, target, items, processes, key=str, args=(), vnodes=100,
+               respawn_delay=1.0, max_respawn_delay=60.0):
+    """Initializes the supervisor; no worker runs before Start().
+
+    Args:
+      target: (callable) Run as target(worker_id, queue, *args) in every
+        forked worker process; see the module docstring.
+      items: (iterable) Items to shard, eg. inventory_lib.InventoryEntry.
+        They must be picklable.
+      processes: (int) Number of workers.
+      key: (callable) Returns the unique str key of an item, which it is
+        sharded on.
+      args: (tuple) More arguments passed to target.
+      vnodes: (int) Points of every worker on the ring.
+      respawn_delay: (float) Seconds before a dead worker is respawned.
+      max_respawn_delay: (float) The delay doubles every time a worker dies
+        within this many seconds of being spawned, up to this many seconds.
+
+    Raises:
+      Error: Worker processes cannot be forked on this platform.
+    """
+    self._context = _ForkContext()
+    self._target = target
+    self._key = key
+    self._args = tuple(args)
+    self.respawn_delay = respawn_delay
+    self.max_respawn_delay = max_respawn_delay
+    self._items = collections.OrderedDict()
+    self._ring = ConsistentHashRing(vnodes=vnodes)
+    self._workers = {}  # worker_id: _Worker
+    self._respawns = {}  # worker_id: (respawn at, delay)
+    self.processes = processes
+    self.deaths = 0
+    self.SetItems(items, rebalance=False)
+
+  @staticmethod
+  def WorkerId(index):
+    return 'worker-%d' % index
+
+  def _Spawn(self, worker_id):
+    queue = self._context.Queue()
+    process = self._context.Process(
+        target=self._target, args=(worker_id, queue) + self._args,
+        name=worker_id)
+    process.daemon = True  # Dies with the supervisor.
+    process.start()
+    self._workers[worker_id] = _Worker(process, queue)
+    self._ring.Add(worker_id)
+    logging.info('Started %s, pid %d', worker_id, process.pid)
+
+  def _Stop(self, worker_id, timeout):
+    worker = self._workers.pop(worker_id)
+    self._ring.Remove(worker_id)
+    worker.queue.put(None)
+    worker.process.join(timeout)
+    if worker.process.is_alive():
+      worker.process.terminate()
+      worker.process.join()
+
+  def _Rebalance(self):
+    shards = self._ring.Assign(self._items) if self._workers else {}
+    for worker_id, worker in self._workers.items():
+      keys = shards.get(worker_id, [])
+      assigned = frozenset(keys)
+      if assigned != worker.assigned:
+        worker.queue.put([self._items[key] for key in keys])
+        worker.assigned = assigned
+
+  def Assignment(self):
+    """Returns a dict of worker id to the keys of the items it owns."""
+    return dict((worker_id, sorted(worker.assigned or ()))
+                for worker_id, worker in self._workers.items())
+
+  def SetItems(self, items, rebalance=True):
+    """Replaces the items sharded, eg. after the inventory changed."""
+    self._items = collections.OrderedDict(
+        (self._key(item), item) for item in items)
+    if rebalance:
+      self._Rebalance()
+
+  def Start(self):
+    for index in range(self.processes):
+      self._Spawn(self.WorkerId(index))
+    self._Rebalance()
+
+  def Check(self):
+    """Moves the items of dead workers, and respawns workers when due."""
+    now = time.time()
+    changed = False
+    for worker_id, worker in list(self._workers.items()):
+      if worker.process.is_alive():
+        continue
+      self.deaths += 1
+      del self._workers[worker_id]
+      self._ring.Remove(worker_id)
+      delay = self.respawn_delay
+      if worker_id in self._respawns and (
+          now - worker.started < self.max_respawn_delay):
+        delay = min(self._respawns[worker_id][1] * 2, self.max_respawn_delay)
+      self._respawns[worker_id] = (now + delay, delay)
+      logging.error('%s exited with code %s; respawning it in %.1fs',
+                    worker_id, worker.process.exitcode, delay)
+      changed = True
+    for worker_id, (respawn_at, _) in list(self._respawns.items()):
+      if worker_id in self._workers or now < respawn_at:
+        continue
+      self._Spawn(worker_id)
+      changed = True
+    if changed:
+      self._Rebalance()
+
+  def Resize(self, processes, timeout=5.0):
+    """Changes the number of workers, moving items to or from them.
+
+    Args:
+      processes: (int) New number of workers.
+      timeout: (float) Seconds removed workers are given to exit before
+        being terminated.
+    """
+    self.processes = processes
+    wanted = set(self.WorkerId(index) for index in range(processes))
+    for worker_id in list(self._respawns):
+      if worker_id not in wanted:
+        del self._respawns[worker_id]
+    # Move the items off removed workers before they stop monitoring them.
+    for worker_id in list(self._workers):
+      if worker_id not in wanted:
+        self._ring.Remove(worker_id)
+    for worker_id in sorted(wanted - set(self._workers) -
+                            set(self._respawns)):
+      self._Spawn(worker_id)
+    self._Rebalance()
+    for worker_id in list(self._workers):
+      if worker_id not in wanted:
+        self._Stop(worker_id, timeout)
+
+  def Stop(self, timeout=5.0):
+    """Asks every worker to exit, terminating those which do not in time."""
+    for worker in self._workers.values():
+      worker.queue.put(None)
+    deadline = time.time() + timeout
+    for worker_id in list(self._workers):
+      self._workers[worker_id].process.join(max(0, deadline - time.time()))
+      self._Stop(worker_id, 0)
+    self._respawns.clear()
+
+  def Run(self, stop=None, interval=1.0):
+    """Starts the workers and supervises them until stop is set.
+
+    Args:
+      stop: (threading.Event) Ends supervision once set, or None to run
+        forever.
+      interval: (float) Seconds between two checks of the workers.
+    """
+    self.Start()
+    try:
+      while True:
+        if stop is None:
+          time.sleep(interval)
+        elif stop.wait(interval):
+          break
+        self.Check()
+    finally:
+      self.Stop()
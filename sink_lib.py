@@ -0,0 +1,547 @@
+"""Sinks writing telemetry points to InfluxDB off the collection path.
+
+A sink queues the points written to it, and writes them from a background
+thread in batches: as soon as batch_size points are queued, or once the
+oldest queued point is flush_interval seconds old. A single request then
+carries thousands of points, instead of one request per point. Failed
+batches are retried with backoff, and the depth of the queue is reported to
+a gnmi_metrics collector.
+
+Points are written as WritePoint(measurement, tags, fields), eg.
+  sink.WritePoint('channel_utilization', (('ap_name', 'ap-01'),),
+                  (('value', 42),))
+Those without a timestamp are stamped when written to the sink, not when
+flushed, so batching does not skew their timestamps.
+
+BatchWriter hands the points to an InfluxDBClient, dedicated to the sink and
+bound to its database, ie. created with InfluxDBClient(..., database=...), so
+no switch_database() is needed, nor raced with other threads sharing a
+client.
+
+LineProtocolSink skips the client: points are encoded straight into InfluxDB
+line protocol, in reused buffers, and sent over a keep-alive HTTP connection
+(HttpTransport) or to the UDP listener of InfluxDB (UdpTransport). The
+escaped measurement and tag set of a series are cached, so only the fields
+of a point are encoded when it is written.
+
+Example:
+  sink = sink_lib.LineProtocolSink(
+      sink_lib.HttpTransport('172.20.0.5', 8086, 'ap_telemetry'))
+  sink.WritePoint(...)
+  ...
+  sink.Close()
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import logging
+import numbers
+import socket
+import threading
+import time
+import six
+from six.moves import http_client
+from six.moves import urllib
+
+import gnmi_metrics
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class _Sink(object):
+  """Queues points, and writes them in batches from a background thread.
+
+  Subclasses queue points with _Queue(), and implement _Queued(), _Take(),
+  _Send() and _Drop().
+  """
+
+  _RPC = 'write'
+
+  def __init__(self, batch_size=5000, flush_interval=1.0, max_queue=100000,
+               retries=3, retry_delay=0.5, collector=None, target='influxdb'):
+    """Initializes the sink, and starts its thread.
+
+    Args:
+      batch_size: (int) Most points written per request; a batch is written
+        as soon as this many points are queued.
+      flush_interval: (float) Most seconds a point stays queued.
+      max_queue: (int) Most points queued; the oldest are dropped beyond it,
+        eg. while the database is unreachable.
+      retries: (int) Times a failed batch is written again before being
+        dropped.
+      retry_delay: (float) Seconds before the first retry; doubles with every
+        retry.
+      collector: (gnmi_metrics.NullCollector) Records the latency and status
+        of writes, and the depth of the queue.
+      target: (str) Target the metrics are recorded under.
+    """
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.max_queue = max_queue
+    self.retries = retries
+    self.retry_delay = retry_delay
+    self.collector = collector or gnmi_metrics.NullCollector()
+    self.target = target
+    self._oldest = None  # Time the oldest point queued was written.
+    self._in_flight = 0  # Points of the batch being written.
+    self._flush = False
+    self._closed = False
+    self._cond = threading.Condition()
+    self.written = 0
+    self.dropped = 0
+    self._thread = threading.Thread(target=self._Run,
+                                    name=type(self).__name__)
+    self._thread.daemon = True
+    self._thread.start()
+
+  @property
+  def depth(self):
+    """Number of points queued or being written."""
+    return self._Queued() + self._in_flight
+
+  def _Queued(self):
+    """Returns the number of points queued."""
+    raise NotImplementedError
+
+  def _Take(self):
+    """Dequeues the next batch; returns (batch, number of points)."""
+    raise NotImplementedError
+
+  def _Send(self, batch):
+    """Writes a batch, raising an exception if it was not written."""
+    raise NotImplementedError
+
+  def _Drop(self, count):
+    """Dequeues about count of the oldest points; returns their number."""
+    raise NotImplementedError
+
+  def _Check(self):
+    """Raises Error if the sink is closed; call holding the lock."""
+    if self._closed:
+      raise Error('Write to a closed %s' % type(self).__name__)
+
+  def _Queue(self):
+    """Wakes the thread up as due; call holding the lock, once points queued.
+
+    Returns:
+      (int) number of the oldest points dropped, as the queue is full.
+    """
+    if self._oldest is None:
+      self._oldest = time.time()
+      self._cond.notify_all()  # Sets the deadline of the thread's wait.
+    queued = self._Queued()
+    dropped = 0
+    if queued > self.max_queue:
+      dropped = self._Drop(queued - self.max_queue)
+      self.dropped += dropped
+    if self._Queued() >= self.batch_size:
+      self._cond.notify_all()
+    return dropped
+
+  def _LogDropped(self, dropped):
+    if dropped:
+      logging.warning('Write queue to %s full; dropped %d points',
+                      self.target, dropped)
+
+  def _Due(self):
+    queued = self._Queued()
+    if self._flush or self._closed or queued >= self.batch_size:
+      return queued > 0
+    return (self._oldest is not None and
+            time.time() - self._oldest >= self.flush_interval)
+
+  def _Run(self):
+    while True:
+      with self._cond:
+        while not self._Due():
+          if self._closed:
+            return
+          wait = None
+          if self._oldest is not None:
+            wait = self._oldest + self.flush_interval - time.time()
+          self._cond.wait(wait)
+        batch, count = self._Take()
+        # The points left were queued no earlier than the oldest taken.
+        self._oldest = time.time() if self._Queued() else None
+        self._in_flight = count
+        self._Report()
+      try:
+        self._WriteBatch(batch, count)
+      finally:
+        with self._cond:
+          self._in_flight = 0
+          self._Report()
+          self._cond.notify_all()
+
+  def _WriteBatch(self, batch, count):
+    """Writes a batch, retrying with backoff; drops it if every try fails."""
+    delay = self.retry_delay
+    for attempt in range(self.retries + 1):
+      start = time.time()
+      try:
+        self._Send(batch)
+      except Exception as e:  # pylint: disable=broad-except
+        # Clients and sockets raise errors of their own, alike here.
+        self.collector.CountStatus(self.target, self._RPC, 'ERROR')
+        logging.warning('Writing %d points to %s failed (attempt %d): %s',
+                        count, self.target, attempt + 1, e)
+        if attempt < self.retries:
+          time.sleep(delay)
+          delay *= 2
+        continue
+      self.collector.CountStatus(self.target, self._RPC, 'OK')
+      self.collector.ObserveLatency(self.target, self._RPC,
+                                    time.time() - start)
+      self.written += count
+      return
+    logging.error('Dropped %d points, which %s refused %d times', count,
+                  self.target, self.retries + 1)
+    with self._cond:
+      self.dropped += count
+
+  def _Report(self):
+    if self.collector.enabled:
+      self.collector.SetGauge(self.target, 'sink_queue_points', self.depth)
+      self.collector.SetGauge(self.target, 'sink_dropped_points',
+                              self.dropped)
+
+  def Flush(self, timeout=None):
+    """Writes the points queued now, and waits for them to be written.
+
+    Args:
+      timeout: (float) Most seconds to wait, or None.
+
+    Returns:
+      (bool) whether every point was written or dropped in time.
+    """
+    give_up = None if timeout is None else time.time() + timeout
+    with self._cond:
+      self._flush = True
+      self._cond.notify_all()
+      try:
+        while self._Queued() or self._in_flight:
+          wait = None if give_up is None else give_up - time.time()
+          if wait is not None and wait <= 0:
+            return False
+          self._cond.wait(wait)
+      finally:
+        self._flush = False
+    return True
+
+  def _CloseTransport(self):
+    """Releases what the batches were written with, once all are."""
+
+  def Close(self, timeout=None):
+    """Writes the points queued, and stops the sink's thread.
+
+    Args:
+      timeout: (float) Most seconds to wait for the points to be written, or
+        None. The points not written by then are lost.
+    """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._thread.join(timeout)
+    if not self._thread.is_alive():
+      self._CloseTransport()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    self.Close()
+
+
+class BatchWriter(_Sink):
+  """Writes points to an InfluxDB client in batches, from a thread."""
+
+  _RPC = 'write_points'
+
+  def __init__(self, client, **kwargs):
+    """Initializes the writer, and starts its thread.
+
+    Args:
+      client: (InfluxDBClient) Bound to the database written to.
+      **kwargs: Batching options; see _Sink.
+    """
+    self._client = client
+    self._queue = collections.deque()
+    super(BatchWriter, self).__init__(**kwargs)
+
+  def _Queued(self):
+    return len(self._queue)
+
+  def _Take(self):
+    batch = [self._queue.popleft()
+             for _ in range(min(self.batch_size, len(self._queue)))]
+    return batch, len(batch)
+
+  def _Send(self, batch):
+    self._client.write_points(batch, time_precision='n')
+
+  def _Drop(self, count):
+    for _ in range(count):
+      self._queue.popleft()
+    return count
+
+  def Write(self, points):
+    """Queues points, to be written by the writer's thread.
+
+    Args:
+      points: (list) of dict, as taken by InfluxDBClient.write_points().
+
+    Raises:
+      Error: The writer is closed.
+    """
+    now = int(time.time() * 1e9)
+    with self._cond:
+      self._Check()
+      for point in points:
+        if 'time' not in point:
+          point['time'] = now
+        self._queue.append(point)
+      dropped = self._Queue()
+    self._LogDropped(dropped)
+
+  def WritePoint(self, measurement, tags, fields, timestamp=None):
+    """Queues a point; see LineProtocolSink.WritePoint()."""
+    point = {'measurement': measurement, 'tags': dict(tags),
+             'fields': dict(fields)}
+    if timestamp is not None:
+      point['time'] = timestamp
+    self.Write([point])
+
+
+def _EscapeMeasurement(measurement):
+  return (six.text_type(measurement).replace('\\', '\\\\')
+          .replace(' ', '\\ ').replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _EscapeKey(key):
+  """Escapes a tag key, tag value or field key."""
+  return (six.text_type(key).replace('\\', '\\\\').replace(' ', '\\ ')
+          .replace(',', '\\,').replace('=', '\\=').replace('\n', '\\n'))
+
+
+def _EncodeValue(value):
+  """Encodes a field value; integers are typed as such, as by the client."""
+  if isinstance(value, bytes):  # eg. the json_ietf_val of a TypedValue.
+    value = value.decode('utf-8')
+  if isinstance(value, six.string_types):
+    return '"%s"' % (value.replace('\\', '\\\\').replace('"', '\\"')
+                     .replace('\n', '\\n'))
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  if isinstance(value, numbers.Integral):
+    return '%di' % value
+  if isinstance(value, numbers.Real):
+    return repr(float(value))
+  raise Error('Unsupported field value %r' % (value,))
+
+
+class HttpTransport(object):
+  """Posts line protocol to the /write endpoint of InfluxDB.
+
+  A single HTTP/1.1 connection is kept alive across batches, and re-opened
+  once it fails.
+  """
+
+  def __init__(self, host, port=8086, database='ap_telemetry', username=None,
+               password=None, timeout=10.0):
+    """Initializes the transport; the connection is opened on first use.
+
+    Args:
+      host: (str) InfluxDB IP/FQDN.
+      port: (int) InfluxDB HTTP API port.
+      database: (str) Database written to; it must exist.
+      username: (str) User to write as, if authentication is enabled.
+      password: (str) Password of the user.
+      timeout: (float) Seconds a request may take.
+    """
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    query = [('db', database), ('precision', 'n')]
+    if username is not None:
+      query.extend([('u', username), ('p', password)])
+    self._path = '/write?' + urllib.parse.urlencode(query)
+    self._connection = None
+
+  def Send(self, data, size):
+    """Posts the first size bytes of data, lines of line protocol.
+
+    Raises:
+      Error: InfluxDB did not accept the points.
+    """
+    if self._connection is None:
+      self._connection = http_client.HTTPConnection(self.host, self.port,
+                                                    timeout=self.timeout)
+    try:
+      self._connection.request(
+          'POST', self._path, body=memoryview(data)[:size],
+          headers={'Content-Type': 'text/plain; charset=utf-8'})
+      response = self._connection.getresponse()
+      body = response.read()  # Must be read before the next request.
+    except (socket.error, http_client.HTTPException) as e:
+      self.Close()
+      raise Error('POST to %s:%s failed: %s' % (self.host, self.port, e))
+    if response.status != 204:
+      raise Error('InfluxDB answered %d %s: %s' % (
+          response.status, response.reason, body[:200]))
+
+  def Close(self):
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+
+
+class UdpTransport(object):
+  """Sends line protocol to the UDP listener of InfluxDB.
+
+  The database and timestamp precision are those the listener is configured
+  with; the precision must be nanoseconds, its default. UDP is fire and
+  forget: points lost on the way are not retried.
+  """
+
+  def __init__(self, host, port=8089, max_datagram=8192):
+    """Initializes the transport.
+
+    Args:
+      host: (str) InfluxDB IP/FQDN.
+      port: (int) Port of the UDP listener.
+      max_datagram: (int) Most bytes per datagram; batches are split at line
+        boundaries to fit.
+    """
+    self.address = (host, port)
+    self.max_datagram = max_datagram
+    self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+  def Send(self, data, size):
+    """Sends the first size bytes of data, in as few datagrams as fit."""
+    start = 0
+    while start < size:
+      end = start + self.max_datagram
+      if end < size:
+        cut = data.rfind(b'\n', start, end)
+        if cut < 0:  # A line longer than a datagram is sent on its own.
+          cut = data.find(b'\n', end, size)
+        end = size if cut < 0 else cut + 1
+      else:
+        end = size
+      self._socket.sendto(memoryview(data)[start:end], self.address)
+      start = end
+
+  def Close(self):
+    self._socket.close()
+
+
+class LineProtocolSink(_Sink):
+  """Encodes points into InfluxDB line protocol, written in batches."""
+
+  def __init__(self, transport, **kwargs):
+    """Initializes the sink, and starts its thread.
+
+    Args:
+      transport: (HttpTransport or UdpTransport) Sends the batches.
+      **kwargs: Batching options; see _Sink.
+    """
+    self._transport = transport
+    self._series = {}  # (measurement, tags): escaped series key and space.
+    self._keys = {}  # field key: escaped field key and '='.
+    # [bytearray, bytes used, number of lines]. Buffers are overwritten
+    # once written, keeping their size, so a steady flow allocates none.
+    self._buffers = collections.deque()
+    self._free = []
+    self._queued = 0
+    super(LineProtocolSink, self).__init__(**kwargs)
+
+  def _Queued(self):
+    return self._queued
+
+  def _Take(self):
+    buf = self._buffers.popleft()
+    self._queued -= buf[2]
+    return buf, buf[2]
+
+  def _Send(self, batch):
+    self._transport.Send(batch[0], batch[1])
+
+  def _Drop(self, count):
+    dropped = 0
+    while dropped < count and len(self._buffers) > 1:
+      buf = self._buffers.popleft()
+      dropped += buf[2]
+      self._Recycle(buf)
+    self._queued -= dropped
+    return dropped
+
+  def _Recycle(self, buf):
+    buf[1] = buf[2] = 0
+    self._free.append(buf)
+
+  def _WriteBatch(self, batch, count):
+    try:
+      super(LineProtocolSink, self)._WriteBatch(batch, count)
+    finally:
+      with self._cond:
+        self._Recycle(batch)
+
+  def _CloseTransport(self):
+    self._transport.Close()
+
+  def _SeriesKey(self, measurement, tags):
+    key = (measurement, tags)
+    series = self._series.get(key)
+    if series is None:
+      series = ''.join([_EscapeMeasurement(measurement)] +
+                       [',%s=%s' % (_EscapeKey(name), _EscapeKey(value))
+                        for name, value in sorted(tags)]) + ' '
+      series = self._series[key] = series.encode('utf-8')
+    return series
+
+  def _FieldKey(self, name):
+    key = self._keys.get(name)
+    if key is None:
+      key = self._keys[name] = _EscapeKey(name) + '='
+    return key
+
+  def WritePoint(self, measurement, tags, fields, timestamp=None):
+    """Encodes a point, to be written by the sink's thread.
+
+    Args:
+      measurement: (str) Measurement of the point.
+      tags: (tuple) of (name, value) pairs; the same tuple of a series is
+        escaped once.
+      fields: (tuple) of (name, value) pairs; values are str, UTF-8 bytes,
+        bool, int or float.
+      timestamp: (int) Time of the point in nanoseconds since the epoch;
+        now if None.
+
+    Raises:
+      Error: The sink is closed, or a field value is of an unsupported type.
+    """
+    if timestamp is None:
+      timestamp = int(time.time() * 1e9)
+    line = (','.join([self._FieldKey(name) + _EncodeValue(value)
+                      for name, value in fields]) +
+            ' %d\n' % timestamp).encode('utf-8')
+    series = self._SeriesKey(measurement, tags)
+    with self._cond:
+      self._Check()
+      if not self._buffers or self._buffers[-1][2] >= self.batch_size:
+        self._buffers.append(self._free.pop() if self._free
+                             else [bytearray(), 0, 0])
+      buf = self._buffers[-1]
+      data, used = buf[0], buf[1]
+      data[used:used + len(series)] = series  # Grows data if needed.
+      used += len(series)
+      data[used:used + len(line)] = line
+      buf[1] = used + len(line)
+      buf[2] += 1
+      self._queued += 1
+      dropped = self._Queue()
+    self._LogDropped(dropped)
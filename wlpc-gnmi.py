@@ -1,6 +1,7 @@
-"""Monitoring library using gNMI GetRequests.
+"""Monitoring library using gNMI GetRequests and Subscribe.
 
-Current version does not perform Subscribe.
+Monitor mode either polls the Target with GetRequests, or holds Subscribe
+STREAMs open so that only changed leaves are sent by the Target.
 """
 
 from __future__ import absolute_import
@@ -8,10 +9,20 @@ from __future__ import division
 from __future__ import print_function
 import collections
 import json
+import os
 import sys
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 import gnmi_lib
+import gnmi_metrics
 import configs_lib
+import inventory_lib
+import record_lib
+import scheduler_lib
+import shard_lib
+import sink_lib
+import grpc
 from influxdb import InfluxDBClient
 from absl import logging
 import pyangbind.lib.pybindJSON as pybindJSON
@@ -27,6 +38,58 @@ flags.DEFINE_enum('mode', None, ['configure', 'monitor', 'provision',],
                   'provision : Generate OC config to apply hostname/cc.\n'
                   'monitor : Perform monitoring of Config & State Telemetry.\n')
 flags.DEFINE_bool('dry_run', False, 'Generate OpenConfig JSON, print and exit.\n')
+flags.DEFINE_enum('monitor_transport', 'get', ['get', 'poll', 'stream'],
+                  '\n'
+                  'get: Poll the full AP tree with GetRequests.\n'
+                  'poll: Poll the AP tree over a held-open POLL Subscribe.\n'
+                  'stream: Subscribe once and receive only changed leaves.\n')
+flags.DEFINE_integer('monitor_interval', 5,
+                     'Seconds between samples of State Telemetry.')
+flags.DEFINE_enum('grpc_compression', None, ['gzip', 'deflate'],
+                  'Compression requested on the gNMI channel.')
+flags.DEFINE_integer('grpc_max_receive_mb', None,
+                     'Largest gNMI response accepted, in MB.')
+flags.DEFINE_float('rpc_timeout', 10,
+                   'Seconds to wait for a gNMI Target to answer a request.')
+flags.DEFINE_string('gnmi_token_file', None,
+                    'File holding a bearer token to authenticate to the gNMI '
+                    'Target with, instead of username/password. Re-read '
+                    'every gnmi_token_refresh seconds.')
+flags.DEFINE_integer('gnmi_token_refresh', 300,
+                     'Seconds between reads of gnmi_token_file.')
+flags.DEFINE_string('metrics_textfile', None,
+                    'Record gNMI and DB write metrics, and write them in '
+                    'Prometheus text format to this file every sample.')
+flags.DEFINE_string('gnmi_record', None,
+                    'Record every gNMI request and response to this file, '
+                    'for replay with record_lib.')
+flags.DEFINE_string('inventory', None,
+                    'CSV, YAML or JSON lines file listing the name, MAC and '
+                    'gNMI Target of every AP; see inventory_lib. Replaces '
+                    'the single AP customized in main().')
+flags.DEFINE_integer('monitor_workers', 32,
+                     'Most APs collected from at once by the get and poll '
+                     'monitor transports.')
+flags.DEFINE_integer('db_batch_size', 5000,
+                     'Most points written to InfluxDB per request.')
+flags.DEFINE_float('db_flush_interval', 1.0,
+                   'Most seconds a point is queued before being written to '
+                   'InfluxDB.')
+flags.DEFINE_enum('sink', 'client', ['client', 'http', 'udp'],
+                  'How points are written to InfluxDB: by the influxdb '
+                  'client, or encoded to line protocol and sent over a '
+                  'keep-alive HTTP connection, or to the UDP listener '
+                  '(which sets the database) on --udp_port.')
+flags.DEFINE_integer('udp_port', 8089,
+                     'Port of the InfluxDB UDP listener, for --sink=udp.')
+flags.DEFINE_integer('shards', 0,
+                     'Spread the inventory across this many worker '
+                     'processes, each monitoring with GetRequests; see '
+                     'shard_lib. Metrics and recordings are written per '
+                     'worker. 0 monitors in this process.')
+flags.DEFINE_float('intent_ttl', 60,
+                   'Seconds the config intent of an AP, read from InfluxDB, '
+                   'is compared against before being read again.')
 
 
 class ApObject(object):
@@ -45,6 +108,7 @@ class ApObject(object):
       targetpass: (str) password for gRPC Metadata authentication.
       mac: (str) Mac address of this AP.
       stub: (gNMIStub) gNMI Stub object for this AP.
+      auth: (gnmi_lib.StaticAuth or TokenAuth) authentication of the Stub.
       json: (dict) JSON payload for a gNMI GetRequest.
     """
     self.ap_name = ap_name
@@ -55,16 +119,20 @@ class ApObject(object):
     self.targetpass = None
     self.mac = None
     self.stub = None
+    self.auth = None
     self.json = None
 
 
 def _get_grpcmetadata(ap):
   """Helper to determine gRPC metadata needed for secure_channel.
 
+  The credentials are resolved once per AP, from the MAC OUI or failing that
+  from the Target port, and attached to every RPC of its Stub.
+
   Args:
     ap: AP Class object.
   """
-  for vendor, oui in constants.VENDOR_OUI_DATA.iteritems():
+  for vendor, oui in constants.VENDOR_OUI_DATA.items():
     if ':'.join(ap.mac.lower().split(':')[:3]) in oui:
       if vendor == 'mist':
         ap.targetuser = constants.MIST_USER
@@ -72,6 +140,31 @@ def _get_grpcmetadata(ap):
       elif vendor == 'arista':
         ap.targetuser = constants.ARISTA_USER
         ap.targetpass = constants.ARISTA_PASS
+  if ap.targetuser is None:
+    if ap.targetport == '443' or ap.targetport == '10161':
+      # Target is ap-manager.
+      ap.targetuser, ap.targetpass = constants.MIST_USER, constants.MIST_PASS
+    else:  # Target is AP.
+      ap.targetuser = constants.ARISTA_USER
+      ap.targetpass = constants.ARISTA_PASS
+  if FLAGS.gnmi_token_file:
+    ap.auth = _token_auth(FLAGS.gnmi_token_file)
+  else:
+    ap.auth = gnmi_lib.StaticAuth(ap.targetuser, ap.targetpass)
+
+
+_TOKEN_AUTHS = {}
+
+
+def _token_auth(token_file):
+  """Returns the gnmi_lib.TokenAuth reading token_file, shared by all APs."""
+  if token_file not in _TOKEN_AUTHS:
+    def _read_token():
+      with open(token_file) as f:
+        return f.read().strip()
+    _TOKEN_AUTHS[token_file] = gnmi_lib.TokenAuth(
+        _read_token, FLAGS.gnmi_token_refresh)
+  return _TOKEN_AUTHS[token_file]
 
 
 def _create_apobj(gnmi_target, ap_name, ap_mac, student_ssids):
@@ -95,13 +188,57 @@ def _create_apobj(gnmi_target, ap_name, ap_mac, student_ssids):
   return ap
 
 
-def _create_db():
+def _create_apobjs(entries, student_ssids):
+  """Creates the AP objects of an inventory.
+
+  Args:
+    entries: (list) of inventory_lib.InventoryEntry.
+    student_ssids: (list) SSIDs to configure on APs listing fewer than two.
+  Returns:
+    (list) of Access Point class objects with meta.
+  """
+  return [_create_apobj(entry.target, entry.name, entry.mac,
+                        list(entry.ssids) if len(entry.ssids) >= 2
+                        else student_ssids)
+          for entry in entries]
+
+
+_RECORDERS = {}
+
+
+def _recorder(path):
+  """Returns the record_lib.Recorder writing to path, shared by all APs."""
+  if path not in _RECORDERS:
+    _RECORDERS[path] = record_lib.Recorder(path)
+  return _RECORDERS[path]
+
+
+def _channel_options():
+  """Returns the gnmi_lib.ChannelOptions set by flags, or None."""
+  if not FLAGS.grpc_compression and not FLAGS.grpc_max_receive_mb:
+    return None
+  max_receive = FLAGS.grpc_max_receive_mb
+  return gnmi_lib.ChannelOptions(
+      compression=FLAGS.grpc_compression,
+      max_receive_message_length=max_receive and max_receive * 1024 * 1024)
+
+
+_DB_HOST = '172.20.0.5'
+_DB_PORT = 8086
+_DB_USER = 'root'
+_DB_PASSWORD = 'root'
+
+
+def _create_db(database=None):
   """Create a database if one does not already exist.
 
+  Args:
+    database: (str) Database the client is bound to, if any.
   Returns
     client: InfluxDBClient
   """
-  dbclient = InfluxDBClient('172.20.0.5', 8086, 'root', 'root')
+  dbclient = InfluxDBClient(_DB_HOST, _DB_PORT, _DB_USER, _DB_PASSWORD,
+                            database)
   # Check for existence of aps DB
   existing = dbclient.get_list_database()
   dbnames = [db['name'] for db in existing]
@@ -110,97 +247,604 @@ def _create_db():
   return dbclient
 
 
-def _get(ap, path):
-  """Get OpenConfig JSON.
+_AP_ROOT = '/access-points/access-point[hostname={hostname}]'
+_XPATHS = {
+    'r0-config':  # Config shown here just for example.
+        gnmi_lib.PathTemplate(_AP_ROOT + '/radios/radio[id=0]/config'),
+    'r0-state': gnmi_lib.PathTemplate(_AP_ROOT + '/radios/radio[id=0]/state'),
+    'r0-cu': gnmi_lib.PathTemplate(
+        _AP_ROOT + '/radios/radio[id=0]/state/total-channel-utilization'),
+    'config_state': gnmi_lib.PathTemplate(_AP_ROOT),
+}
+
+
+def _get_many(ap, path_names):
+  """Get OpenConfig values for several xpaths in a single GetRequest.
 
   Args:
     ap: AP Class Object.
-    path: (str) Describing the xpath.
+    path_names: (list) of str, each describing an xpath; see _XPATHS.
   Returns:
-    config_json: Full AP config in OC IETF_JSON.
-  """
-  # Set up the gNMI path.
-  if path == 'r0-config':  # Config shown here just for example.
-    paths = gnmi_lib.ParsePath(gnmi_lib.PathNames(
-        '/access-points/access-point[hostname=%s]/radios/radio[id=0]/config' %
-        ap.ap_name))
-  elif path == 'r0-state':
-    paths = gnmi_lib.ParsePath(gnmi_lib.PathNames(
-        '/access-points/access-point[hostname=%s]/radios/radio[id=0]/state/' %
-        ap.ap_name))
-  elif path == 'config_state':
-    paths = gnmi_lib.ParsePath(gnmi_lib.PathNames(
-      '/access-points/access-point[hostname=%s]/' % ap.ap_name))
-  if ap.targetport == '443' or ap.targetport == '10161':
-    # Target is ap-manager.
-    response = gnmi_lib.Get(
-      ap.stub, paths, constants.MIST_USER, constants.MIST_PASS)
-    return response.notification[0].update[0].val.json_ietf_val
-  response = gnmi_lib.Get(  # Target is AP.
-    ap.stub, paths, constants.ARISTA_USER, constants.ARISTA_PASS)
-  return response.notification[0].update[0].val.json_ietf_val
-
-
-def _write_db(dbclient, db, json_data):
-  """Write JSON to DB.
+    (dict) of path name to gnmi_pb2.TypedValue.
+  """
+  # Set up the gNMI paths.
+  paths = [_XPATHS[name].Path(hostname=ap.ap_name) for name in path_names]
+  indexed = gnmi_lib.GetIndexed(ap.stub, paths, timeout=FLAGS.rpc_timeout)
+  in_order = list(indexed.values())
+  results = {}
+  for i, name in enumerate(path_names):
+    val = indexed.get(_XPATHS[name].Xpath(hostname=ap.ap_name))
+    if val is None:  # Target did not echo the path; use response order.
+      val = in_order[i]
+    results[name] = val
+  return results
+
+
+_COLLECTOR = gnmi_metrics.NullCollector()
+
+
+_METRICS_TEXTFILE = None
+
+
+def _enable_metrics(path, labels=None):
+  """Records gNMI and DB write metrics, for _dump_metrics to write to path."""
+  global _COLLECTOR, _METRICS_TEXTFILE
+  _COLLECTOR = gnmi_metrics.MetricsCollector(labels=labels)
+  _METRICS_TEXTFILE = path
+  gnmi_lib.SetCollector(_COLLECTOR)
+
+
+def _dump_metrics():
+  """Writes the metrics recorded so far, if enabled."""
+  if _METRICS_TEXTFILE:
+    gnmi_metrics.WriteTextfile(_COLLECTOR, _METRICS_TEXTFILE)
+
+
+_SINKS = {}
+
+
+def _sink(db):
+  """Returns the sink_lib sink writing to database db, shared by all APs."""
+  if db not in _SINKS:
+    options = dict(batch_size=FLAGS.db_batch_size,
+                   flush_interval=FLAGS.db_flush_interval,
+                   collector=_COLLECTOR)
+    if FLAGS.sink == 'client':
+      _SINKS[db] = sink_lib.BatchWriter(_create_db(db), **options)
+    elif FLAGS.sink == 'http':
+      _create_db(db)  # The line protocol endpoint does not create it.
+      _SINKS[db] = sink_lib.LineProtocolSink(
+          sink_lib.HttpTransport(_DB_HOST, _DB_PORT, db, _DB_USER,
+                                 _DB_PASSWORD), **options)
+    else:  # The database is that of the UDP listener.
+      _SINKS[db] = sink_lib.LineProtocolSink(
+          sink_lib.UdpTransport(_DB_HOST, FLAGS.udp_port), **options)
+  return _SINKS[db]
+
+
+def _close_sinks():
+  """Writes the points still queued, and stops the sinks."""
+  for sink in _SINKS.values():
+    sink.Close()
+  _SINKS.clear()
+
+
+def _write_db(db, measurement, ap, value):
+  """Write a value of an AP to DB.
+
+  The point is queued, and written in batches in the background.
 
   Args:
-    dbclient: InfluxDB Client.
     db: (str) Database to write to.
-    json_data: (dict) JSON data to write to DB.
+    measurement: (str) DB measurement we are writing to.
+    ap: AP Class object.
+    value: (str, bytes, int, float or bool) Value to write.
   """
-  dbclient.switch_database(db)
-  try:
-    dbclient.write_points(json_data)
-    logging.info('DB write successful')
-  except:
-    logging.error('DB write failed')
+  _sink(db).WritePoint(measurement, (('ap_name', ap.ap_name),),
+                       (('value', value),))
+
+
+def _member(container, name):
+  """Returns the member name of a decoded JSON_IETF container, or None."""
+  for key, value in container.items():
+    if key.rpartition(':')[2] == name:
+      return value
+  return None
 
 
-def _prep_json(json_data, measurement, ap):
-  """Prepare the JSON for DB write.
+def _radio0_config(config_state):
+  """Extracts the config of Radio 0 from the JSON of an access-point.
+
+  Only the radios subtree is decoded, and decoding stops after Radio 0, so
+  the rest of the (possibly very large) document is never built.
+
+  Args:
+    config_state: (str) JSON_IETF of an access-point, see _XPATHS; or the
+      dict it was already decoded to, which is used as is.
+  Returns:
+    (dict) of leaf name to value, for the config container of Radio 0.
+  """
+  if isinstance(config_state, dict):
+    radios = _member(config_state, 'radios') or {}
+    for radio in _member(radios, 'radio') or ():
+      config = _member(radio, 'config') or {}
+      return {key.rpartition(':')[2]: value for key, value in config.items()
+              if not isinstance(value, dict)}
+    return {}
+  radio0_state = {}
+  radio0 = None
+  for xpath, value in gnmi_lib.IterJsonLeaves(config_state,
+                                              subtrees=['/radios/radio']):
+    radio, _, leaf = xpath.rpartition('/config/')
+    if '/' in leaf or not radio.rpartition('/')[2].startswith('radio['):
+      continue  # Not a leaf of the config container of a radio.
+    if radio0 is None:
+      radio0 = radio
+    elif radio != radio0:
+      break  # Radio 0 has been read.
+    radio0_state[leaf] = value
+  return radio0_state
+
+
+_INTENTS = {}  # ap_name: (time read, config intent of Radio 0)
+
+
+def _cache_intent(ap, config_json):
+  """Caches the config intent of an AP, as written to the DB.
 
   Args:
-    json_data: Dict of raw JSON.
-    measurement: (str) DB measurement we are writing to.
     ap: AP Class object.
+    config_json: (str) JSON of the config applied to the AP.
   Returns:
-    (list) JSON values formatted for InfluxDB.
+    (dict) Config intent of Radio 0.
   """
-  return [{"measurement": measurement, "tags":
-           {"ap_name": ap.ap_name}, "fields": {"value": json_data}}]
+  config_intent = json.loads(config_json)
+  radio0_intent = config_intent["radios"]["radio"][0]["config"]
+  _INTENTS[ap.ap_name] = (time.time(), radio0_intent)
+  return radio0_intent
 
 
-def _config_diff(dbclient, db, ap):
-  """Compare config State to intent.
+def _radio0_intent(dbclient, db, ap):
+  """Returns the config intent of Radio 0 of an AP.
 
-  This func writes OK or Out-of-sync
-  for each Access Point.
+  The intent only changes when the AP is configured, so it is read from the
+  DB at most every intent_ttl seconds rather than for every sample.
 
   Args:
     dbclient: InfluxDB Client.
     db: InfluxDB Database.
     ap: AP Class object.
+  Returns:
+    (dict) Config intent of Radio 0, or None if the AP has none in the DB or
+    it is malformed.
   """
-  dbclient.switch_database(db)
-  db_state = dbclient.query(
-      'select last(value) from "config_state" where ap_name=\'%s\'' %
-      ap.ap_name)
+  cached = _INTENTS.get(ap.ap_name)
+  if cached is not None and time.time() - cached[0] < FLAGS.intent_ttl:
+    return cached[1]
   db_intent = dbclient.query(
       'select last(value) from "config_intent" where ap_name=\'%s\'' %
-      ap.ap_name)
-  # Define the values from Database for comparison.
-  config_state = json.loads(db_state.raw['series'][0]['values'][0][1])
-  config_intent = json.loads(db_intent.raw['series'][0]['values'][0][1])
-  radio0_state = config_state["openconfig-access-points:radios"]["radio"][0]["config"]
-  radio0_intent = config_intent["radios"]["radio"][0]["config"]
+      ap.ap_name, database=db)
+  series = db_intent.raw.get('series')
+  if not series:
+    logging.warning('No config intent of %s in the DB', ap.ap_name)
+    return None
+  try:
+    return _cache_intent(ap, series[0]['values'][0][1])
+  except (KeyError, IndexError, TypeError, ValueError) as e:
+    logging.warning('Malformed config intent of %s: %r', ap.ap_name, e)
+    return None
+
+
+def _radio0_sync(dbclient, db, ap, radio0_state):
+  """Compare config State of Radio 0 to the intent stored in the DB.
+
+  Args:
+    dbclient: InfluxDB Client.
+    db: InfluxDB Database.
+    ap: AP Class object.
+    radio0_state: (dict) Config of Radio 0, as reported by the Target.
+  """
+  radio0_intent = _radio0_intent(dbclient, db, ap)
+  if radio0_intent is None:  # Nothing to compare against.
+    return
   # Compare the intent of Radio 0 Vs. Config of radio 0.
   if radio0_state == radio0_intent:  # Config in sync.
     logging.info('config in sync')
-    _write_db(dbclient, 'ap_telemetry', _prep_json(2, 'conf_sync', ap))
+    _write_db('ap_telemetry', 'conf_sync', ap, 2)
   else:  # Config out of sync.
     logging.info('config not in sync')
-    _write_db(dbclient, 'ap_telemetry', _prep_json(1, 'conf_sync', ap))
+    _write_db('ap_telemetry', 'conf_sync', ap, 1)
+
+
+def _names_below(elems, parent):
+  """Names of the elems below a parent path, or None if not below it.
+
+  Elems are compared by name, ignoring any module prefix the Target adds, and
+  by the keys of the parent's elems; keys the parent does not name are
+  ignored.
+
+  Args:
+    elems: (list) of gnmi_pb2.PathElem, as parsed from an update's xpath.
+    parent: (gnmi_pb2.Path) Path subscribed to.
+
+  Returns:
+    (list) of the names of the elems below parent; empty for parent itself.
+  """
+  if len(elems) < len(parent.elem):
+    return None
+  for elem, want in zip(elems, parent.elem):
+    if elem.name.split(':')[-1] != want.name:
+      return None
+    for key, value in want.key.items():
+      if elem.key.get(key) != value:
+        return None
+  return [elem.name.split(':')[-1] for elem in elems[len(parent.elem):]]
+
+
+def _hold_stream(ap, subscriptions, encoding, handle):
+  """Holds a gNMI Subscribe STREAM open to an AP, re-opening it if it fails.
+
+  Args:
+    ap: AP Class object.
+    subscriptions: (list) of gnmi_pb2.Subscription.
+    encoding: (str) Encoding requested from the Target, or AUTO_ENCODING.
+    handle: Called with the notifications of each stream opened, as yielded
+      by gnmi_lib.SubscribeNotifications; returns when the stream ends.
+  """
+  while True:
+    try:
+      handle(gnmi_lib.SubscribeNotifications(ap.stub, subscriptions,
+                                             encoding=encoding))
+    except (gnmi_lib.Error, grpc.RpcError) as e:
+      logging.error('Subscribe to %s failed: %s', ap.ap_name, e)
+    except Exception:  # pylint: disable=broad-except
+      # Would otherwise end the thread, and the monitoring of the AP with it.
+      logging.exception('Monitoring of %s failed', ap.ap_name)
+    time.sleep(FLAGS.monitor_interval)
+
+
+def _monitor_stream(dbclient, ap):
+  """Monitor the AP over gNMI Subscribe STREAMs.
+
+  Radio 0 config is subscribed ON_CHANGE and compared against intent once per
+  change, after the Target's initial state is complete. It is encoded as
+  JSON_IETF, as the intent is, so that 64-bit values compare alike. Channel
+  utilization is sampled every monitor_interval on a stream of its own, in
+  the cheaper to decode scalar (PROTO) encoding where the Target supports it.
+  Each stream is re-opened after monitor_interval if it fails.
+
+  Args:
+    dbclient: InfluxDB Client.
+    ap: AP Class object.
+  """
+  config_path = _XPATHS['r0-config'].Path(hostname=ap.ap_name)
+  cu_path = _XPATHS['r0-cu'].Path(hostname=ap.ap_name)
+
+  def _sync_config(notifications):
+    radio0_state = {}
+    synced = changed = False
+    for updates in notifications:
+      if updates is None:  # sync_response: the initial state is complete.
+        synced = True
+        updates = ()
+      for _, xpath, value in updates:
+        names = _names_below(
+            gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)).elem, config_path)
+        if names is None:
+          continue
+        if not names and isinstance(value, dict):  # Container.
+          radio0_state = {k.split(':')[-1]: v for k, v in value.items()}
+        elif names:  # Single leaf.
+          radio0_state[names[-1]] = value
+        changed = True
+      if synced and changed:
+        _radio0_sync(dbclient, 'ap_telemetry', ap, radio0_state)
+        changed = False
+
+  def _write_cu(notifications):
+    for updates in notifications:
+      for _, xpath, value in updates or ():
+        if _names_below(gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)).elem,
+                        cu_path) is None:
+          continue
+        value = gnmi_lib.UnwrapLeaf(value, 'total-channel-utilization')
+        logging.info('Channel Utilization: %s', value)
+        _write_db('ap_telemetry', 'channel_utilization', ap, value)
+        _dump_metrics()
+
+  sampler = threading.Thread(
+      target=_hold_stream, name=ap.ap_name + '-cu',
+      args=(ap, [gnmi_lib.Subscription(cu_path, 'sample',
+                                       FLAGS.monitor_interval)],
+            gnmi_lib.AUTO_ENCODING, _write_cu))
+  sampler.daemon = True
+  sampler.start()
+  _hold_stream(ap, [gnmi_lib.Subscription(config_path, 'on_change')],
+               'JSON_IETF', _sync_config)
+
+
+def _monitor_streams(dbclient, aps):
+  """Monitor every AP over its own gNMI Subscribe STREAMs.
+
+  Each stream is held by a thread of its own, as it is open for as long as
+  the AP is monitored; the threads are idle between updates.
+
+  Args:
+    dbclient: InfluxDB Client.
+    aps: (list) of AP Class objects.
+  """
+  threads = [threading.Thread(target=_monitor_stream, args=(dbclient, ap),
+                              name=ap.ap_name) for ap in aps]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+
+def _write_poll_updates(dbclient, ap, updates):
+  """Writes the updates of a Poll of an AP to the DB.
+
+  Args:
+    dbclient: InfluxDB Client.
+    ap: AP Class object.
+    updates: (list) of (timestamp, xpath, value), or the
+      gnmi_lib.SubscribeError of a failed Poll.
+  """
+  if isinstance(updates, gnmi_lib.SubscribeError):
+    logging.error('Poll of %s failed: %s', ap.ap_name, updates)
+    return
+  config_path = _XPATHS['config_state'].Path(hostname=ap.ap_name)
+  cu_path = _XPATHS['r0-cu'].Path(hostname=ap.ap_name)
+  for _, xpath, value in updates:
+    try:
+      elems = gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)).elem
+    except gnmi_lib.XpathError as e:
+      logging.warning('Ignoring update of %s: %s', ap.ap_name, e)
+      continue
+    # Channel utilization is below the access-point, so is matched first.
+    if _names_below(elems, cu_path) is not None:
+      cu_state = gnmi_lib.UnwrapLeaf(value, 'total-channel-utilization')
+      if cu_state is None or isinstance(cu_state, (dict, list)):
+        logging.warning('Ignoring channel utilization of %s: %r',
+                        ap.ap_name, cu_state)
+        continue
+      logging.info('Channel Utilization: %s', cu_state)
+      _write_db('ap_telemetry', 'channel_utilization', ap, cu_state)
+    elif _names_below(elems, config_path) == [] and isinstance(value, dict):
+      _write_db('ap_telemetry', 'config_state', ap, json.dumps(value))
+      _radio0_sync(dbclient, 'ap_telemetry', ap, _radio0_config(value))
+    else:  # Eg. a single leaf of the access-point, which has no series.
+      logging.warning('Ignoring update of %s from %s', xpath, ap.ap_name)
+
+
+def _monitor_poll(dbclient, aps):
+  """Monitor the APs over gNMI Subscribe POLLs, polled every interval.
+
+  All the APs are polled at once by a single gnmi_lib.Poller, on the ticks
+  of a scheduler_lib.TickScheduler, and their updates written to the DB by
+  up to monitor_workers threads.
+
+  Args:
+    dbclient: InfluxDB Client.
+    aps: (list) of AP Class objects.
+  """
+  poller = gnmi_lib.Poller()
+  pool = ThreadPool(max(1, min(FLAGS.monitor_workers, len(aps))))
+  # Every AP is polled at the same tick, to keep their samples aligned.
+  scheduler = scheduler_lib.TickScheduler(FLAGS.monitor_interval, spread=0,
+                                          on_overrun=_report_overrun)
+  scheduler.Add('poll')
+
+  def _poll(unused_name, unused_tick):
+    for ap in aps:
+      if ap.ap_name not in poller:
+        paths = [_XPATHS['config_state'].Path(hostname=ap.ap_name),
+                 _XPATHS['r0-cu'].Path(hostname=ap.ap_name)]
+        try:
+          poller.Add(ap.ap_name, ap.stub, paths)
+        except gnmi_lib.Error as e:
+          logging.error('POLL subscription to %s failed: %s', ap.ap_name, e)
+    results = poller.Tick(FLAGS.rpc_timeout)
+    for name, updates in results.items():
+      if isinstance(updates, gnmi_lib.SubscribeError):
+        poller.Remove(name)  # Re-opened at the next tick.
+    pool.map(lambda ap: _write_poll_updates(dbclient, ap,
+                                            results.get(ap.ap_name, [])),
+             aps)
+    _dump_metrics()
+
+  try:
+    scheduler.Run(_poll)
+  finally:
+    pool.terminate()
+    poller.Close()
+
+
+def _collect(dbclient, ap):
+  """Collects one sample of an AP with a GetRequest, and writes it to the DB.
+
+  Args:
+    dbclient: InfluxDB Client.
+    ap: AP Class object.
+  """
+  # Get root of tree for AP, and radio 0 utilization, in one round trip.
+  try:
+    state = _get_many(ap, ['config_state', 'r0-cu'])
+  except (gnmi_lib.Error, grpc.RpcError) as e:
+    # Retried by gnmi_lib; skip this sample rather than exit.
+    logging.error('Get from %s failed: %s', ap.ap_name, e)
+    return
+  config_state = state['config_state'].json_ietf_val
+  # Write State JSON to DB.
+  _write_db('ap_telemetry', 'config_state', ap, config_state)
+  # Compare State Vs Intent.
+  _radio0_sync(dbclient, 'ap_telemetry', ap, _radio0_config(config_state))
+  # Get radio 0 channel utilization
+  cu_state = gnmi_lib.DecodeLeaf(state['r0-cu'], 'total-channel-utilization')
+  logging.info('Channel Utilization: %s', cu_state)
+  # Write channel utilization to DB.
+  _write_db('ap_telemetry', 'channel_utilization', ap, cu_state)
+
+
+def _report_overrun(overrun):
+  """Logs and counts a tick which did not run as scheduled.
+
+  Args:
+    overrun: (scheduler_lib.Overrun) The tick.
+  """
+  if overrun.skipped:
+    _COLLECTOR.CountTicksSkipped('missed', overrun.skipped)
+  if overrun.busy:
+    _COLLECTOR.CountTicksSkipped('busy')
+    message = 'previous collection still in flight'
+  else:
+    message = '%d ticks missed' % overrun.skipped
+  _COLLECTOR.ObserveTickLate(overrun.late)
+  # Overruns come in bursts across the fleet; log a sample of them.
+  logging.log_every_n_seconds(
+      logging.WARNING, 'Tick of %s overran by %.2fs: %s',
+      FLAGS.monitor_interval, overrun.name, overrun.late, message)
+
+
+class _GetMonitor(object):
+  """Monitors APs with GetRequests, collecting from them concurrently.
+
+  Every AP is sampled on the absolute, jittered deadlines of a
+  scheduler_lib.TickScheduler, so the period does not drift by the time
+  collection takes. Up to monitor_workers APs are collected from at once. An
+  AP whose previous collection is still in flight when its next sample is
+  due is skipped for that sample, so a slow AP neither delays the others nor
+  piles up work.
+  """
+
+  def __init__(self, dbclient):
+    """Initializes a monitor without any AP.
+
+    Args:
+      dbclient: InfluxDB Client.
+    """
+    self._dbclient = dbclient
+    self._pool = ThreadPool(FLAGS.monitor_workers)
+    self._scheduler = scheduler_lib.TickScheduler(
+        FLAGS.monitor_interval, on_overrun=_report_overrun)
+    self._aps = {}
+    self._in_flight = set()
+    self._lock = threading.Lock()
+    self._dumped = time.time()
+
+  def Add(self, ap):
+    self._aps[ap.ap_name] = ap
+    self._scheduler.Add(ap.ap_name)
+
+  def Remove(self, ap_name):
+    self._scheduler.Remove(ap_name)
+    return self._aps.pop(ap_name, None)
+
+  def __contains__(self, ap_name):
+    return ap_name in self._aps
+
+  def __len__(self):
+    return len(self._aps)
+
+  def __iter__(self):
+    return iter(list(self._aps))
+
+  def _Collect(self, ap):
+    try:
+      _collect(self._dbclient, ap)
+    except Exception:  # pylint: disable=broad-except
+      # The pool would drop it silently.
+      logging.exception('Collection from %s failed', ap.ap_name)
+    finally:
+      with self._lock:
+        self._in_flight.discard(ap.ap_name)
+
+  def _Dispatch(self, ap_name, unused_tick):
+    if time.time() - self._dumped >= FLAGS.monitor_interval:
+      self._dumped = time.time()
+      _dump_metrics()
+    ap = self._aps.get(ap_name)
+    if ap is None:
+      return  # Removed since.
+    with self._lock:
+      if ap_name in self._in_flight:
+        return False
+      self._in_flight.add(ap_name)
+    self._pool.apply_async(self._Collect, (ap,))
+
+  def Run(self, stop=None):
+    """Collects from the APs until stop is set; see TickScheduler.Run."""
+    self._scheduler.Run(self._Dispatch, stop)
+
+  def Close(self):
+    self._pool.terminate()
+
+
+def _monitor_get(dbclient, aps):
+  """Monitor the APs with GetRequests, collecting from them concurrently.
+
+  Args:
+    dbclient: InfluxDB Client.
+    aps: (list) of AP Class objects.
+  """
+  monitor = _GetMonitor(dbclient)
+  for ap in aps:
+    monitor.Add(ap)
+  try:
+    monitor.Run()
+  finally:
+    monitor.Close()
+
+
+def _worker_path(path, worker_id):
+  """Returns the file a shard worker writes instead of path."""
+  root, ext = os.path.splitext(path)
+  return '%s.%s%s' % (root, worker_id, ext)
+
+
+def _entry_name(entry):
+  return entry.name
+
+
+def _shard_worker(worker_id, assignments, student_ssids):
+  """Monitors the APs of a shard, as assigned by a shard_lib.Supervisor.
+
+  Runs in a worker process of its own, with its own gNMI channels, DB client,
+  recording and metrics file. The process is forked by the supervisor, and
+  so inherits its parsed FLAGS.
+
+  Args:
+    worker_id: (str) Name of the worker.
+    assignments: (multiprocessing.Queue) Lists of the
+      inventory_lib.InventoryEntry the worker owns; None to exit.
+    student_ssids: (list) SSIDs of APs listing fewer than two.
+  """
+  if FLAGS.metrics_textfile:
+    _enable_metrics(_worker_path(FLAGS.metrics_textfile, worker_id),
+                    {'worker': worker_id})
+  monitor = _GetMonitor(_create_db())
+  stop = threading.Event()
+  runner = threading.Thread(target=monitor.Run, args=(stop,))
+  runner.daemon = True
+  runner.start()
+  try:
+    for entries in iter(assignments.get, None):
+      owned = set(entry.name for entry in entries)
+      for ap_name in [name for name in monitor if name not in owned]:
+        gnmi_lib.ReleaseStub(monitor.Remove(ap_name).stub)
+      new = [entry for entry in entries if entry.name not in monitor]
+      for ap in _create_apobjs(new, student_ssids):
+        configs_lib.GnmiSetUp(ap, _channel_options())
+        if FLAGS.gnmi_record:
+          ap.stub = record_lib.RecordingStub(
+              ap.stub, _recorder(_worker_path(FLAGS.gnmi_record, worker_id)))
+        monitor.Add(ap)
+      logging.info('%s monitors %d APs', worker_id, len(monitor))
+  finally:
+    stop.set()
+    monitor.Close()
+    _close_sinks()
 
 
 def main(unused_argv):
@@ -215,30 +859,51 @@ def main(unused_argv):
   # Change the following if you want. The first one will be 'open', second 'psk'
   student_ssids = ['student1_open', 'student1_psk']
   #### End customization ####
-  ap = _create_apobj(gnmi_target, ap_name, ap_mac, student_ssids)
+  if FLAGS.inventory:  # Or, list every AP in an inventory file.
+    try:
+      entries = inventory_lib.Load(FLAGS.inventory)
+    except inventory_lib.Error as e:
+      raise app.UsageError('--inventory: %s' % e)
+  else:
+    entries = [inventory_lib.InventoryEntry(ap_name, ap_mac, gnmi_target, ())]
+  if FLAGS.shards and FLAGS.mode.lower() == 'monitor':
+    if FLAGS.monitor_transport != 'get':
+      raise app.UsageError('--shards requires --monitor_transport=get')
+    # The workers set up their own channels; none may be open when they fork.
+    shard_lib.Supervisor(_shard_worker, entries, FLAGS.shards,
+                         key=_entry_name, args=(student_ssids,)).Run()
+    sys.exit()
+  aps = _create_apobjs(entries, student_ssids)
   if not FLAGS.dry_run:
-    configs_lib.GnmiSetUp(ap)  # Set up gNMI for each AP.
+    for ap in aps:
+      configs_lib.GnmiSetUp(ap, _channel_options())  # Set up gNMI for each AP.
+      if FLAGS.gnmi_record:
+        ap.stub = record_lib.RecordingStub(ap.stub,
+                                           _recorder(FLAGS.gnmi_record))
   if FLAGS.mode.lower() == 'provision':
-    configs_lib.Provision(ap)
+    for ap in aps:
+      configs_lib.Provision(ap)
   if FLAGS.mode.lower() == 'configure':
-    dbclient = _create_db()  # Create DB and dbclient.
-    # Applies configuration and returns the full JSON blob for DB write.
-    config_json = configs_lib.ConfigPhyMac(ap, student_ssids)
-    dbjson = _prep_json(config_json, 'config_intent', ap)  # Prep it for DB write.
-    _write_db(dbclient, 'ap_telemetry', dbjson)  # Write Config JSON to DB.
+    for ap in aps:
+      # Applies configuration and returns the full JSON blob for DB write.
+      config_json = configs_lib.ConfigPhyMac(ap, [ap.openssid, ap.pskssid])
+      # Write Config JSON to DB.
+      _write_db('ap_telemetry', 'config_intent', ap, config_json)
+      _cache_intent(ap, config_json)
+    _close_sinks()  # Write the intent queued before exiting.
   if FLAGS.mode.lower() == 'monitor':
+    if FLAGS.metrics_textfile and not FLAGS.shards:
+      _enable_metrics(FLAGS.metrics_textfile)
     dbclient = _create_db()  # Create DB and dbclient.
-    while True:
-      config_state = _get(ap, 'config_state')  # Get root of tree for AP.
-      dbjson = _prep_json(config_state, 'config_state', ap)  # Prep it for DB write.
-      _write_db(dbclient, 'ap_telemetry', dbjson)  # Write State JSON to DB.
-      _config_diff(dbclient, 'ap_telemetry', ap)  # Compare State Vs Intent.
-      # Get radio 0 channel utilization
-      cu_state = json.loads(_get(ap, 'r0-state'))['openconfig-access-points:total-channel-utilization']
-      logging.info('Channel Utilization: %s', cu_state)
-      dbjson = _prep_json(cu_state, 'channel_utilization', ap)  # Prep it for DB write.
-      _write_db(dbclient, 'ap_telemetry', dbjson)  # Write config State JSON to DB.
-      time.sleep(5)
+    try:
+      if FLAGS.monitor_transport == 'stream':
+        _monitor_streams(dbclient, aps)
+      elif FLAGS.monitor_transport == 'poll':
+        _monitor_poll(dbclient, aps)
+      else:
+        _monitor_get(dbclient, aps)
+    finally:
+      _close_sinks()
 
 if __name__ == '__main__':
   app.run(main)
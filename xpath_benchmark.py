@@ -0,0 +1,96 @@
+"""Micro-benchmark of the gnmi_lib xpath tokenizer against the regex parser.
+
+The regex based parser below is the one gnmi_lib and py_gnmicli used before
+the single-pass tokenizer; it is kept here only as the baseline to beat.
+'tokenize' rows time only the string handling, 'Path' rows also include
+building the gnmi_pb2.Path, as ParsePath(PathNames(xpath)) does.
+
+Usage:
+  python xpath_benchmark.py [iterations]
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import re
+import sys
+import timeit
+import gnmi_lib
+import gnmi_pb2
+
+_RE_PATH_COMPONENT = re.compile(r'''
+^
+(?P<pname>[^[]+)  # gNMI path name
+(\[(?P<key>\w+)   # gNMI path key
+=
+(?P<value>.*)    # gNMI path value
+\])?$
+''', re.VERBOSE)
+
+# Only paths the regex parser gets right are compared; a single key per name.
+XPATHS = {
+    'short': '/access-points/access-point[hostname=ap-01.example.net]/',
+    'radio': ('/access-points/access-point[hostname=ap-01.example.net]/radios/'
+              'radio[id=0]/state/total-channel-utilization'),
+    'long': '/'.join(['container%d/list%d[name=entry-%d]' % (i, i, i)
+                      for i in range(16)]),
+}
+
+
+def _regex_parse(xpath):
+  """Parses an xpath the way gnmi_lib did before the tokenizer."""
+  gnmi_elems = []
+  for word in xpath.strip().strip('/').split('/'):
+    word_search = _RE_PATH_COMPONENT.search(word)
+    if word_search.group('key') is not None:
+      gnmi_elems.append(gnmi_pb2.PathElem(name=word_search.group(
+          'pname'), key={word_search.group('key'): word_search.group('value')}))
+    else:
+      gnmi_elems.append(gnmi_pb2.PathElem(name=word, key={}))
+  return gnmi_pb2.Path(elem=gnmi_elems)
+
+
+def _regex_tokenize(xpath):
+  """Only the string handling of _regex_parse, without building protobufs."""
+  words = []
+  for word in xpath.strip().strip('/').split('/'):
+    word_search = _RE_PATH_COMPONENT.search(word)
+    if word_search.group('key') is not None:
+      words.append((word_search.group('pname'),
+                    {word_search.group('key'): word_search.group('value')}))
+    else:
+      words.append((word, {}))
+  return words
+
+
+def _tokenizer_parse(xpath):
+  return gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+
+
+def _tokenizer_tokenize(xpath):
+  return gnmi_lib._TokenizeNames(gnmi_lib.PathNames(xpath))
+
+
+def _compare(label, baseline, candidate, xpath, iterations):
+  before = timeit.timeit(lambda: baseline(xpath), number=iterations)
+  after = timeit.timeit(lambda: candidate(xpath), number=iterations)
+  print('%-16s %12.2f %12.2f %7.2fx' % (
+      label, before / iterations * 1e6, after / iterations * 1e6,
+      before / after))
+
+
+def main(argv):
+  iterations = int(argv[1]) if len(argv) > 1 else 20000
+  print('%-16s %12s %12s %8s' % ('xpath', 'regex us', 'tokenizer us',
+                                 'speedup'))
+  for name, xpath in sorted(XPATHS.items()):
+    assert _regex_parse(xpath) == _tokenizer_parse(xpath)
+    assert _regex_tokenize(xpath) == _tokenizer_tokenize(xpath)
+    _compare(name + ' tokenize', _regex_tokenize, _tokenizer_tokenize, xpath,
+             iterations)
+    _compare(name + ' Path', _regex_parse, _tokenizer_parse, xpath,
+             iterations)
+
+
+if __name__ == '__main__':
+  main(sys.argv)